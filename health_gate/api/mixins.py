@@ -0,0 +1,102 @@
+"""
+Выборочный вывод полей по параметрам запроса:
+?fields=id,title,kkal - в ответе только перечисленные поля, из БД загружаются только нужные им столбцы (defer)
+?expand=owner - вложенные объекты перечисленных связей выводятся целиком, остальные связи из ?fields= - как id
+Без ?fields= ответ не меняется.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def get_names(query_params, name):
+    """Список имен из параметра запроса вида ?name=a,b,c"""
+    return {value.strip() for value in query_params.get(name, '').split(',') if value.strip()}
+
+
+def is_nested(field):
+    return isinstance(field, serializers.BaseSerializer)
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Сериализатор с выборочным выводом полей
+    :param fields: имена выводимых полей, None - все поля
+    :param expand: имена вложенных сериализаторов, выводимых целиком, остальные вложенные выводятся как id
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        for name, field in list(self.fields.items()):
+            if name not in fields:
+                self.fields.pop(name)
+            elif is_nested(field) and name not in expand:
+                source = {} if field.source == name else {'source': field.source}
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, many=isinstance(field, serializers.ListSerializer), **source
+                )
+
+    def get_deferred_fields(self, keep=()):
+        """
+        Столбцы модели, не нужные выводимым полям
+        :param keep: поля модели, которые нужно загрузить в любом случае (например, поля сортировки пагинации)
+        """
+        needed = set(keep)
+        for field in self.fields.values():
+            if field.source == '*':
+                return []
+            needed.add(field.source.split('.')[0])
+        return [field.name for field in self.Meta.model._meta.concrete_fields
+                if not field.primary_key and field.name not in needed]
+
+
+class SparseFieldsViewMixin:
+    """
+    Параметры ?fields= и ?expand= для GET-запросов представлений с сериализатором SparseFieldsSerializerMixin.
+    Если у сериализатора есть setup_eager_loading(queryset, fields=None, expand=()), связанные объекты загружаются
+    им только для выводимых полей.
+    """
+
+    def get_sparse_fields(self):
+        """
+        :return: (fields, expand) из параметров запроса, fields = None, если выводятся все поля
+        """
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None, set()
+            serializer_class = self.get_serializer_class()
+            if self.request.method == 'GET' and issubclass(serializer_class, SparseFieldsSerializerMixin):
+                self._sparse_fields = self.parse_sparse_fields(serializer_class().fields)
+        return self._sparse_fields
+
+    def parse_sparse_fields(self, available):
+        fields = get_names(self.request.query_params, 'fields') or None
+        expand = get_names(self.request.query_params, 'expand')
+        unknown = (fields or set()) - set(available)
+        if unknown:
+            raise ValidationError({'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'})
+        unknown = expand - {name for name, field in available.items() if is_nested(field)}
+        if unknown:
+            raise ValidationError({'expand': f'Поля нельзя раскрыть: {", ".join(sorted(unknown))}'})
+        return fields, expand
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        fields, expand = self.get_sparse_fields()
+        if fields is None:
+            if hasattr(serializer_class, 'setup_eager_loading'):
+                queryset = serializer_class.setup_eager_loading(queryset)
+            return queryset
+
+        queryset = serializer_class.setup_eager_loading(queryset, fields, expand)
+        # поля сортировки курсорной пагинации нужны для построения курсора следующей страницы
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        deferred = serializer_class(fields=fields, expand=expand).get_deferred_fields(keep=ordering)
+        return queryset.defer(*deferred) if deferred else queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.update(fields=fields, expand=expand)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,75 @@
+"""
+Модуль кастомной пагинации.
+Курсорная пагинация выбирает страницу условием по полям сортировки (WHERE id > ...) вместо OFFSET,
+поэтому время ответа не зависит от номера страницы и размера таблицы.
+Поля сортировки должны быть проиндексированы, не меняться у существующих записей и не содержать NULL
+(значение поля попадает в курсор следующей страницы), поэтому рецепты, у которых date_created может быть пустым,
+сортируются по id - в порядке создания.
+"""
+from bisect import bisect_left, bisect_right
+
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Курсорная пагинация по id. Размер страницы задается параметром ?page_size=, но не больше max_page_size
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = ('id',)
+
+    def paginate_ids(self, ids, request, view=None):
+        """
+        Страница списка id, найденных без запроса к БД (индекс тегов - food/tag_index.py), с теми же курсорами
+        и тем же ответом, что и у страницы запроса к БД. Страница вырезается из списка по позиции курсора,
+        из БД загружаются только ее объекты.
+        :param ids: id по возрастанию
+        :return: id страницы
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = ('id',)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, position = self.cursor or (0, False, None)
+
+        # как в paginate_queryset: id после (перед - для курсора назад) позиции курсора, со смещением offset,
+        # и еще один id, чтобы определить, есть ли следующая страница
+        if reverse:
+            end = len(ids) if position is None else bisect_left(ids, int(position))
+            end = max(end - offset, 0)
+            results = ids[max(end - self.page_size - 1, 0):end][::-1]
+        else:
+            start = 0 if position is None else bisect_right(ids, int(position))
+            results = ids[start + offset:start + offset + self.page_size + 1]
+        page = results[:self.page_size]
+        following = str(results[-1]) if len(results) > len(page) else None
+
+        if reverse:
+            page.reverse()
+            self.has_next = position is not None or offset > 0
+            self.has_previous = following is not None
+            self.next_position, self.previous_position = position, following
+        else:
+            self.has_next = following is not None
+            self.has_previous = position is not None or offset > 0
+            self.next_position, self.previous_position = following, position
+        self.page = [{'id': pk} for pk in page]      # позиции ссылок на соседние страницы
+        return page
+
+
+class IngredientCursorPagination(CursorPagination):
+    """Ингредиенты - по уникальному названию"""
+    ordering = ('name',)
+
+
+class IdListPagination(pagination.PageNumberPagination):
+    """
+    Пагинация списка id, найденных без запроса к БД, по номеру страницы (рекомендации из кэша -
+    food/recommendations.py, порядок которых не совпадает с порядком id). Страница вырезается из списка,
+    из БД загружаются только ее объекты.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
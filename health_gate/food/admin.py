@@ -33,4 +33,6 @@ admin.site.register(Filter)
 admin.site.register(Comment)
 admin.site.register(Product)
 admin.site.register(CategoryProduct)
+admin.site.register(FeedState)
+admin.site.register(IngredientMatch)
 admin.site.register(Ingredient)
\ No newline at end of file
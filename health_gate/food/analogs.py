@@ -0,0 +1,93 @@
+"""
+Расчет аналогов продуктов (Product.analogs) - продуктов того же ингредиента в сопоставимых единицах измерения,
+ближайших по цене за единицу и пищевой ценности.
+Продукты группируются по (ингредиент, базовая единица), внутри группы сортируются по цене за единицу,
+кандидаты в аналоги берутся из окна соседних по цене продуктов, поэтому время расчета растет линейно
+с размером каталога. Для запуска - python manage.py build_analogs
+"""
+
+import math
+from collections import defaultdict
+from heapq import nsmallest
+
+from django.db import transaction
+
+from .feeds import BATCH_SIZE, batched
+from .models import Product
+from .parsing import BASE_UNITS, get_base_qty
+
+TOP_ANALOGS = 5         # кол-во аналогов продукта
+WINDOW = 50             # кол-во соседних по цене за единицу продуктов, сравниваемых с продуктом с каждой стороны
+
+NUTRITION_SCALE = (100, 100, 100, 900)      # максимальные значения белков, жиров, углеводов (г) и калорий на 100 г
+
+
+def get_distance(a, b):
+    """
+    Расстояние между продуктами: разница цен за единицу (в разах, логарифмическая шкала)
+    плюс нормированная разница пищевой ценности. Неизвестные значения пищевой ценности не учитываются.
+    :param a: кортеж (цена за единицу, белки, жиры, углеводы, калории)
+    """
+    distance = abs(math.log(a[0] / b[0]))
+    for x, y, scale in zip(a[1:], b[1:], NUTRITION_SCALE):
+        if x is not None and y is not None:
+            distance += abs(x - y) / scale
+    return distance
+
+
+def get_analogs(products, top=TOP_ANALOGS, window=WINDOW):
+    """
+    Аналоги продуктов без обращения к БД
+    :param products: кортежи (pk, ингредиент, единица, кол-во, цена, белки, жиры, углеводы, калории)
+    :return: словарь pk продукта -> список pk аналогов, от ближайшего к дальнему
+    """
+    groups = defaultdict(list)      # (ингредиент, базовая единица) -> [(цена за единицу, ..., pk)]
+    for pk, ingredient, unit, qty, price, *nutrition in products:
+        base_qty = get_base_qty(qty, unit)
+        if base_qty is not None and price and price > 0:
+            groups[ingredient, BASE_UNITS[unit][0]].append((float(price) / base_qty, *nutrition, pk))
+
+    analogs = {}
+    for group in groups.values():
+        group.sort(key=lambda product: (product[0], product[-1]))
+        for i, product in enumerate(group):
+            candidates = group[max(0, i - window):i] + group[i + 1:i + 1 + window]
+            nearest = nsmallest(top, candidates, key=lambda other: (get_distance(product, other), other[-1]))
+            if nearest:
+                analogs[product[-1]] = [candidate[-1] for candidate in nearest]
+    return analogs
+
+
+def build_analogs(top=TOP_ANALOGS, window=WINDOW, batch_size=BATCH_SIZE):
+    """
+    Пересчет аналогов всех продуктов в наличии. Связи записываются в БД одной транзакцией,
+    порядок связей продукта (id в промежуточной таблице) соответствует близости аналога.
+    :return: кол-во продуктов с аналогами и кол-во записанных связей
+    """
+    products = Product.objects.filter(available=True).order_by().values_list(
+        'pk', 'ingredient_id', 'unit', 'qty_per_item', 'price', 'proteins', 'fats', 'carbohydrates', 'calories'
+    )
+    analogs = get_analogs(products.iterator(), top, window)
+
+    through = Product.analogs.through
+    links = (
+        through(from_product_id=pk, to_product_id=analog)
+        for pk, product_analogs in analogs.items() for analog in product_analogs
+    )
+    count = 0
+    with transaction.atomic():
+        through.objects.all().delete()
+        for batch in batched(links, batch_size):
+            through.objects.bulk_create(batch)
+            count += len(batch)
+    return len(analogs), count
+
+
+def get_product_analogs(product):
+    """
+    Аналоги продукта в порядке близости
+    """
+    through = Product.analogs.through
+    pks = list(through.objects.filter(from_product=product).order_by('pk').values_list('to_product_id', flat=True))
+    products = Product.objects.in_bulk(pks)
+    return [products[pk] for pk in pks if pk in products]
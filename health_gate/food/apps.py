@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FoodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'food'
+
+    def ready(self):
+        from . import signals   # noqa: F401 подключение обработчиков сигналов
+        post_migrate.connect(create_search_index, sender=self)
+
+
+def create_search_index(sender, using, **kwargs):
+    """Индексы поиска продуктов (food/search.py) после migrate, в том числе для тестовой БД"""
+    from .search import ensure_search_index
+    ensure_search_index(using=using)
@@ -0,0 +1,321 @@
+"""
+Синхронизация каталога продуктов магазина с БД.
+Вместо удаления всех продуктов и повторной загрузки каталог обновляется по разнице с текущим состоянием БД:
+новые продукты создаются, измененные обновляются, отсутствующие в фиде помечаются как недоступные.
+"""
+
+import hashlib
+import math
+from contextlib import nullcontext
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+
+from .feeds import BATCH_SIZE, batched
+from .models import CategoryProduct, Ingredient, IngredientMatch, Product
+from .parsing import get_unit_price
+
+# поля продукта, которые заполняются из фида магазина и сравниваются при синхронизации
+SYNC_FIELDS = [
+    'ingredient',
+    'category',
+    'name',
+    'picture',
+    'proteins',
+    'fats',
+    'carbohydrates',
+    'calories',
+    'qty_per_item',
+    'unit',
+    'price',
+    'available',
+    'base_qty',         # вычисляются по кол-ву, мере и цене (Product.update_unit_price)
+    'unit_price',
+]
+
+# поля продукта, которые обновляются при быстром обновлении цен (PriceSync)
+PRICE_FIELDS = ['price', 'available']
+
+
+def normalize_value(field, value):
+    """
+    Приведение значения поля к виду, в котором оно хранится в БД (например, цена float -> Decimal с 2 знаками),
+    чтобы значения из фида и из БД можно было сравнивать напрямую
+    """
+    if value is None:
+        return None
+    value = field.to_python(value)
+    if isinstance(field, models.DecimalField):
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+class ImportContext:
+    """
+    Справочники ингредиентов и категорий продуктов, загруженные в память в начале импорта.
+    Внешние ключи продуктов определяются по словарям без запросов к БД на каждую строку фида,
+    недостающие категории создаются одним запросом на пачку строк.
+    """
+
+    def __init__(self, shop):
+        self.shop = shop
+        self.ingredients = dict(Ingredient.objects.order_by().values_list('name', 'pk'))          # название -> id
+        self.categories = dict(CategoryProduct.objects.order_by().values_list('name', 'pk'))     # название -> id
+
+    def ensure_categories(self, names):
+        """
+        Создание категорий продуктов, которых еще нет в БД
+        :param names: названия категорий (могут повторяться)
+        """
+        missing = [name for name in dict.fromkeys(names) if name not in self.categories]
+        if not missing:
+            return
+        CategoryProduct.objects.bulk_create([CategoryProduct(name=name, shop=self.shop) for name in missing])
+        # не все БД возвращают id созданных через bulk_create строк, поэтому получаем их отдельным запросом
+        self.categories.update(CategoryProduct.objects.filter(name__in=missing).order_by().values_list('name', 'pk'))
+
+    def build_product(self, record):
+        """
+        Создание продукта без сохранения в БД
+        :param record: данные продукта из фида, где ingredient и category - названия ингредиента и категории
+        """
+        fields = dict(record)
+        fields['ingredient_id'] = self.ingredients[fields.pop('ingredient')]
+        fields['category_id'] = self.categories[fields.pop('category')]
+        return Product(shop=self.shop, **fields)
+
+
+def get_ingredients_version(names):
+    """
+    Версия справочника ингредиентов - хэш отсортированных названий.
+    Меняется при любом добавлении, удалении или переименовании ингредиента, в том числе через bulk_create.
+    """
+    digest = hashlib.md5()
+    for name in sorted(names):
+        digest.update(name.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+class MatchCache:
+    """
+    Сохраненные в БД результаты поиска ингредиентов по названиям продуктов магазина.
+    Результаты, найденные для другой версии справочника ингредиентов, не используются и заменяются новыми,
+    поэтому нечеткий поиск выполняется только для новых названий и после изменения справочника.
+    """
+
+    def __init__(self, shop, ingredients, batch_size=BATCH_SIZE):
+        """
+        :param ingredients: словарь название ингредиента -> id (ImportContext.ingredients)
+        """
+        self.shop = shop
+        self.ingredients = ingredients
+        self.batch_size = batch_size
+        self.version = get_ingredients_version(ingredients)
+        # название продукта -> название ингредиента или None
+        self.known = dict(IngredientMatch.objects.filter(shop=shop, version=self.version).order_by().values_list(
+            'name', 'ingredient__name'
+        ))
+
+    def save(self, matches):
+        """
+        Сохранение новых результатов поиска, результаты для прошлых версий справочника удаляются
+        :param matches: словарь название продукта -> название ингредиента или None (CachedMatcher.new)
+        """
+        IngredientMatch.objects.filter(shop=self.shop).exclude(version=self.version).delete()
+        entries = (
+            IngredientMatch(shop=self.shop, name=name, version=self.version,
+                            ingredient_id=self.ingredients[match] if match is not None else None)
+            for name, match in matches.items()
+        )
+        for batch in batched(entries, self.batch_size):
+            IngredientMatch.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class ProductSync:
+    """
+    Инкрементальная синхронизация продуктов одного магазина по ключу (shop, shop_id).
+    Продукты сохраняют свои PK, поэтому связи с ними (аналоги, ингредиенты шагов рецептов) не теряются,
+    а повторный импорт записывает в БД только изменившиеся строки.
+    Использовать внутри transaction.atomic(), чтобы API не отдавал частично обновленный каталог:
+        sync = ProductSync('Ecomarket')
+        for products in ...:
+            sync.add(products)
+        sync.finish()
+    """
+
+    def __init__(self, shop, batch_size=BATCH_SIZE):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.fields = [Product._meta.get_field(name) for name in SYNC_FIELDS]
+        # текущее состояние каталога магазина в БД: shop_id -> (pk, значения синхронизируемых полей)
+        self.existing = {}
+        rows = Product.objects.filter(shop=shop).order_by().values_list(
+            'shop_id', 'pk', *[field.attname for field in self.fields]
+        )
+        for shop_id, pk, *values in rows.iterator():
+            self.existing[shop_id] = (pk, tuple(normalize_value(f, v) for f, v in zip(self.fields, values)))
+        self.seen = set()       # shop_id продуктов, найденных в фиде
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.disabled = 0
+
+    def get_values(self, product):
+        """Значения синхронизируемых полей несохраненного продукта"""
+        return tuple(normalize_value(field, getattr(product, field.attname)) for field in self.fields)
+
+    def add(self, products):
+        """
+        Синхронизация пачки продуктов из фида: новые продукты создаются, измененные обновляются
+        :param products: несохраненные экземпляры Product магазина self.shop
+        """
+        to_create = []
+        to_update = []
+        now = timezone.now()
+        for product in products:
+            if product.shop_id in self.seen:     # повтор продукта в фиде, учитываем первое вхождение
+                continue
+            self.seen.add(product.shop_id)
+            product.shop = self.shop
+            product.update_unit_price()     # bulk_create и bulk_update не вызывают Product.save
+
+            current = self.existing.get(product.shop_id)
+            if current is None:
+                to_create.append(product)
+                continue
+
+            pk, values = current
+            if values == self.get_values(product):
+                self.unchanged += 1
+                continue
+            product.pk = pk
+            product.updated = now       # bulk_update не обновляет поля с auto_now
+            to_update.append(product)
+
+        Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+        Product.objects.bulk_update(to_update, SYNC_FIELDS + ['updated'], batch_size=self.batch_size)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def finish(self):
+        """
+        Продукты магазина, которых не было в фиде, помечаются как недоступные (available=False)
+        """
+        available = SYNC_FIELDS.index('available')
+        missing = [
+            pk for shop_id, (pk, values) in self.existing.items()
+            if shop_id not in self.seen and values[available]
+        ]
+        now = timezone.now()
+        for pks in batched(missing, self.batch_size):
+            Product.objects.filter(pk__in=pks).update(available=False, updated=now)
+        self.disabled += len(missing)
+
+    def stats(self):
+        return {'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged,
+                'disabled': self.disabled}
+
+
+def parse_number(value, number_type):
+    """Число из значения фида или None, если значение не указано или некорректно"""
+    try:
+        number = number_type(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class PriceSync:
+    """
+    Быстрое обновление цен и наличия продуктов магазина, уже загруженных полным импортом.
+    Из фида используются только id товара, цена и остаток, продукты сопоставляются по ключу (shop, shop_id).
+    Новые товары фида пропускаются (создаются полным импортом), отсутствующие в фиде продукты не меняются.
+    id и цена разбираются только у товаров, которые есть в БД: строки непродуктовых товаров фида не разбираются,
+    а товары с пустой или некорректной ценой пропускаются и учитываются в счетчике invalid.
+    Цена за базовую единицу пересчитывается по сохраненному кол-ву продукта в базовых единицах.
+    """
+
+    def __init__(self, shop, batch_size=BATCH_SIZE):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.fields = [Product._meta.get_field(name) for name in PRICE_FIELDS]
+        # shop_id -> (pk, кол-во в базовых единицах, (цена, наличие))
+        self.existing = {
+            shop_id: (pk, base_qty, tuple(normalize_value(f, v) for f, v in zip(self.fields, values)))
+            for shop_id, pk, base_qty, *values in Product.objects.filter(shop=shop).order_by().values_list(
+                'shop_id', 'pk', 'base_qty', *PRICE_FIELDS
+            ).iterator()
+        }
+        self.updated = 0
+        self.unchanged = 0
+        self.unknown = 0        # товары фида, которых нет в БД
+        self.invalid = 0        # товары с некорректной ценой
+
+    def add(self, prices):
+        """
+        Обновление пачки цен
+        :param prices: кортежи (id товара, цена, наличие), id и цена - значения из фида (строки)
+        """
+        to_update = []
+        now = timezone.now()
+        for shop_id, price, *values in prices:
+            # повтор товара в фиде не обновляет продукт
+            current = self.existing.pop(parse_number(shop_id, int), None)
+            if current is None:
+                self.unknown += 1
+                continue
+            price = parse_number(price, float)
+            if price is None or price < 0:
+                self.invalid += 1
+                continue
+            pk, base_qty, old_values = current
+            values = tuple(normalize_value(f, v) for f, v in zip(self.fields, (price, *values)))
+            if values == old_values:
+                self.unchanged += 1
+                continue
+            product = Product(pk=pk, updated=now, **dict(zip(PRICE_FIELDS, values)))
+            product.unit_price = get_unit_price(product.price, base_qty)
+            to_update.append(product)
+
+        Product.objects.bulk_update(to_update, PRICE_FIELDS + ['unit_price', 'updated'], batch_size=self.batch_size)
+        self.updated += len(to_update)
+
+    def stats(self):
+        return {'updated': self.updated, 'unchanged': self.unchanged, 'unknown': self.unknown, 'invalid': self.invalid}
+
+
+def load_products(records, context, sync, batch_size=BATCH_SIZE, report=None):
+    """
+    Запись продуктов фида в БД пачками.
+    Для каждой записи создается ее категория, продукты создаются только для записей с найденным ингредиентом.
+    :param records: итерируемый объект с данными продуктов (результат parse_products парсера магазина)
+    :param context: справочники ингредиентов и категорий (ImportContext)
+    :param sync: синхронизатор каталога магазина (ProductSync)
+    :param report: отчет об импорте (ImportReport), получение записей - этап parse, запись в БД - write
+    """
+    if report is not None:
+        records = report.iterate('parse', records)
+    with report.stage('write') if report is not None else nullcontext():
+        for batch in batched(records, batch_size):
+            context.ensure_categories(record['category'] for record in batch)
+            sync.add([context.build_product(record) for record in batch if record['ingredient'] is not None])
+        sync.finish()
+    if report is not None:
+        report.sync = sync
+
+
+def load_prices(prices, sync, batch_size=BATCH_SIZE, report=None):
+    """
+    Обновление цен и наличия продуктов пачками
+    :param prices: итерируемый объект с кортежами (id товара, цена, наличие) (результат parse_prices парсера магазина)
+    :param sync: синхронизатор цен магазина (PriceSync)
+    :param report: отчет об импорте (ImportReport), получение цен - этап parse, запись в БД - write
+    """
+    if report is not None:
+        prices = report.iterate('parse', prices)
+    with report.stage('write') if report is not None else nullcontext():
+        for batch in batched(prices, batch_size):
+            sync.add(batch)
+    if report is not None:
+        report.sync = sync
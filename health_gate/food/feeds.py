@@ -0,0 +1,122 @@
+"""
+Потоковое чтение фидов магазинов.
+Фид читается из ответа по частям и обрабатывается пачками фиксированного размера, поэтому в памяти
+одновременно находится только текущая часть ответа и текущая пачка строк, независимо от размера фида.
+XML-фиды разбираются по одному элементу (iterparse): разобранные элементы удаляются из дерева документа.
+"""
+
+import codecs
+import csv
+from itertools import chain, islice
+from xml.etree.ElementTree import iterparse
+
+BATCH_SIZE = 500            # кол-во строк фида, обрабатываемых и записываемых в БД за один раз
+CHUNK_SIZE = 64 * 1024      # размер части ответа (в байтах), читаемой из сети за один раз
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """
+    Построчное декодирование частей потока байтов.
+    Части декодируются инкрементально, поэтому многобайтовые символы на границе частей не ломаются.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(response, fieldnames, delimiter=';', encoding='utf-8', chunk_size=CHUNK_SIZE, report=None):
+    """
+    Построчное чтение CSV из потокового ответа requests (requests.get(url, stream=True)).
+    :param response: потоковый ответ requests
+    :param fieldnames: имена колонок CSV (в фидах их нет)
+    :param report: отчет об импорте (ImportReport), чтение ответа - этап fetch, декодирование строк - decode
+    :return: итератор словарей строк фида
+    """
+    chunks = response.iter_content(chunk_size)
+    if report is not None:
+        chunks = report.iterate('fetch', chunks)
+    rows = csv.DictReader(iter_lines(chunks, encoding), delimiter=delimiter, fieldnames=fieldnames)
+    if report is not None:
+        rows = report.iterate('decode', rows)
+    return rows
+
+
+def element_to_dict(element):
+    """
+    Преобразование XML-элемента в словарь в формате xmltodict: атрибуты - ключи с '@', текст - '#text',
+    повторяющиеся дочерние элементы - список. Элемент без атрибутов и дочерних элементов - его текст или None.
+    """
+    item = {f'@{name}': value for name, value in element.attrib.items()}
+    for child in element:
+        value = element_to_dict(child)
+        if child.tag not in item:
+            item[child.tag] = value
+        elif isinstance(item[child.tag], list):
+            item[child.tag].append(value)
+        else:
+            item[child.tag] = [item[child.tag], value]
+    text = element.text.strip() if element.text else ''
+    if not item:
+        return text or None
+    if text:
+        item['#text'] = text
+    return item
+
+
+def iter_xml_elements(source, tags):
+    """
+    Потоковый разбор XML: элементы с заданными тегами возвращаются по одному и сразу удаляются из дерева,
+    поэтому в памяти находится только текущий элемент, независимо от размера фида.
+    :param source: путь к файлу или файловый объект (например, response.raw потокового ответа requests)
+    :param tags: теги возвращаемых элементов
+    :return: генератор пар (тег, словарь элемента в формате xmltodict)
+    """
+    parents = []        # открытые элементы от корня документа до текущего
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in tags:
+            yield element.tag, element_to_dict(element)
+            if parents:
+                parents[-1].remove(element)
+
+
+def read_xml_catalog(source, category_tag='category', offer_tag='offer', report=None):
+    """
+    Потоковое чтение каталога XML-фида: категории (в фидах они идут перед товарами) читаются сразу,
+    товары - по мере перебора.
+    :param report: отчет об импорте (ImportReport), чтение источника - этап fetch, разбор XML - decode
+    :return: список категорий и итератор товаров (словари в формате xmltodict)
+    """
+    if report is not None:
+        source = report.reader('fetch', source)
+    elements = iter_xml_elements(source, {category_tag, offer_tag})
+    if report is not None:
+        elements = report.iterate('decode', elements)
+    categories = []
+    for tag, item in elements:
+        if tag == offer_tag:
+            offers = (item for tag, item in elements if tag == offer_tag)
+            return categories, chain([item], offers)
+        categories.append(item)
+    return categories, iter(())
+
+
+def batched(iterable, size=BATCH_SIZE):
+    """
+    Разбивает итерируемый объект на списки длиной size (последний список может быть короче)
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,129 @@
+"""
+Замер производительности импорта каталога на синтетических фидах: скорость, кол-во SQL-запросов на товар,
+пиковая память процесса и время этапов импорта (см. food/report.py), в том числе поиска ингредиентов.
+Импорт проходит по тому же конвейеру, что и import_catalog (разбор фида -> catalog.load_products), в текущей БД
+внутри транзакции, которая откатывается после замера, поэтому данные в БД не меняются.
+Продукты замера записываются под магазином с префиксом PREFIX, поэтому не совпадают с уже загруженными продуктами
+магазина и все создаются заново, как при первом импорте.
+Для запуска - python manage.py bench_import --shop bringstone --offers 1000 10000 --output bench.json
+"""
+
+import datetime
+import json
+import os
+import platform
+import resource
+import tempfile
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...catalog import ImportContext, ProductSync, load_products
+from ...matcher import CachedMatcher, IngredientMatcher
+from ...models import Ingredient
+from ...parallel import parse_parallel
+from ...report import ImportReport
+from ...shops import FEEDS
+from ...synthetic import PREFIX, ecomarket_feed, ingredient_names, yml_feed
+from . import ecomarket
+
+# генераторы синтетических фидов магазинов
+GENERATORS = {
+    'ecomarket': ecomarket_feed,
+    'bringstone': yml_feed,
+}
+
+
+def get_peak_rss():
+    """Пиковый объем памяти процесса (RSS) в МБ с момента запуска"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_import(feed, path, ingredients, workers=None):
+    """
+    Импорт фида в транзакции, которая откатывается после замера
+    :param ingredients: названия синтетических ингредиентов
+    :param workers: кол-во процессов для разбора строк фида (только для фида EcoMarket)
+    :return: словарь с результатами замера
+    """
+    shop = f'{PREFIX}{feed.shop}'
+    report = ImportReport(shop)
+    with transaction.atomic():
+        Ingredient.objects.bulk_create([Ingredient(name=name) for name in ingredients], ignore_conflicts=True)
+        with report.track_queries():
+            context = ImportContext(shop)
+            sync = ProductSync(shop)
+            if workers is not None and workers > 1:
+                records = parse_parallel(ecomarket.parse_products, feed.read_rows(path, report),
+                                         list(context.ingredients), {}, workers, report=report)
+            else:
+                with report.stage('match'):
+                    # как в импорте: повторяющиеся названия ищутся один раз (кэш без сохраненных результатов)
+                    matcher = CachedMatcher(IngredientMatcher(context.ingredients, cutoff=0.8))
+                records = feed.parse(path, matcher, report)
+            load_products(records, context, sync, report=report)
+        transaction.set_rollback(True)
+
+    result = report.as_dict()
+    return {
+        'seconds': result['seconds'],
+        'products': sync.created,
+        'queries': sum(report.queries.values()),
+        'matcher_seconds': result['stages'].get('match', {}).get('seconds'),     # None - поиск в процессах
+        'peak_rss_mb': round(get_peak_rss(), 1),
+        'stages': result['stages'],
+        'counters': result['counters'],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Замер производительности импорта каталога на синтетических фидах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', choices=sorted(GENERATORS), default='ecomarket', help='формат фида')
+        parser.add_argument('--offers', type=int, nargs='+', default=[1000, 10000],
+                            help='размеры фидов (кол-во товаров), замеры идут по возрастанию размера')
+        parser.add_argument('--ingredients', type=int, default=3000, help='кол-во ингредиентов в справочнике')
+        parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора данных')
+        parser.add_argument('--output', help='файл для сохранения результатов в формате JSON')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='кол-во процессов для разбора строк фида (только --shop ecomarket)')
+
+    def handle(self, *args, **options):
+        if options['workers'] and options['shop'] != 'ecomarket':
+            raise CommandError('Параллельный разбор поддерживается только для фида EcoMarket')
+        ingredients = ingredient_names(options['ingredients'], seed=options['seed'])
+        runs = []
+        with tempfile.TemporaryDirectory() as directory:
+            for offers in sorted(options['offers']):
+                feed = FEEDS[options['shop']]()
+                path = os.path.join(directory, f'{feed.name}_{offers}.{feed.extension}')
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.writelines(GENERATORS[options['shop']](offers, seed=options['seed']))
+
+                run = {'offers': offers, **run_import(feed, path, ingredients, options['workers'])}
+                run['offers_per_second'] = round(offers / run['seconds'], 1)
+                run['queries_per_offer'] = round(run['queries'] / offers, 4)
+                runs.append(run)
+                self.stdout.write(
+                    f'{offers} товаров: {run["offers_per_second"]} товаров/с, {run["products"]} продуктов, '
+                    f'{run["queries"]} запросов ({run["queries_per_offer"]} на товар), '
+                    f'поиск ингредиентов {run["matcher_seconds"]} с, пиковая память {run["peak_rss_mb"]} МБ'
+                )
+
+        if options['output']:
+            report = {
+                'shop': options['shop'],
+                'ingredients': options['ingredients'],
+                'seed': options['seed'],
+                'workers': options['workers'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'runs': runs,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'результаты сохранены в {options["output"]}')
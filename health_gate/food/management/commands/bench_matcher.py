@@ -0,0 +1,49 @@
+"""
+Замер скорости поиска ингредиентов по названиям продуктов: индекс IngredientMatcher против полного перебора difflib.
+Данные синтетические, БД не используется.
+Для запуска - python manage.py bench_matcher --ingredients 5000 --products 2000
+"""
+
+import difflib as dl
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...matcher import IngredientMatcher
+from ...synthetic import ingredient_names, product_names
+from .ecomarket import get_clear_product
+
+
+class Command(BaseCommand):
+    help = 'Сравнение скорости IngredientMatcher и difflib.get_close_matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=5000, help='кол-во ингредиентов в справочнике')
+        parser.add_argument('--products', type=int, default=2000, help='кол-во названий продуктов')
+        parser.add_argument('--cutoff', type=float, default=0.8, help='порог сходства')
+
+    def handle(self, *args, **options):
+        cutoff = options['cutoff']
+        ingredients = ingredient_names(options['ingredients'])
+        words = [get_clear_product(name) for name in product_names(options['products'])]
+
+        started = time.perf_counter()
+        matcher = IngredientMatcher(ingredients, cutoff=cutoff)
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = [dl.get_close_matches(word, ingredients, cutoff=cutoff)[:1] for word in words]
+        difflib_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = [matcher.get_close_matches(word, n=1) for word in words]
+        matcher_time = time.perf_counter() - started
+
+        self.stdout.write(f'ингредиентов: {len(ingredients)}, продуктов: {len(words)}, cutoff: {cutoff}')
+        self.stdout.write(f'построение индекса: {build_time:.3f} с')
+        self.stdout.write(f'difflib: {len(words) / difflib_time:.1f} поисков/с')
+        self.stdout.write(f'IngredientMatcher: {len(words) / matcher_time:.1f} поисков/с '
+                          f'(x{difflib_time / matcher_time:.1f})')
+        if result != expected:
+            mismatches = sum(a != b for a, b in zip(result, expected))
+            self.stderr.write(f'результаты отличаются от difflib: {mismatches}')
@@ -0,0 +1,34 @@
+"""
+Замер скорости разбора кол-ва и меры товара из названий продуктов (food.parsing).
+Данные синтетические, БД не используется.
+Для запуска - python manage.py bench_parser --names 100000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...parsing import parse_quantities
+from ...synthetic import product_names
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости parse_quantities на синтетических названиях продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=100000, help='кол-во названий продуктов')
+        parser.add_argument('--repeat', type=int, default=5, help='кол-во повторов замера')
+
+    def handle(self, *args, **options):
+        names = product_names(options['names'])
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            result = parse_quantities(names)
+            timings.append(time.perf_counter() - started)
+
+        best = min(timings)
+        parsed = sum(qty is not None for qty in result)
+        self.stdout.write(f'названий: {len(names)}, с кол-вом: {parsed}')
+        self.stdout.write(f'parse_quantities: {len(names) / best:.0f} названий/с (лучший из {len(timings)} замеров)')
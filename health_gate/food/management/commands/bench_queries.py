@@ -0,0 +1,191 @@
+"""
+Замер горячих запросов к БД на синтетических данных: время выполнения и план запроса (EXPLAIN).
+Таблицы заполняются в текущей БД внутри транзакции, которая откатывается после замера, поэтому данные в БД
+не меняются. Магазины и телефоны пользователей замера начинаются с PREFIX и не совпадают с уже загруженными
+каталогами и пользователями. Планы сохраняются в отчет, чтобы при росте данных и изменении индексов сравнивать
+их с прошлыми.
+Для запуска - python manage.py bench_queries --products 100000 --recipes 20000 --output queries.json
+Проверка, что ни один запрос не читает таблицу целиком (например, в CI) - python manage.py bench_queries --fail-on-scan
+"""
+
+import datetime
+import json
+import platform
+import random
+import re
+import statistics
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from order.models import MealPlanRecipe, Order
+from ...feeds import BATCH_SIZE
+from ...models import CategoryProduct, Ingredient, Product, Recipe
+from ...synthetic import CATEGORIES, PREFIX, UNITS, ingredient_names, product_names
+
+User = get_user_model()
+
+SHOPS = [f'{PREFIX}Ecomarket', f'{PREFIX}Bringstone']
+MAX_USERS = 10 ** 6         # телефон пользователя замера - PREFIX и номер из 6 цифр (не длиннее 12 символов)
+
+
+def seed(sizes, seed=0):
+    """
+    Заполнение таблиц синтетическими данными
+    :param sizes: кол-во пользователей, рецептов, продуктов, заказов и рецептов планов питания
+    :return: значения для параметров горячих запросов
+    """
+    rnd = random.Random(seed)
+    phones = [f'{PREFIX}{number:06}' for number in range(sizes['users'])]
+    User.objects.bulk_create([User(phone_number=phone, password='!') for phone in phones], batch_size=BATCH_SIZE)
+    users = list(User.objects.filter(phone_number__in=phones).order_by('pk'))
+
+    names = ingredient_names(seed=seed)
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ingredients = list(Ingredient.objects.filter(name__in=names).values_list('pk', flat=True))
+    CategoryProduct.objects.bulk_create([CategoryProduct(name=name, shop=rnd.choice(SHOPS)) for name in CATEGORIES])
+    categories = list(CategoryProduct.objects.filter(shop__in=SHOPS).values_list('pk', flat=True))
+
+    products = []
+    for number, name in enumerate(product_names(sizes['products'], seed=seed)):
+        unit, (low, high) = rnd.choice(UNITS)
+        product = Product(ingredient_id=rnd.choice(ingredients), category_id=rnd.choice(categories),
+                          shop=SHOPS[number % len(SHOPS)], shop_id=number, name=name,
+                          qty_per_item=rnd.randint(low, high), unit=unit, price=rnd.randint(50, 2000),
+                          available=rnd.random() > 0.1)
+        product.update_unit_price()
+        products.append(product)
+    Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+
+    Recipe.objects.bulk_create([
+        Recipe(owner=rnd.choice(users), title=f'Рецепт {number}', level='EASY', cooking_time='30 мин',
+               description='', is_active=rnd.random() > 0.3)
+        for number in range(sizes['recipes'])
+    ], batch_size=BATCH_SIZE)
+    recipes = list(Recipe.objects.filter(owner__in=users).values_list('pk', flat=True))
+
+    Order.objects.bulk_create([
+        Order(customer=rnd.choice(users), pay_method='ONLINE') for _ in range(sizes['orders'])
+    ], batch_size=BATCH_SIZE)
+    today = datetime.date.today()
+    MealPlanRecipe.objects.bulk_create([
+        MealPlanRecipe(owner=rnd.choice(users), recipe_id=rnd.choice(recipes), qty=1,
+                       date=today + datetime.timedelta(days=rnd.randint(-180, 180)))
+        for _ in range(sizes['plans'])
+    ], batch_size=BATCH_SIZE)
+
+    with connection.cursor() as cursor:     # статистика для планировщика запросов
+        cursor.execute('ANALYZE')
+
+    product = products[len(products) // 2]
+    return {
+        'product': product,
+        'user': users[len(users) // 2],
+        'recipe': f'Рецепт {sizes["recipes"] // 2}',
+        'category': CATEGORIES[0],
+        'date': today,
+    }
+
+
+def get_queries(sample):
+    """
+    Горячие запросы API и импорта каталогов
+    :return: словарь имя запроса -> QuerySet
+    """
+    product, user = sample['product'], sample['user']
+    return {
+        # импорт каталогов (catalog.ProductSync, ImportContext)
+        'product_by_shop_item': Product.objects.filter(shop=product.shop, shop_id=product.shop_id),
+        'category_by_name': CategoryProduct.objects.filter(name=sample['category']),
+        # SlugRelatedField(slug_field='name') сериализаторов, самый дешевый продукт ингредиента
+        'product_by_name': Product.objects.filter(name=product.name),
+        'cheapest_product': Product.objects.cheapest(product.ingredient_id)[:1],
+        # создание заказа, списки и страницы рецептов
+        'recipe_by_title': Recipe.objects.filter(title=sample['recipe'])[:1],
+        'active_recipes': Recipe.objects.filter(is_active=True).order_by('-date_created')[:20],
+        'recipe_page': Recipe.objects.order_by('id')[:21],
+        # план питания и заказы пользователя
+        'meal_plan': MealPlanRecipe.objects.filter(owner=user, date__gte=sample['date']).order_by('date'),
+        'customer_orders': Order.objects.filter(customer=user).order_by('-updated_at')[:20],
+    }
+
+
+def is_full_scan(plan, table, limited=False):
+    """
+    План запроса читает таблицу целиком
+    :param limited: запрос с LIMIT - обход таблицы в порядке сортировки (по индексу или по id) останавливается
+    на первых строках и не считается чтением всей таблицы, если строки не сортируются отдельно (TEMP B-TREE)
+    """
+    if connection.vendor == 'postgresql':
+        return re.search(rf'Seq Scan on "?{re.escape(table)}"?\b', plan) is not None
+    if connection.vendor == 'sqlite':
+        scan = re.search(rf'\bSCAN "?{re.escape(table)}"?\b', plan)
+        if scan is None or not limited:
+            return scan is not None
+        return re.search(rf'\bSCAN "?{re.escape(table)}"?\b(?! USING)', plan) is not None and 'TEMP B-TREE' in plan
+    return False
+
+
+def measure(queryset, repeat):
+    """Медианное время выполнения запроса, с, и кол-во строк результата"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(queryset.all())
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), rows
+
+
+class Command(BaseCommand):
+    help = 'Замер горячих запросов к БД: время выполнения и планы запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='кол-во пользователей')
+        parser.add_argument('--recipes', type=int, default=10000, help='кол-во рецептов')
+        parser.add_argument('--products', type=int, default=50000, help='кол-во продуктов')
+        parser.add_argument('--orders', type=int, default=20000, help='кол-во заказов')
+        parser.add_argument('--plans', type=int, default=20000, help='кол-во рецептов планов питания')
+        parser.add_argument('--repeat', type=int, default=20, help='кол-во повторов каждого запроса')
+        parser.add_argument('--seed', type=int, default=0, help='начальное значение генератора данных')
+        parser.add_argument('--output', help='файл для сохранения результатов в формате JSON')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='завершиться с ошибкой, если план запроса читает таблицу целиком')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in ('users', 'recipes', 'products', 'orders', 'plans')}
+        if not 0 < sizes['users'] <= MAX_USERS:
+            raise CommandError(f'Кол-во пользователей должно быть от 1 до {MAX_USERS}')
+        results = []
+        with transaction.atomic():
+            sample = seed(sizes, seed=options['seed'])
+            for name, queryset in get_queries(sample).items():
+                plan = queryset.explain()
+                seconds, rows = measure(queryset, options['repeat'])
+                full_scan = is_full_scan(plan, queryset.model._meta.db_table,
+                                         limited=queryset.query.high_mark is not None)
+                results.append({'name': name, 'seconds': round(seconds, 6), 'rows': rows, 'full_scan': full_scan,
+                                'plan': plan})
+                self.stdout.write(f'{name}: {seconds * 1000:.3f} мс, строк {rows}'
+                                  + (', ЧТЕНИЕ ВСЕЙ ТАБЛИЦЫ' if full_scan else ''))
+            transaction.set_rollback(True)
+
+        if options['output']:
+            report = {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'sizes': sizes,
+                'seed': options['seed'],
+                'queries': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'результаты сохранены в {options["output"]}')
+
+        scans = [result['name'] for result in results if result['full_scan']]
+        if options['fail_on_scan'] and scans:
+            raise CommandError(f'Запросы читают таблицу целиком: {", ".join(scans)}')
@@ -0,0 +1,82 @@
+"""
+Замер скорости и пиковой памяти разбора XML-фида: потоковый iterparse против xmltodict.parse + JSON.
+Фид синтетический в формате Bringstone, БД не используется.
+Для запуска - python manage.py bench_xml --offers 100000
+"""
+
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import xmltodict
+from django.core.management.base import BaseCommand
+
+from ...feeds import read_xml_catalog
+from ...synthetic import yml_feed
+
+
+def parse_document(path):
+    """Прежний способ: весь фид в памяти, затем круговое преобразование через JSON"""
+    with open(path, 'rb') as file:
+        data = xmltodict.parse(file.read())
+    data = json.loads(json.dumps(data, ensure_ascii=False))
+    shop = data['yml_catalog']['shop']
+    return shop['categories']['category'], shop['offers']['offer']
+
+
+def parse_stream(path):
+    """Потоковый разбор: категории, затем товары по одному"""
+    with open(path, 'rb') as file:
+        categories, offers = read_xml_catalog(file)
+        yield categories
+        yield from offers
+
+
+def measure(function):
+    """
+    Время выполнения и пиковая память функции
+    :return: результат функции, секунды, пиковая память в МБ
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = 'Сравнение потокового разбора XML-фида и xmltodict.parse'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=100000, help='кол-во товаров в фиде')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.xml')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.writelines(yml_feed(options['offers']))
+            size = os.path.getsize(path) / 2 ** 20
+
+            def document():
+                categories, offers = parse_document(path)
+                return [offer['@id'] for offer in offers]
+
+            def stream():
+                items = parse_stream(path)
+                next(items)                     # категории
+                return [offer['@id'] for offer in items]
+
+            expected, document_time, document_peak = measure(document)
+            result, stream_time, stream_peak = measure(stream)
+
+        self.stdout.write(f'товаров: {options["offers"]}, размер фида: {size:.1f} МБ')
+        self.stdout.write(f'xmltodict + JSON: {document_time:.2f} с, пиковая память {document_peak:.1f} МБ')
+        self.stdout.write(f'iterparse: {stream_time:.2f} с, пиковая память {stream_peak:.1f} МБ '
+                          f'(x{document_time / stream_time:.1f} быстрее, '
+                          f'x{document_peak / stream_peak:.1f} меньше памяти)')
+        if result != expected:
+            self.stderr.write('результаты разбора отличаются')
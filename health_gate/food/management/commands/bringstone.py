@@ -1,95 +1,165 @@
 """
-Для запуска скрипта - python manage.py products
+Парсер данных по продуктам из Bringstone
+Для запуска скрипта - python manage.py bringstone
+Для обновления только цен и наличия продуктов - python manage.py bringstone --prices-only
 """
 
-from ...models import CategoryProduct, Product
+from ...catalog import ImportContext, MatchCache, PriceSync, ProductSync, load_prices, load_products
+from ...feeds import read_xml_catalog
+from ...matcher import CachedMatcher, IngredientMatcher
+from ...parsing import parse_quantity
+from ...report import ACCEPTED, ROWS, UNMATCHED, UNPARSABLE_QUANTITY, ImportReport
+from .ecomarket import get_organic, get_calories, match_product
 from django.core.management.base import BaseCommand
-import xmltodict
-import json
+from django.db import transaction
 import requests
-import re
 
 
-def get_qty_and_measure(name):
+SHOP = 'Bringstone'
+FEED_URL = "https://bringston.ru/include/KitchenFid.xml"
+
+
+def get_param(product, index):
     """
-    Метод нахождения меры веса или объема товара и его кол-во в имени товара с помощью регулярных выражений
+    Значение параметра товара по его порядковому номеру (0 - калории, 1 - жиры, 2 - белки, 3 - углеводы)
     """
-    qty_for_db = {'qty': 1.0, 'measure': 'кг.'}     # словарь с данными по кол-ву товара и его мере веса/объема
-    pattern = r"[0-9]*[.,]?[0-9]{1,3}[ ]?(?:кг|гр|г|ГР|л|мл|шт|штук)\b"
-    if len(re.findall(pattern, name)) == 1:      # если кол-во найденых мер веса и объема в имени одного товара равно 1
-        qty_product = re.search(pattern, name)   # находим кол-во товара и его меру веса/объема
-
-        qty_pattern = r"[0-9]*[.,]?[0-9]{1,3}"                  # паттерн для поиска количества товара
-        qty = re.search(qty_pattern, qty_product[0])            # объект match найденого кол-ва продукта
-
-        measure_pattern = r"(?:кг|гр|г|ГР|л|мл|шт|штук)\b"      # паттерн для поиска меры веса/объема
-        measure = re.search(measure_pattern, qty_product[0])    # объект match найденой меры веса/объема
-
-        if qty[0][0] == '.':        # если в начале найденого кол-ва товара точка, убираем её
-            qty = qty[0][1:]        # кол-во товара равно найденому значению без точки в начале строки
-        else:
-            qty = qty[0]
-        if ',' in qty:
-            qty = float(re.sub(r',', r'.', qty))
-        elif '.' in qty:
-            qty = float(qty)
-        qty_for_db['qty'] = float(qty)
-        qty_for_db['measure'] = measure[0]
-        return qty_for_db
-    elif "1 десяток" in name:
-        qty_for_db['qty'] = 10.0
-        qty_for_db['measure'] = 'шт'
-        return qty_for_db
-    elif "вес" in name:
-        return qty_for_db
-
-
-def get_products():
+    params = product.get('param') or []
+    if isinstance(params, dict):        # у товара один параметр
+        params = [params]
+    if index < len(params):
+        return params[index].get('#text')
+
+
+def get_available(product):
     """
-    Получение категорий продуктов и продуктов "Bringstone"
-    Заносит в БД данные по магазинам и продуктам
+    Наличие товара (атрибут available товара YML-фида, если он не указан - товар в наличии)
     """
-    r = requests.get("https://bringston.ru/include/KitchenFid.xml")
-    if r.status_code == 200:
-        data = xmltodict.parse(r.content)                   # парсинг xml-данных в dict формат
-        json_data = json.dumps(data, ensure_ascii=False)
-        work_data = json.loads(json_data)
-        # проходим циклом по всем категориям товаров
-        for category in work_data['yml_catalog']['shop']['categories']['category']:
-            if not CategoryProduct.objects.filter(id=int(category['@id'])).exists():      # если категории еще нет в БД
-                category = CategoryProduct(id=int(category['@id']), name=category['#text'])  # создаем категорию
-                category.save()                                                              # сохраняем категорию в БД
-
-        for product in work_data['yml_catalog']['shop']['offers']['offer']:
-            print(product['name'])
-            print(get_qty_and_measure(product['name']))
-            '''product_db = Product(
-                category=CategoryProduct.objects.get(id=product['categoryId']),
-                name=product['name'],
-                picture=product['picture'],
-                protein=product['param'][2]['#text'],
-                fat=product['param'][1]['#text'],
-                carbohydrates=product['param'][3]['#text'],
-                calories=product['param'][0]['#text'],
-                qty_per_item=product['valuecount'],
-                price=product['price'],
-                unit=product['value']['name']
-            )
-            product_db.save()'''
-
-
-def clear_data():
+    return product.get('@available', 'true') != 'false'
+
+
+def get_record(product, match, quantity, categories):
     """
-    Очистить все записи в таблице Product
+    Данные продукта для сохранения в БД (см. catalog.load_products)
+    :param match: найденный ингредиент продукта
+    :param quantity: кол-во товара и его мера (результат parse_quantity)
+    :param categories: словарь id категории в фиде -> название категории
     """
-    Product.objects.all().delete()
+    return {
+        'ingredient': match,
+        'category': categories[product['categoryId']],
+        'shop_id': int(product['@id']),
+        'name': product['name'],
+        'picture': product.get('picture'),
+        'proteins': get_organic(get_param(product, 2)),
+        'fats': get_organic(get_param(product, 1)),
+        'carbohydrates': get_organic(get_param(product, 3)),
+        'calories': get_calories(get_param(product, 0)),
+        'qty_per_item': quantity['qty'],
+        'unit': quantity['measure'],
+        'price': float(product['price']),
+        'available': get_available(product),
+    }
+
+
+def parse_products(categories, offers, matcher, report=None):
+    """
+    Разбор товаров фида без обращения к БД
+    :param categories: словарь id категории в фиде -> название категории
+    :param offers: итерируемый объект с товарами фида
+    :param matcher: индекс названий ингредиентов (IngredientMatcher)
+    :param report: отчет об импорте (ImportReport) для счетчиков строк и времени поиска ингредиентов
+    :return: генератор данных продуктов (для категорий без продуктов ingredient = None)
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    for name in categories.values():        # категории создаются все, даже если в них не будет продуктов
+        yield {'category': name, 'ingredient': None}
+
+    for product in offers:
+        report.count(ROWS)
+        quantity = parse_quantity(product['name'])
+        if quantity is None:            # в имени товара нет пограммовки
+            report.count(UNPARSABLE_QUANTITY)
+            continue
+        with report.stage('match'):
+            match = match_product(product['name'], matcher)
+        if match is None:
+            report.count(UNMATCHED)
+            continue
+        report.count(ACCEPTED)
+        yield get_record(product, match, quantity, categories)
+
+
+def parse_prices(offers):
+    """
+    Разбор цен и наличия товаров фида без разбора остальных данных товаров
+    :return: генератор кортежей (id товара, цена, наличие), id и цена разбираются в PriceSync
+    """
+    for product in offers:
+        yield product.get('@id'), product.get('price'), get_available(product)
+
+
+def get_prices(sync, report=None):
+    """
+    Быстрое обновление цен и наличия продуктов "Bringstone", уже загруженных в БД
+    :param sync: синхронизатор цен магазина (PriceSync)
+    :param report: отчет об импорте (ImportReport)
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    with report.stage('fetch'):
+        r = requests.get(FEED_URL, stream=True)
+    with r:
+        if r.status_code == 200:
+            r.raw.decode_content = True                     # распаковка сжатого ответа
+            categories, offers = read_xml_catalog(r.raw, report=report)
+            load_prices(parse_prices(offers), sync, report=report)
+
+
+def get_products(sync, context, report=None):
+    """
+    Получение категорий продуктов и продуктов "Bringstone"
+    Заносит в БД данные по магазинам и продуктам
+    :param sync: синхронизатор каталога магазина (ProductSync)
+    :param context: справочники ингредиентов и категорий (ImportContext)
+    :param report: отчет об импорте (ImportReport)
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    with report.stage('fetch'):
+        r = requests.get(FEED_URL, stream=True)
+    with r:
+        if r.status_code == 200:
+            r.raw.decode_content = True                     # распаковка сжатого ответа
+            # товары читаются из ответа по одному
+            categories, offers = read_xml_catalog(r.raw, report=report)
+            # id категории в фиде -> название категории
+            categories = {category['@id']: category['#text'] for category in categories}
+            with report.stage('match'):
+                # нечеткий поиск выполняется только для названий, которых нет в кэше
+                cache = MatchCache(context.shop, context.ingredients)
+                matcher = CachedMatcher(IngredientMatcher(context.ingredients, cutoff=0.8), cache.known)
+            load_products(parse_products(categories, offers, matcher, report), context, sync, report=report)
+            with report.stage('write'):
+                cache.save(matcher.new)
+            report.count_cache(matcher)
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--report', help='файл для сохранения отчета об импорте в формате JSON')
+        parser.add_argument('--prices-only', action='store_true',
+                            help='обновить только цены и наличие уже загруженных продуктов')
+
     def handle(self, *args, **options):
-        clear_data()
-        get_products()
-        print("Продукты занесены в БД")
+        report = ImportReport(SHOP)
+        # каталог обновляется одной транзакцией, до ее завершения API отдает предыдущую версию каталога
+        with report.track_queries(), transaction.atomic():
+            if options['prices_only']:
+                get_prices(PriceSync(SHOP), report)
+            else:
+                get_products(ProductSync(SHOP), ImportContext(SHOP), report)
+        self.stdout.write(report.summary())
+        if options['report']:
+            report.save(options['report'])
+
 
 """
 {
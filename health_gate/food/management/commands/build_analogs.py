@@ -0,0 +1,25 @@
+"""
+Пересчет аналогов продуктов (Product.analogs), запускается после импорта каталогов.
+Для запуска - python manage.py build_analogs
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...analogs import TOP_ANALOGS, WINDOW, build_analogs
+
+
+class Command(BaseCommand):
+    help = 'Пересчет аналогов продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_ANALOGS, help='кол-во аналогов продукта')
+        parser.add_argument('--window', type=int, default=WINDOW,
+                            help='кол-во соседних по цене за единицу продуктов, сравниваемых с продуктом')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products, links = build_analogs(top=options['top'], window=options['window'])
+        self.stdout.write(f'аналоги найдены для {products} продуктов, связей: {links}, '
+                          f'{time.perf_counter() - started:.2f} с')
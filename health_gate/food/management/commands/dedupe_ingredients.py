@@ -0,0 +1,58 @@
+"""
+Объединение повторяющихся ингредиентов перед добавлением уникального индекса на Ingredient.name.
+Прежняя загрузка справочника при каждом запуске добавляла ингредиенты заново, поэтому в существующих БД есть
+повторы, и migrate не может создать индекс. Ингредиенты с одинаковым названием (после normalize_name)
+объединяются в ингредиент с наименьшим id: на него переносятся ссылки продуктов, ингредиентов рецептов
+и найденных ингредиентов, остальные удаляются.
+Запускается перед migrate (docker-compose.yml) - python manage.py dedupe_ingredients
+На новой БД, где таблиц еще нет, ничего не делает.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from .ingredients import normalize_name
+from ...models import Ingredient, IngredientMatch, IngredientRecipe, Product
+
+# модели со ссылкой ingredient на Ingredient
+REFERENCES = [Product, IngredientRecipe, IngredientMatch]
+
+
+def dedupe_ingredients():
+    """
+    :return: кол-во удаленных повторов
+    """
+    tables = connection.introspection.table_names()
+    if Ingredient._meta.db_table not in tables:
+        return 0
+
+    groups = {}         # нормализованное название -> id ингредиентов по возрастанию
+    for pk, name in Ingredient.objects.order_by('pk').values_list('pk', 'name'):
+        groups.setdefault(normalize_name(name), []).append(pk)
+
+    removed = 0
+    with transaction.atomic():
+        for name, pks in groups.items():
+            keep, others = pks[0], pks[1:]
+            if others:
+                for model in REFERENCES:
+                    if model._meta.db_table in tables:
+                        model.objects.filter(ingredient__in=others).update(ingredient=keep)
+                # ссылок на повторы больше нет; удаление без сбора связанных объектов, которые до migrate
+                # могут не совпадать со схемой моделей
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {connection.ops.quote_name(Ingredient._meta.db_table)} '
+                        f'WHERE id IN ({", ".join(["%s"] * len(others))})', others,
+                    )
+                removed += len(others)
+            Ingredient.objects.filter(pk=keep).exclude(name=name).update(name=name)
+    return removed
+
+
+class Command(BaseCommand):
+    help = 'Объединение повторяющихся ингредиентов'
+
+    def handle(self, *args, **options):
+        removed = dedupe_ingredients()
+        self.stdout.write(f'Повторяющиеся ингредиенты объединены: удалено {removed}')
@@ -0,0 +1,83 @@
+"""
+Удаление повторяющихся продуктов магазинов перед добавлением уникального индекса на (Product.shop, Product.shop_id).
+Прежний импорт записывал каждую строку фида как есть, поэтому повторы shop_id в фиде давали в существующих БД
+несколько продуктов с одним ключом, и migrate не может создать индекс. Из продуктов с одинаковым ключом остается
+продукт с наименьшим id: на него переносятся ссылки шагов рецептов, аналоги повторов удаляются
+(пересчитываются командой build_analogs), остальные продукты удаляются.
+Запускается перед migrate (docker-compose.yml) - python manage.py dedupe_products
+На новой БД, где таблиц еще нет, ничего не делает.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from ...feeds import batched
+from ...models import CookStep, Product
+
+DELETE_BATCH = 500      # id в одном запросе удаления (ограничение кол-ва параметров запроса в SQLite)
+
+
+def repoint_links(through, field, other, duplicates):
+    """
+    Перенос связей m2m с повторов на оставляемый продукт,
+    связи, которые уже есть у оставляемого продукта, удаляются
+    :param field: поле промежуточной модели со ссылкой на продукт
+    :param other: поле промежуточной модели со ссылкой на второй объект связи
+    :param duplicates: словарь id повтора -> id оставляемого продукта
+    """
+    keep_ids = set(duplicates.values())
+    linked = set(through.objects.filter(**{f'{field}__in': keep_ids}).values_list(field, other))
+    removed = []
+    for pk, product_id, other_id in through.objects.filter(**{f'{field}__in': duplicates}).values_list(
+            'pk', field, other):
+        keep = duplicates[product_id]
+        if (keep, other_id) in linked:
+            removed.append(pk)
+        else:
+            through.objects.filter(pk=pk).update(**{field: keep})
+            linked.add((keep, other_id))
+    through.objects.filter(pk__in=removed).delete()
+
+
+def dedupe_products():
+    """
+    :return: кол-во удаленных повторов
+    """
+    tables = connection.introspection.table_names()
+    if Product._meta.db_table not in tables:
+        return 0
+
+    groups = {}         # (магазин, id продукта в магазине) -> id продуктов по возрастанию
+    # только столбцы, которые были у продукта и до migrate
+    for pk, shop, shop_id in Product.objects.filter(shop_id__isnull=False).order_by('pk').values_list(
+            'pk', 'shop', 'shop_id'):
+        groups.setdefault((shop, shop_id), []).append(pk)
+    duplicates = {pk: pks[0] for pks in groups.values() for pk in pks[1:]}     # id повтора -> id оставляемого
+    if not duplicates:
+        return 0
+
+    analogs = Product.analogs.through
+    steps = CookStep.ingredients.through
+    with transaction.atomic():
+        if analogs._meta.db_table in tables:
+            analogs.objects.filter(from_product__in=duplicates).delete()
+            analogs.objects.filter(to_product__in=duplicates).delete()
+        if steps._meta.db_table in tables:
+            repoint_links(steps, 'product', 'cookstep', duplicates)
+        # ссылок на повторы больше нет; удаление без сбора связанных объектов, которые до migrate
+        # могут не совпадать со схемой моделей
+        with connection.cursor() as cursor:
+            for batch in batched(duplicates, DELETE_BATCH):
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(Product._meta.db_table)} '
+                    f'WHERE id IN ({", ".join(["%s"] * len(batch))})', batch,
+                )
+    return len(duplicates)
+
+
+class Command(BaseCommand):
+    help = 'Удаление повторяющихся продуктов магазинов'
+
+    def handle(self, *args, **options):
+        removed = dedupe_products()
+        self.stdout.write(f'Повторяющиеся продукты удалены: {removed}')
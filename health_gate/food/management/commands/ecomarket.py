@@ -2,53 +2,51 @@
 Парсер данных по продуктам из Экомаркета. В БД попадают продукты, относящиеся к категориям, не входящим в список
 непродуктовых категорий.
 Для запуска обновления продуктов в БД из "EcoMarket" - python manage.py ecomarket
+Для обновления только цен и наличия продуктов - python manage.py ecomarket --prices-only
+Разбор фида и поиск ингредиентов в нескольких процессах - python manage.py ecomarket --workers 4
 Для автообноления БД на сервере используется Corn, который через заданные промежутки времени запускает скрипт
 """
 
-from ...models import CategoryProduct, Product, Ingredient
 from django.core.management.base import BaseCommand
-import csv
+from django.db import transaction
 import re
 import requests
-import difflib as dl
 from .products_lists import *
+from ...feeds import iter_csv_rows
+from ...catalog import ImportContext, MatchCache, PriceSync, ProductSync, load_prices, load_products
+from ...matcher import CachedMatcher, IngredientMatcher
+from ...parallel import parse_parallel
+from ...parsing import parse_quantity
+from ...report import ACCEPTED, REJECTED_CATEGORY, ROWS, UNMATCHED, UNPARSABLE_QUANTITY, ImportReport
 
+SHOP = 'Ecomarket'
+FEED_URL = "https://ecomarket.ru/public/kitchen_full_78.csv"
 
-def get_qty_and_measure(name):
-    """
-    Метод нахождения меры веса или объема товара и его кол-во в имени товара.
-    :return словарь с ключами 'qty' - кол-во и 'measure' - мера
-    """
-    qty_for_db = {'qty': 1.0, 'measure': 'кг.'}     # словарь с данными по кол-ву товара и его мере веса/объема
-
-    pattern = r"[0-9]*[.,]?[0-9]{1,3}[ ]?(?:кг|гр|г|ГР|л|мл|шт|штук)\b"
-
-    if len(re.findall(pattern, name)) == 1:      # если кол-во найденных мер веса и объема в имени одного товара равно 1
-        qty_product = re.search(pattern, name)   # находим кол-во товара и его меру веса/объема
-
-        qty_pattern = r"[0-9]*[.,]?[0-9]{1,3}"                  # паттерн для поиска количества товара
-        qty = re.search(qty_pattern, qty_product[0])            # объект match найденного кол-ва продукта
-
-        measure_pattern = r"(?:кг|гр|г|ГР|л|мл|шт|штук)\b"      # паттерн для поиска меры веса/объема
-        measure = re.search(measure_pattern, qty_product[0])    # объект match найденной меры веса/объема
-
-        if qty[0][0] == '.':        # если в начале найденного кол-ва товара точка, убираем её
-            qty = qty[0][1:]        # кол-во товара равно найденному значению без точки в начале строки
-        else:
-            qty = qty[0]
-        if ',' in qty:
-            qty = float(re.sub(r',', r'.', qty))
-        elif '.' in qty:
-            qty = float(qty)
-        qty_for_db['qty'] = float(qty)
-        qty_for_db['measure'] = measure[0]
-        return qty_for_db
-    elif "1 десяток" in name:
-        qty_for_db['qty'] = 10.0
-        qty_for_db['measure'] = 'шт'
-        return qty_for_db
-    elif "вес" in name:
-        return qty_for_db
+# в фиде нет имен колонок, неиспользуемые колонки названы их порядковым номером
+FIELDNAMES = [
+    1,
+    2,
+    3,
+    4,
+    'id',
+    'name',
+    7,
+    'shop',
+    'min_unit',
+    'min_qty',
+    11,
+    'available_qty',
+    'price',
+    14,
+    'picture',
+    16,
+    'proteins',
+    'fats',
+    'carbohydrates',
+    'calories',
+    'category',
+    'qty'
+]
 
 
 def get_organic(organic):
@@ -76,6 +74,16 @@ def get_calories(calories):
     return 0
 
 
+def get_available(available_qty):
+    """
+    Наличие товара по его остатку в фиде "EcoMarket"
+    """
+    try:
+        return float(available_qty) > 0
+    except (TypeError, ValueError):     # остаток не указан
+        return False
+
+
 def get_clear_product(product):
     pattern = r'\b[а-яА-ЯёЁ ]+'
     product = re.search(pattern, product)[0].split(' ')[:2]
@@ -83,33 +91,111 @@ def get_clear_product(product):
     return product
 
 
-def create_product(product, match):
+def get_record(product, match, quantity):
     """
-    Создаем и сохраняем продукт.
-    :param product: продукт, который нужно создать.
+    Данные продукта для сохранения в БД (см. catalog.load_products).
+    :param product: строка фида, из которой нужно создать продукт.
     :param match: первый ингредиент из списка совпадений.
+    :param quantity: кол-во товара и его мера (результат parse_quantity)
+    """
+    return {
+        'ingredient': match,
+        'category': product['category'],
+        'shop_id': int(product['id']),
+        'name': product['name'],
+        'picture': product['picture'],
+        'proteins': get_organic(product['proteins']),
+        'fats': get_organic(product['fats']),
+        'carbohydrates': get_organic(product['carbohydrates']),
+        'calories': get_calories(product['calories']),
+        'qty_per_item': quantity['qty'],
+        'unit': quantity['measure'],
+        'price': float(product['price']),
+        'available': get_available(product['available_qty']),
+    }
+
+
+def match_product(name, matcher):
+    """
+    Поиск ингредиента по названию продукта.
+    :param name: название продукта
+    :param matcher: индекс названий ингредиентов (IngredientMatcher или CachedMatcher)
+    :return: название найденного ингредиента или None
+    """
+    # убираем из имени продукта лишнее
+    clear_product = get_clear_product(name)
+    # проверка сходства между продуктом и ингредиентами
+    match = matcher.match(clear_product)
+    if match is None and clear_product != ' ':  # если сходств нет и имя продукта непустое, ищем по первому слову
+        match = matcher.match(clear_product.split()[0])
+    return match
+
+
+def parse_products(rows, matcher, report=None):
+    """
+    Разбор строк фида "EcoMarket" без обращения к БД.
+    Для строк из продуктовых категорий возвращаются данные продукта, если для него найден ингредиент,
+    иначе только категория (ingredient = None) - категории создаются для всех продуктовых строк.
+    :param rows: строки CSV-фида (словари с ключами FIELDNAMES)
+    :param matcher: индекс названий ингредиентов (IngredientMatcher)
+    :param report: отчет об импорте (ImportReport) для счетчиков строк и времени поиска ингредиентов
+    :return: генератор данных продуктов
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    for product in rows:
+        report.count(ROWS)
+        if product['category'] in invalid_category:     # категория в списке недопустимых категорий товаров
+            report.count(REJECTED_CATEGORY)
+            continue
+
+        quantity = parse_quantity(product['name'])
+        if quantity is None:        # в имени продукта нет пограммовки
+            report.count(UNPARSABLE_QUANTITY)
+            yield {'category': product['category'], 'ingredient': None}
+            continue
+
+        with report.stage('match'):
+            match = match_product(product['name'], matcher)
+        if match is None:           # нет сходства ингредиента с названием продукта
+            report.count(UNMATCHED)
+            yield {'category': product['category'], 'ingredient': None}
+            continue
+
+        report.count(ACCEPTED)
+        yield get_record(product, match, quantity)
+
+
+def parse_prices(rows):
+    """
+    Разбор цен и остатков из строк фида "EcoMarket" без разбора остальных данных товаров
+    :param rows: строки CSV-фида (словари с ключами FIELDNAMES)
+    :return: генератор кортежей (id товара, цена, наличие), id и цена разбираются в PriceSync
     """
-    product_db = Product(
-        ingredient=Ingredient.objects.get(name=match),
-        shop=product['shop'],
-        category=CategoryProduct.objects.get(name=product['category']),
-        shop_id=int(product['id']),
-        name=product['name'],
-        picture=product['picture'],
-        proteins=get_organic(product['proteins']),
-        fats=get_organic(product['fats']),
-        carbohydrates=get_organic(product['carbohydrates']),
-        calories=get_calories(product['calories']),
-        qty_per_item=float(get_qty_and_measure(product['name'])['qty']),
-        unit=get_qty_and_measure(product['name'])['measure'],
-        price=float(product['price'])
-    )
-    product_db.save()
-
-
-def get_products():
+    for product in rows:
+        yield product['id'], product['price'], get_available(product['available_qty'])
+
+
+def get_prices(sync, report=None):
+    """
+    Быстрое обновление цен и наличия продуктов "EcoMarket", уже загруженных в БД
+    :param sync: синхронизатор цен магазина (PriceSync)
+    :param report: отчет об импорте (ImportReport)
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    with report.stage('fetch'):
+        res = requests.get(FEED_URL, stream=True)
+    with res:
+        if res.status_code == 200:
+            load_prices(parse_prices(iter_csv_rows(res, FIELDNAMES, report=report)), sync, report=report)
+
+
+def get_products(sync, context, report=None, workers=None):
     """
     Сохранение в БД данные по продуктам и их категориям от "EcoMarket"
+    :param sync: синхронизатор каталога магазина (ProductSync)
+    :param context: справочники ингредиентов и категорий (ImportContext)
+    :param report: отчет об импорте (ImportReport)
+    :param workers: кол-во процессов для разбора строк и поиска ингредиентов (по умолчанию - в текущем процессе)
     """
     """
         ;                                                                                           -1
@@ -135,84 +221,50 @@ def get_products():
         "Полуфабрикаты ";                                                                           - category
         0.2                                                                                         - qty_per_item (кг)
     """
-    res = requests.get("https://ecomarket.ru/public/kitchen_full_78.csv")
-    if res.status_code == 200:
-        fieldnames = [
-            1,
-            2,
-            3,
-            4,
-            'id',
-            'name',
-            7,
-            'shop',
-            'min_unit',
-            'min_qty',
-            11,
-            'available_qty',
-            'price',
-            14,
-            'picture',
-            16,
-            'proteins',
-            'fats',
-            'carbohydrates',
-            'calories',
-            'category',
-            'qty'
-        ]
-
-        i = 0       # счетчик ингредиентов
-        j = 0       # счетчик продуктов
-        ingredients = [str(ingredient) for ingredient in Ingredient.objects.all()]
-
-        products = res.content.decode('utf-8').split('\n')
-        reader = csv.DictReader(products, delimiter=';', fieldnames=fieldnames)
-        for product in reader:
-            j += 1      # увеличиваем счетчик продуктов
-            # если категория не в списке недопустимых категорий товаров и ее еще нет в БД
-            if product['category'] not in invalid_category and \
-                    not CategoryProduct.objects.filter(name=product['category']).exists():
-                category = CategoryProduct(name=product['category'], shop=product['shop'])  # создаем категорию
-                category.save()                                                             # сохраняем категорию в БД
-
-            # если категория не в списке недопустимых категорий товаров
-            # и в имени продукта есть пограммовка, создаем и сохраняем продукт
-            if product['category'] not in invalid_category and get_qty_and_measure(product['name']) is not None:
-                # убираем из имени продукта лишнее
-                clear_product = get_clear_product(product['name'])
-                # проверка сходства между продуктом и ингредиентами
-                match = dl.get_close_matches(clear_product, ingredients, cutoff=0.8)
-                if len(match) > 0:  # если найдены сходства ингредиента с названием продукта
-                    print(match[0], '--ингредиент--')
-                    print(product['name'])
-                    print('-------------------------------------------------')
-                    i += 1  # увеличиваем счетчик ингредиентов
-                    # создаем и сохраняем продукт
-                    create_product(product, match[0])
-                elif clear_product != ' ':  # если имя продукта непустое
-                    match = dl.get_close_matches(clear_product.split()[0], ingredients, cutoff=0.8)
-                    if len(match) > 0:
-                        print(match[0], '--ингредиент--')
-                        print(product['name'])
-                        print('-------------------------------------------------')
-                        i += 1
-                        # создаем и сохраняем продукт
-                        create_product(product, match[0])
-
-        print(i, 'ingredients')
-        print(j, 'products')
-
-
-def clear_data():
-    """
-    Очистить все записи в таблице Product
-    """
-    Product.objects.all().delete()
+    report = report if report is not None else ImportReport(SHOP)
+    with report.stage('fetch'):
+        res = requests.get(FEED_URL, stream=True)
+    with res:
+        if res.status_code != 200:
+            return
+
+        # нечеткий поиск выполняется только для названий, которых нет в кэше
+        cache = MatchCache(context.shop, context.ingredients)
+        # фид читается из сети построчно и записывается в БД пачками по BATCH_SIZE строк,
+        # поэтому потребление памяти не зависит от размера фида
+        rows = iter_csv_rows(res, FIELDNAMES, report=report)
+        if workers is not None and workers > 1:
+            # разбор и поиск ингредиентов в процессах, запись в БД - в текущем процессе
+            matches = {}
+            records = parse_parallel(parse_products, rows, list(context.ingredients), cache.known, workers,
+                                     report=report, matches=matches)
+            load_products(records, context, sync, report=report)
+        else:
+            with report.stage('match'):
+                matcher = CachedMatcher(IngredientMatcher(context.ingredients, cutoff=0.8), cache.known)
+            load_products(parse_products(rows, matcher, report), context, sync, report=report)
+            report.count_cache(matcher)
+            matches = matcher.new
+        with report.stage('write'):
+            cache.save(matches)
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--report', help='файл для сохранения отчета об импорте в формате JSON')
+        parser.add_argument('--prices-only', action='store_true',
+                            help='обновить только цены и наличие уже загруженных продуктов')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='кол-во процессов для разбора строк фида и поиска ингредиентов')
+
     def handle(self, *args, **options):
-        clear_data()
-        get_products()
-        print("---------------------------------------PRODUCTS WAS ADDED----------------------------------------------")
\ No newline at end of file
+        report = ImportReport(SHOP)
+        # каталог обновляется одной транзакцией, до ее завершения API отдает предыдущую версию каталога
+        with report.track_queries(), transaction.atomic():
+            if options['prices_only']:
+                get_prices(PriceSync(SHOP), report)
+            else:
+                get_products(ProductSync(SHOP), ImportContext(SHOP), report, options['workers'])
+        self.stdout.write(report.summary())
+        if options['report']:
+            report.save(options['report'])
\ No newline at end of file
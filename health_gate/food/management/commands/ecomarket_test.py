@@ -4,29 +4,31 @@
 Для автообновления БД на сервере используется Corn, который через заданные промежутки времени запускает скрипт
 """
 
-from ...models import CategoryProduct, Product
 from django.core.management.base import BaseCommand
-import xmltodict
-import json
+from django.db import transaction
 import requests
 import re
+from ...catalog import ImportContext, MatchCache, ProductSync, load_products
+from ...feeds import read_xml_catalog
+from ...matcher import CachedMatcher, IngredientMatcher
+from ...parsing import find_quantity
+from ...report import ACCEPTED, ROWS, UNMATCHED, UNPARSABLE_QUANTITY, ImportReport
+from .ecomarket import match_product
+
+SHOP = 'EcoMarket'
+FEED_URL = "https://ecomarket.ru/public/goods_202110281305.xml"
 
 
 def get_measure(name):
     """
-    Метод нахождения меры веса/объема товара
+    Метод нахождения меры веса/объема товара: 'мл' для жидкостей, 'г' для остальных товаров.
+    Кол-во товара берется из фида (weight_netto), поэтому мера определяется только если кол-во указано в имени.
     """
-    pattern = r"[0-9]*[.,]?[0-9]{1,3}[ ]?(?:кг|гр|г|л|мл|шт)"
-    if len(re.findall(pattern, name)) == 1:      # если кол-во найденых мер веса и объема в имени одного товара = 1
-        qty_product = re.search(pattern, name)   # находим кол-во товара и его меру веса/объема
-
-        measure_pattern = r"(?:кг|гр|г|л|мл|шт)\b"              # паттерн для поиска меры веса/объема
-        measure = re.search(measure_pattern, qty_product[0])    # объект match найденой меры веса/объема
-
-        if measure[0] == 'л' or measure[0] == 'мл':
+    qty = find_quantity(name)
+    if qty is not None:
+        if qty['measure'] in ('л', 'мл'):
             return 'мл'
-        else:
-            return 'г'
+        return 'г'
 
 
 def get_organic(organic):
@@ -50,55 +52,91 @@ def get_calories(calories):
     return calories
 
 
-def get_products():
+def get_record(product, match, categories):
     """
-    Сохранение в БД данные по продуктам и их категориям от "EcoMarket"
+    Данные продукта для сохранения в БД (см. catalog.load_products)
+    :param match: найденный ингредиент продукта
+    :param categories: словарь id категории в фиде -> название категории
     """
-    r = requests.get("https://ecomarket.ru/public/goods_202110281305.xml")
-    if r.status_code == 200:
-        data = xmltodict.parse(r.content)                       # парсинг xml-данных в dict формат
-        json_data = json.dumps(data, ensure_ascii=False)
-        work_data = json.loads(json_data)                       # перевод данных в формат JSON
-        # проходим циклом по всем категориям товаров
-        for category in work_data['goods_data']['categories']['category']:                 # проходим по всем категориям
-            if not CategoryProduct.objects.filter(shop_id=int(category['id'])).exists():   # если категории еще нет в БД
-                category = CategoryProduct(shop_id=int(category['id']),                    # создаем категорию для БД
-                                           name=category['name'],
-                                           shop='EcoMarket')
-                category.save()                                                            # сохраняем категорию в БД
-
-        for product in work_data['goods_data']['offers']['offer']:      # проходим по всем продуктам
-            if get_measure(product['name']) is not None:                # если мера веса/объема не равна None
-                # print(product['name'])
-                # print(product['weight_netto'], get_measure(product['name']))
-                # print(product['category_id'], CategoryProduct.objects.get(shop_id=int(product['category_id'])))
-                # print('--------------------------------------------------------------')
-                product_db = Product(
-                    shop='EcoMarket',
-                    category=CategoryProduct.objects.get(shop_id=int(product['category_id'])),
-                    shop_id=int(product['id']),
-                    name=product['name'],
-                    picture=product['images']['image']['image_url'],
-                    proteins=get_organic(product['product_info']['proteins']),
-                    fats=get_organic(product['product_info']['fats']),
-                    carbohydrates=get_organic(product['product_info']['carbohydrates']),
-                    calories=get_calories(product['product_info']['calories']),
-                    qty_per_item=float(product['weight_netto']),
-                    unit=get_measure(product['name']),
-                    price=15.00              # цен на продукты нет в фидах ЭкоМаркета, для расчетов цена = 15
-                )
-                product_db.save()
-
-
-def clear_data():
+    return {
+        'ingredient': match,
+        'category': categories[product['category_id']],
+        'shop_id': int(product['id']),
+        'name': product['name'],
+        'picture': product['images']['image']['image_url'],
+        'proteins': get_organic(product['product_info']['proteins']),
+        'fats': get_organic(product['product_info']['fats']),
+        'carbohydrates': get_organic(product['product_info']['carbohydrates']),
+        'calories': get_calories(product['product_info']['calories']),
+        'qty_per_item': float(product['weight_netto']),
+        'unit': get_measure(product['name']),
+        'price': 15.00,             # цен на продукты нет в фидах ЭкоМаркета, для расчетов цена = 15
+    }
+
+
+def parse_products(categories, offers, matcher, report=None):
     """
-    Очистить все записи в таблице Product
+    Разбор товаров фида без обращения к БД
+    :param categories: словарь id категории в фиде -> название категории
+    :param offers: итерируемый объект с товарами фида
+    :param matcher: индекс названий ингредиентов (IngredientMatcher)
+    :param report: отчет об импорте (ImportReport) для счетчиков строк и времени поиска ингредиентов
+    :return: генератор данных продуктов (для категорий без продуктов ingredient = None)
     """
-    Product.objects.all().delete()
+    report = report if report is not None else ImportReport(SHOP)
+    for name in categories.values():        # категории создаются все, даже если в них не будет продуктов
+        yield {'category': name, 'ingredient': None}
+
+    for product in offers:                              # проходим по всем продуктам
+        report.count(ROWS)
+        if get_measure(product['name']) is None:        # если мера веса/объема не определена
+            report.count(UNPARSABLE_QUANTITY)
+            continue
+        with report.stage('match'):
+            match = match_product(product['name'], matcher)
+        if match is None:
+            report.count(UNMATCHED)
+            continue
+        report.count(ACCEPTED)
+        yield get_record(product, match, categories)
+
+
+def get_products(sync, context, report=None):
+    """
+    Сохранение в БД данные по продуктам и их категориям от "EcoMarket"
+    :param sync: синхронизатор каталога магазина (ProductSync)
+    :param context: справочники ингредиентов и категорий (ImportContext)
+    :param report: отчет об импорте (ImportReport)
+    """
+    report = report if report is not None else ImportReport(SHOP)
+    with report.stage('fetch'):
+        r = requests.get(FEED_URL, stream=True)
+    with r:
+        if r.status_code == 200:
+            r.raw.decode_content = True                     # распаковка сжатого ответа
+            # товары читаются из ответа по одному
+            categories, offers = read_xml_catalog(r.raw, report=report)
+            # id категории в фиде -> название категории
+            categories = {category['id']: category['name'] for category in categories}
+            with report.stage('match'):
+                # нечеткий поиск выполняется только для названий, которых нет в кэше
+                cache = MatchCache(context.shop, context.ingredients)
+                matcher = CachedMatcher(IngredientMatcher(context.ingredients, cutoff=0.8), cache.known)
+            load_products(parse_products(categories, offers, matcher, report), context, sync, report=report)
+            with report.stage('write'):
+                cache.save(matcher.new)
+            report.count_cache(matcher)
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--report', help='файл для сохранения отчета об импорте в формате JSON')
+
     def handle(self, *args, **options):
-        clear_data()
-        get_products()
-        print("---------------------------------------PRODUCTS WAS ADDED----------------------------------------------")
\ No newline at end of file
+        report = ImportReport(SHOP)
+        # каталог обновляется одной транзакцией, до ее завершения API отдает предыдущую версию каталога
+        with report.track_queries(), transaction.atomic():
+            get_products(ProductSync(SHOP), ImportContext(SHOP), report)
+        self.stdout.write(report.summary())
+        if options['report']:
+            report.save(options['report'])
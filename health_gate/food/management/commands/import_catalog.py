@@ -0,0 +1,56 @@
+"""
+Одновременный импорт каталогов всех магазинов (см. food/shops.py).
+Для запуска - python manage.py import_catalog
+Только отдельные магазины - python manage.py import_catalog --shop ecomarket --shop bringstone
+Из локального файла фида - python manage.py import_catalog --source ecomarket=/path/to/kitchen_full_78.csv
+Фиды, не изменившиеся с прошлого импорта, пропускаются; импорт без проверки - python manage.py import_catalog --force
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...catalog import ProductSync
+from ...report import save_reports
+from ...shops import DEFAULT_FEEDS, FEEDS, UNCHANGED, import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Импорт каталогов магазинов: фиды загружаются и разбираются одновременно'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', action='append', choices=sorted(FEEDS), help='фид для импорта')
+        parser.add_argument('--source', action='append', default=[], metavar='SHOP=PATH',
+                            help='URL или путь к локальному файлу фида')
+        parser.add_argument('--workers', type=int, default=None, help='кол-во процессов разбора фидов')
+        parser.add_argument('--force', action='store_true', help='импортировать фиды, даже если они не изменились')
+        parser.add_argument('--report', help='файл для сохранения отчетов об импорте в формате JSON')
+
+    def handle(self, *args, **options):
+        sources = {}
+        for source in options['source']:
+            name, sep, path = source.partition('=')
+            if not sep or name not in FEEDS:
+                raise CommandError(f'Неверный источник фида: {source}')
+            sources[name] = path
+
+        names = options['shop'] or DEFAULT_FEEDS
+        feeds = [FEEDS[name](sources.get(name)) for name in names]
+        reports = {}
+        results = import_catalog(feeds, workers=options['workers'], force=options['force'], reports=reports)
+
+        failed = False
+        for name in names:
+            result = results.get(name)
+            if isinstance(result, ProductSync):
+                self.stdout.write(reports[name].summary())
+            elif result == UNCHANGED:
+                self.stdout.write(f'{name}: фид не изменился')
+            elif result is None:
+                self.stderr.write(f'{name}: фид недоступен')
+            else:
+                failed = True
+                self.stderr.write(f'{name}: {result!r}')
+        if options['report']:
+            imported = [name for name in names if isinstance(results.get(name), ProductSync)]
+            save_reports(options['report'], [reports[name] for name in imported])
+        if failed:
+            raise CommandError('Не все каталоги импортированы')
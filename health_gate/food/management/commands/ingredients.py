@@ -1,28 +1,66 @@
-# Добавление ингредиентов в БД из файла "export_tovar_tag.csv"
-# Для запуска - python manage.py ingredients
+# Добавление ингредиентов в БД из CSV-файла (например, "export_tovar_tag.csv")
+# Для запуска - python manage.py ingredients /path/to/export_tovar_tag.csv
+# Повторная загрузка того же файла не создает дубликатов: уже существующие ингредиенты пропускаются
+# Повторы, добавленные прежней загрузкой, объединяет команда dedupe_ingredients
 
 import csv
-from ...models import Ingredient
+import re
 from django.core.management import BaseCommand
+from ...feeds import batched
+from ...models import Ingredient
+
+# строки файла, не являющиеся ингредиентами
+SKIP_NAMES = {'удалить', ''}
+
+BATCH_SIZE = 1000       # кол-во ингредиентов, добавляемых в БД одним запросом
+
+
+def normalize_name(name):
+    """
+    Приведение названия ингредиента к единому виду: без лишних пробелов.
+    Регистр сохраняется: поиск ингредиентов по названиям продуктов (matcher.py) учитывает регистр,
+    а названия продуктов и ингредиентов справочника начинаются с заглавной буквы
+    """
+    return re.sub(r'\s+', ' ', name).strip()
 
 
-def get_ingredients():
+def read_ingredients(path):
     """
-    В файле нет имен колонок, поэтому присваиваем имя колонке с ингредиентами - fieldnames=['ingredient']
-    Ингредиенты из файла добавляются во множество ingredients для исключения повторений.
-    В результате создается множество объектов Ингредиентов
+    Построчное чтение названий ингредиентов из файла.
+    В файле нет имен колонок, поэтому присваиваем имя колонке с ингредиентами - fieldnames=['ingredient'].
+    Названия нормализуются, повторения и служебные строки пропускаются.
+    :return: генератор уникальных названий ингредиентов
     """
-    ingredients = set()
-    with open(r'D:\downloads\telegram\БД ингредиенты 20.12.21\export_tovar_tag.csv', encoding='utf-8') as file:
-        data = csv.DictReader(file, fieldnames=['ingredient'])
-        for row in data:
-            if row not in ['удалить', '']:
-                ingredients.add(row['ingredient'])
-    objs = [Ingredient(name=name) for name in ingredients]
-    Ingredient.objects.bulk_create(objs)
+    seen = set()
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file, fieldnames=['ingredient']):
+            name = normalize_name(row['ingredient'] or '')
+            if name in SKIP_NAMES or name in seen:
+                continue
+            seen.add(name)
+            yield name
+
+
+def load_ingredients(names, batch_size=BATCH_SIZE):
+    """
+    Добавление ингредиентов в БД пачками. Ингредиенты, уже существующие в БД, пропускаются
+    уникальным индексом по названию (ignore_conflicts), поэтому загрузка идемпотентна.
+    :param names: итерируемый объект с названиями ингредиентов
+    :return: кол-во добавленных ингредиентов
+    """
+    count = Ingredient.objects.count()
+    for batch in batched(names, batch_size):
+        Ingredient.objects.bulk_create([Ingredient(name=name) for name in batch], ignore_conflicts=True)
+    return Ingredient.objects.count() - count
 
 
 class Command(BaseCommand):
+    help = 'Загрузка справочника ингредиентов из CSV-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='путь к CSV-файлу с ингредиентами (одна колонка без заголовка)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='кол-во ингредиентов в запросе')
+
     def handle(self, *args, **options):
-        get_ingredients()
-        print("Ингредиенты занесены в БД")
\ No newline at end of file
+        created = load_ingredients(read_ingredients(options['path']), options['batch_size'])
+        self.stdout.write(f'Ингредиенты занесены в БД: добавлено {created}')
@@ -0,0 +1,20 @@
+"""
+Создание или пересоздание индексов поиска продуктов (см. food/search.py).
+Индексы создаются автоматически после migrate, команда нужна для пересоздания:
+python manage.py search_index --rebuild
+"""
+
+from django.core.management.base import BaseCommand
+
+from ...search import ensure_search_index
+
+
+class Command(BaseCommand):
+    help = 'Создание индексов поиска продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='пересоздать индексы')
+
+    def handle(self, *args, **options):
+        ensure_search_index(rebuild=options['rebuild'])
+        self.stdout.write('индексы поиска продуктов созданы')
@@ -0,0 +1,49 @@
+"""
+Заполнение кол-ва в базовых единицах и цены за базовую единицу (Product.base_qty, Product.unit_price)
+у продуктов, сохраненных до появления этих полей. Новые и измененные продукты заполняются при сохранении
+и импорте, но продукты из неизменившихся фидов и добавленные вручную без этой команды остаются без цены
+за единицу, и их не находят Product.objects.cheapest() и расчет аналогов.
+Запускается после migrate (docker-compose.yml) - python manage.py unit_prices
+Пересчет всех продуктов (например, после изменения разбора кол-ва) - python manage.py unit_prices --all
+"""
+
+from django.core.management.base import BaseCommand
+
+from ...feeds import BATCH_SIZE
+from ...models import Product
+
+
+def update_unit_prices(everything=False, batch_size=BATCH_SIZE):
+    """
+    Пересчет пачками по возрастанию id, в БД записываются только изменившиеся продукты
+    :param everything: пересчитать все продукты, а не только продукты без цены за единицу
+    :return: кол-во обновленных продуктов
+    """
+    products = Product.objects.order_by('pk').only('pk', 'qty_per_item', 'unit', 'price', 'base_qty', 'unit_price')
+    if not everything:
+        products = products.filter(unit_price__isnull=True)
+    updated, last_pk = 0, 0
+    while True:
+        batch = list(products.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        changed = []
+        for product in batch:
+            old = product.base_qty, product.unit_price
+            product.update_unit_price()
+            if (product.base_qty, product.unit_price) != old:
+                changed.append(product)
+        Product.objects.bulk_update(changed, ['base_qty', 'unit_price'])
+        updated += len(changed)
+
+
+class Command(BaseCommand):
+    help = 'Заполнение цены за единицу продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='everything', help='пересчитать все продукты')
+
+    def handle(self, *args, **options):
+        updated = update_unit_prices(everything=options['everything'])
+        self.stdout.write(f'цена за единицу обновлена у {updated} продуктов')
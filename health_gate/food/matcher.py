@@ -0,0 +1,143 @@
+"""
+Нечеткий поиск ингредиента по названию продукта.
+Вместо сравнения названия продукта со всеми ингредиентами (difflib.get_close_matches) строится инвертированный
+индекс n-грамм по названиям ингредиентов, и SequenceMatcher запускается только для кандидатов,
+у которых есть общие с названием продукта n-граммы и подходящая длина.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from heapq import nlargest
+
+# при таком пороге сходства любая пара строк с ratio() >= cutoff имеет общую биграмму (с учетом пробелов
+# по краям строки), поэтому индекс биграмм не теряет совпадений по сравнению с полным перебором
+MIN_INDEXED_CUTOFF = 0.8
+
+
+def get_ngrams(text, n=2):
+    """
+    n-граммы строки с кол-вом их повторений. Строка дополняется пробелами по краям,
+    чтобы короткие строки тоже имели n-граммы
+    """
+    text = f' {text} '
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def get_min_shared(cutoff, size_a, size_b):
+    """
+    Минимальное кол-во общих биграмм у строк длиной size_a и size_b, при котором ratio() может быть >= cutoff.
+    Совпавшие блоки SequenceMatcher общей длиной M при k блоках дают не меньше M - k общих биграмм,
+    между блоками есть хотя бы один несовпавший символ, а M >= cutoff * (size_a + size_b) / 2,
+    откуда общих биграмм не меньше (3 * cutoff - 2) * (size_a + size_b) / 2 - 1.
+    """
+    return (3 * cutoff - 2) * (size_a + size_b) / 2 - 1
+
+
+class IngredientMatcher:
+    """
+    Индекс для поиска ближайших по написанию ингредиентов.
+    Результаты совпадают с difflib.get_close_matches(word, names, n, cutoff): те же оценки сходства,
+    тот же порог и тот же порядок совпадений (повторяющиеся названия учитываются один раз).
+    """
+
+    def __init__(self, names, cutoff=0.8):
+        self.names = list(dict.fromkeys(names))     # уникальные названия с сохранением порядка
+        self.cutoff = cutoff
+        # биграмма -> (длины названий, номера названий, кол-во биграммы в названии), отсортированные по длине
+        postings = defaultdict(list)
+        for number, name in enumerate(self.names):
+            for gram, count in get_ngrams(name).items():
+                postings[gram].append((len(name), number, count))
+        self.index = {}
+        for gram, items in postings.items():
+            items.sort()
+            self.index[gram] = tuple(list(column) for column in zip(*items))
+        self.lengths = [len(name) for name in self.names]
+        self.by_length = sorted((length, number) for number, length in enumerate(self.lengths))
+
+    def get_candidates(self, word, cutoff):
+        """
+        Номера названий, которые могут иметь сходство с word не ниже cutoff.
+        ratio() не превышает 2 * min(len(a), len(b)) / (len(a) + len(b)), поэтому названия слишком короткие
+        или слишком длинные по сравнению с word отбрасываются без сравнения, как и названия,
+        у которых слишком мало общих с word биграмм (см. get_min_shared).
+        """
+        if cutoff <= 0:
+            return range(len(self.names))
+        size = len(word)
+        min_length = size * cutoff / (2 - cutoff) - 1e-9      # допуск на погрешность вычислений с float
+        max_length = size * (2 - cutoff) / cutoff + 1e-9
+
+        if cutoff < MIN_INDEXED_CUTOFF:       # при низком пороге индекс может потерять совпадения
+            lengths = [length for length, _ in self.by_length]
+            start, end = bisect_left(lengths, min_length), bisect_right(lengths, max_length)
+            return [number for _, number in self.by_length[start:end]]
+
+        shared = Counter()      # номер названия -> кол-во общих с word биграмм
+        for gram, word_count in get_ngrams(word).items():
+            posting = self.index.get(gram)
+            if posting is None:
+                continue
+            lengths, numbers, counts = posting
+            start, end = bisect_left(lengths, min_length), bisect_right(lengths, max_length)
+            if word_count == 1:
+                shared.update(numbers[start:end])
+            else:
+                for i in range(start, end):
+                    shared[numbers[i]] += min(word_count, counts[i])
+
+        # порог общих биграмм линейно зависит от длины названия: base + step * len(name)
+        step = (3 * cutoff - 2) / 2
+        base = get_min_shared(cutoff, size, 0) - 1e-9
+        return [number for number, count in shared.items() if count >= base + step * self.lengths[number]]
+
+    def get_close_matches(self, word, n=3, cutoff=None):
+        """
+        Аналог difflib.get_close_matches по проиндексированным названиям
+        :return: список до n лучших совпадений, отсортированных по убыванию сходства
+        """
+        cutoff = self.cutoff if cutoff is None else cutoff
+        result = []
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        for number in self.get_candidates(word, cutoff):
+            x = self.names[number]
+            s.set_seq1(x)
+            if s.real_quick_ratio() >= cutoff and s.quick_ratio() >= cutoff and s.ratio() >= cutoff:
+                result.append((s.ratio(), x))
+        return [x for score, x in nlargest(n, result)]
+
+    def match(self, word, cutoff=None):
+        """
+        Лучшее совпадение для word или None
+        """
+        matches = self.get_close_matches(word, n=1, cutoff=cutoff)
+        return matches[0] if matches else None
+
+
+class CachedMatcher:
+    """
+    Поиск ингредиентов с учетом уже известных результатов (например, сохраненных в БД при прошлом импорте).
+    Для названий, которых нет в known, выполняется нечеткий поиск, результаты собираются в new.
+    """
+
+    def __init__(self, matcher, known=None):
+        self.matcher = matcher
+        self.known = dict(known or {})      # название -> найденный ингредиент или None
+        self.new = {}                       # результаты, найденные нечетким поиском
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, word, cutoff=None):
+        """
+        Лучшее совпадение для word или None
+        """
+        if cutoff is not None:          # результаты известны только для порога по умолчанию
+            return self.matcher.match(word, cutoff)
+        if word in self.known:
+            self.hits += 1
+            return self.known[word]
+        self.misses += 1
+        result = self.known[word] = self.new[word] = self.matcher.match(word)
+        return result
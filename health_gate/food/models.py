@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.db import models
 
+from .parsing import get_base_qty, get_unit_price
+
 User = settings.AUTH_USER_MODEL
 
 
@@ -8,7 +10,7 @@ class Ingredient(models.Model):
     """
     Ингредиент
     """
-    name = models.CharField(max_length=100, verbose_name='Название')
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название')
 
     class Meta:
         ordering = ('name',)
@@ -31,11 +33,22 @@ class CategoryProduct(models.Model):
         verbose_name = 'Категория продукта'
         verbose_name_plural = 'Категории продуктов'
         db_table = 'category_product'
+        indexes = [models.Index(fields=['name'], name='category_product_name_idx')]     # импорт каталогов
 
     def __str__(self):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+
+    def cheapest(self, ingredient):
+        """
+        Самые дешевые за кг, л или шт продукты ингредиента в наличии.
+        Выполняется по индексу (ingredient, unit_price) без сортировки всех продуктов ингредиента.
+        """
+        return self.filter(ingredient=ingredient, available=True, unit_price__isnull=False).order_by('unit_price')
+
+
 class Product(models.Model):
     """Продукт"""
 
@@ -67,16 +80,88 @@ class Product(models.Model):
     added = models.DateTimeField(auto_now_add=True, verbose_name='Добавлен')
     updated = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
     analogs = models.ManyToManyField('food.Product', related_name='analog_products')
+    # заполняются по qty_per_item, unit и price (update_unit_price)
+    base_qty = models.FloatField(verbose_name='Кол-во на ед. продукта в кг, л или шт', null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=14, decimal_places=2, verbose_name='Цена за кг, л или шт',
+                                     null=True, blank=True)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         db_table = 'product'
+        indexes = [
+            models.Index(fields=['ingredient', 'unit_price'], name='product_ingredient_price_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),     # поиск продукта по названию в API
+        ]
+        # ключ синхронизации каталога магазина (catalog.ProductSync), у добавленных вручную продуктов shop_id - NULL
+        constraints = [models.UniqueConstraint(fields=['shop', 'shop_id'], name='product_shop_item_uniq')]
 
     def __str__(self):
         return self.name
 
+    def update_unit_price(self):
+        """
+        Пересчет кол-ва в базовых единицах и цены за базовую единицу.
+        Импорт каталогов пишет продукты через bulk_create/bulk_update, поэтому вызывает метод сам.
+        """
+        self.base_qty = get_base_qty(self.qty_per_item, self.unit)
+        self.unit_price = get_unit_price(self.price, self.base_qty)
+
+    def save(self, *args, **kwargs):
+        self.update_unit_price()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'base_qty', 'unit_price'}
+        super().save(*args, **kwargs)
+
+
+class IngredientMatch(models.Model):
+    """
+    Результат нечеткого поиска ингредиента по названию продукта магазина (кэш поиска между импортами).
+    Результат действителен, пока не изменился справочник ингредиентов (version).
+    """
+
+    shop = models.CharField(max_length=50, verbose_name='Магазин')
+    name = models.CharField(max_length=300, verbose_name='Название продукта')
+    ingredient = models.ForeignKey(Ingredient, verbose_name='Ингредиент', on_delete=models.CASCADE,
+                                   null=True, blank=True, related_name='+')     # None - ингредиент не найден
+    version = models.CharField(max_length=32, verbose_name='Версия справочника ингредиентов')
+
+    class Meta:
+        unique_together = ('shop', 'name')
+        verbose_name = 'Найденный ингредиент продукта'
+        verbose_name_plural = 'Найденные ингредиенты продуктов'
+        db_table = 'ingredient_match'
+
+    def __str__(self):
+        return self.name
+
+
+class FeedState(models.Model):
+    """
+    Состояние фида магазина после последнего успешного импорта (для пропуска неизмененных фидов).
+    Фид пропускается, только если с тех пор не изменились ни он сам, ни справочник ингредиентов, ни разбор фида.
+    """
+
+    feed = models.CharField(max_length=50, unique=True, verbose_name='Фид')
+    etag = models.CharField(max_length=255, blank=True, default='', verbose_name='ETag')
+    last_modified = models.CharField(max_length=100, blank=True, default='', verbose_name='Last-Modified')
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name='Хэш содержимого')
+    ingredients_version = models.CharField(max_length=32, blank=True, default='',
+                                           verbose_name='Версия справочника ингредиентов')
+    parser_version = models.PositiveIntegerField(default=0, verbose_name='Версия разбора фида')
+    imported = models.DateTimeField(auto_now=True, verbose_name='Импортирован')
+
+    class Meta:
+        verbose_name = 'Состояние фида'
+        verbose_name_plural = 'Состояния фидов'
+        db_table = 'feed_state'
+
+    def __str__(self):
+        return self.feed
+
 
 class Category(models.Model):
     """
@@ -203,6 +288,11 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         db_table = 'Recipe'
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='recipe_date_created_idx'),      # рецепты по дате
+            models.Index(fields=['is_active', 'date_created'], name='recipe_active_date_idx'),
+            models.Index(fields=['title'], name='recipe_title_idx'),        # рецепты заказа по названию
+        ]
 
     def __str__(self):
         return self.title
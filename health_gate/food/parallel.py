@@ -0,0 +1,75 @@
+"""
+Параллельный разбор строк фида и поиск ингредиентов в нескольких процессах.
+Строки фида делятся на пачки, каждая пачка разбирается функцией parse_products парсера магазина в отдельном
+процессе. Индекс ингредиентов строится в каждом процессе один раз при его запуске. Результаты возвращаются
+в порядке строк фида, поэтому запись в БД совпадает с последовательным разбором.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+from .feeds import batched
+from .matcher import CachedMatcher, IngredientMatcher
+from .report import MATCH_CACHE_HITS, MATCH_CACHE_MISSES, ImportReport
+
+CHUNK_ROWS = 1000       # кол-во строк фида в пачке, передаваемой в процесс
+
+_matcher = None         # индекс ингредиентов процесса (CachedMatcher)
+
+
+def init_worker(ingredients, known):
+    """
+    Запуск процесса: построение индекса ингредиентов
+    :param ingredients: названия ингредиентов
+    :param known: сохраненные результаты поиска ингредиентов (MatchCache.known)
+    """
+    global _matcher
+    django.setup()
+    _matcher = CachedMatcher(IngredientMatcher(ingredients, cutoff=0.8), known)
+
+
+def parse_chunk(parse, rows):
+    """
+    Разбор пачки строк фида в процессе
+    :param parse: функция разбора строк фида (parse_products парсера магазина)
+    :return: данные продуктов, счетчики строк и новые результаты поиска ингредиентов
+    """
+    report = ImportReport()
+    hits, misses = _matcher.hits, _matcher.misses
+    records = list(parse(rows, _matcher, report))
+    report.count(MATCH_CACHE_HITS, _matcher.hits - hits)
+    report.count(MATCH_CACHE_MISSES, _matcher.misses - misses)
+    matches, _matcher.new = _matcher.new, {}
+    return records, report.counters, matches
+
+
+def parse_parallel(parse, rows, ingredients, known, workers, chunk_size=CHUNK_ROWS, report=None, matches=None):
+    """
+    Разбор строк фида в workers процессах. В обработке одновременно находится не больше 2 * workers пачек,
+    поэтому потребление памяти не зависит от размера фида.
+    :param parse: функция разбора строк фида parse(rows, matcher, report) уровня модуля
+    :param rows: итерируемый объект со строками фида
+    :param ingredients: названия ингредиентов
+    :param known: сохраненные результаты поиска ингредиентов (MatchCache.known)
+    :param report: отчет об импорте (ImportReport), в него добавляются счетчики строк из процессов
+    :param matches: словарь, в который добавляются новые результаты поиска ингредиентов
+    :return: генератор данных продуктов в порядке строк фида
+    """
+    def collect(future):
+        records, counters, new = future.result()
+        if report is not None:
+            report.counters.update(counters)
+        if matches is not None:
+            matches.update(new)
+        return records
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ingredients, known)) as executor:
+        pending = deque()
+        for chunk in batched(rows, chunk_size):
+            pending.append(executor.submit(parse_chunk, parse, chunk))
+            if len(pending) >= 2 * workers:
+                yield from collect(pending.popleft())
+        while pending:
+            yield from collect(pending.popleft())
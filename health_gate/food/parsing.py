@@ -0,0 +1,89 @@
+"""
+Разбор кол-ва товара и его меры веса/объема из названия продукта магазина.
+Используется всеми парсерами магазинов (management/commands).
+"""
+
+import re
+from decimal import Decimal
+
+# кол-во товара и его мера веса/объема в названии, например "Творог 5% - 200 г" или "Молоко 1,5 л"
+QTY_PATTERN = re.compile(r"(?P<qty>[0-9]*[.,]?[0-9]{1,3})[ ]?(?P<measure>кг|гр|г|ГР|л|мл|шт|штук)\b")
+
+DEFAULT_QTY = {'qty': 1.0, 'measure': 'кг.'}    # товар на развес
+
+# мера товара -> базовая единица (кг, л или шт) и кол-во базовых единиц в мере
+BASE_UNITS = {
+    'г': ('кг', 0.001),
+    'гр': ('кг', 0.001),
+    'ГР': ('кг', 0.001),
+    'кг': ('кг', 1),
+    'кг.': ('кг', 1),
+    'мл': ('л', 0.001),
+    'л': ('л', 1),
+    'шт': ('шт', 1),
+    'штук': ('шт', 1),
+}
+
+
+def find_quantity(name):
+    """
+    Поиск кол-ва товара и его меры веса/объема, явно указанных в имени товара.
+    Название разбирается за один проход: поиск останавливается на втором совпадении.
+    :return: словарь с ключами 'qty' - кол-во и 'measure' - мера, если в имени ровно одно указание кол-ва, иначе None
+    """
+    matches = QTY_PATTERN.finditer(name)
+    match = next(matches, None)
+    if match is None or next(matches, None) is not None:   # кол-во не указано или указано несколько раз
+        return None
+
+    qty = match['qty']
+    if qty[0] == '.':       # если в начале найденного кол-ва товара точка, убираем её
+        qty = qty[1:]
+    return {'qty': float(qty.replace(',', '.')), 'measure': match['measure']}
+
+
+def parse_quantity(name):
+    """
+    Метод нахождения меры веса или объема товара и его кол-во в имени товара.
+    Кроме явно указанного кол-ва учитываются товары десятками ("1 десяток") и на развес ("вес").
+    :return словарь с ключами 'qty' - кол-во и 'measure' - мера или None, если кол-во определить нельзя
+    """
+    qty = find_quantity(name)
+    if qty is not None:
+        return qty
+    if "1 десяток" in name:
+        return {'qty': 10.0, 'measure': 'шт'}
+    if "вес" in name:
+        return dict(DEFAULT_QTY)
+    return None
+
+
+def parse_quantities(names):
+    """
+    Пакетный разбор кол-ва товаров
+    :param names: итерируемый объект с именами товаров
+    :return: список результатов parse_quantity в том же порядке
+    """
+    return [parse_quantity(name) for name in names]
+
+
+def get_base_qty(qty, measure):
+    """
+    Кол-во товара в базовых единицах (кг, л или шт), например 200 г -> 0.2
+    :return: кол-во или None, если мера неизвестна или кол-во не указано
+    """
+    base = BASE_UNITS.get(measure)
+    if base is None or not qty or qty <= 0:
+        return None
+    return qty * base[1]
+
+
+def get_unit_price(price, base_qty):
+    """
+    Цена за базовую единицу (кг, л или шт), округленная до копеек
+    :param base_qty: кол-во товара в базовых единицах (результат get_base_qty)
+    :return: цена (Decimal) или None, если кол-во или цена неизвестны
+    """
+    if base_qty is None or not price:
+        return None
+    return (Decimal(str(price)) / Decimal(str(base_qty))).quantize(Decimal('0.01'))
@@ -0,0 +1,62 @@
+"""
+Рекомендации рецептов по тегам пользователя.
+Активные рецепты ранжируются по кол-ву совпадающих с тегами пользователя тегов (одним запросом с группировкой),
+при равенстве - от новых к старым. Список id рецептов кэшируется для каждого пользователя и сбрасывается
+при изменении тегов пользователя (только его список) или рецептов и их тегов (списки всех пользователей,
+через смену версии). Сброс выполняют обработчики сигналов в food/signals.py.
+Сигналы приходят только в процесс, изменивший данные, поэтому кэш должен быть общим для всех процессов
+(CACHES в settings.py), иначе остальные процессы отдают старые рекомендации до CACHE_TIMEOUT.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Recipe
+
+CACHE_TIMEOUT = 60 * 60         # время хранения рекомендаций пользователя, с
+VERSION_KEY = 'recommend:version'
+
+
+def get_version():
+    """Версия рецептов и их тегов, входит в ключи рекомендаций"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_cache_key(user_id):
+    return f'recommend:{get_version()}:{user_id}'
+
+
+def rank_recipes(user):
+    """
+    Активные рецепты, у которых есть хотя бы один тег пользователя, от лучшего совпадения к худшему
+    :return: QuerySet с аннотацией matches - кол-во совпавших тегов
+    """
+    return Recipe.objects.filter(is_active=True).annotate(
+        matches=Count('tags', filter=Q(tags__in=user.tags.all()), distinct=True)
+    ).filter(matches__gt=0).order_by('-matches', '-date_created', '-id')
+
+
+def get_recommended_ids(user):
+    """id рекомендованных пользователю рецептов в порядке ранжирования (из кэша, если он есть)"""
+    key = get_cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(rank_recipes(user).values_list('id', flat=True))
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_user(user_id):
+    """Сброс рекомендаций пользователя"""
+    cache.delete(get_cache_key(user_id))
+
+
+def invalidate_all():
+    """Сброс рекомендаций всех пользователей: ключи со старой версией больше не читаются"""
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
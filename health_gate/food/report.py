@@ -0,0 +1,150 @@
+"""
+Отчет об импорте каталога магазина: время этапов импорта, счетчики строк фида и кол-во запросов к БД по этапам.
+Этапы вложены друг в друга (например, разбор строки вызывает поиск ингредиента), время этапа учитывается
+без вложенных этапов, поэтому сумма времени этапов равна общему времени импорта.
+"""
+
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+STAGES = ('fetch', 'decode', 'parse', 'match', 'write')     # этапы импорта в порядке выполнения
+
+# счетчики строк фида
+ROWS = 'rows'                                   # все строки (товары) фида
+ACCEPTED = 'accepted'                           # сохраненные продукты
+REJECTED_CATEGORY = 'rejected_category'         # непродуктовая категория
+UNPARSABLE_QUANTITY = 'unparsable_quantity'     # в названии нет кол-ва товара
+UNMATCHED = 'unmatched'                         # ингредиент не найден
+MATCH_CACHE_HITS = 'match_cache_hits'           # результат поиска ингредиента взят из кэша (IngredientMatch)
+MATCH_CACHE_MISSES = 'match_cache_misses'       # выполнен нечеткий поиск ингредиента
+
+
+class ImportReport:
+    """
+    Отчет об импорте каталога одного магазина
+    """
+
+    def __init__(self, shop=None):
+        self.shop = shop
+        self.seconds = defaultdict(float)       # этап -> время, с
+        self.queries = Counter()                # этап -> кол-во запросов к БД
+        self.counters = Counter()               # счетчик строк фида -> кол-во
+        self.sync = None                        # синхронизатор каталога (ProductSync, PriceSync) после записи в БД
+        self._stack = []                        # выполняющиеся этапы, последний - текущий
+        self._started = None                    # начало текущего отрезка времени текущего этапа
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Выполнение этапа импорта. Время вложенного этапа не учитывается во времени внешнего этапа.
+        """
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._started
+        self._stack.append(name)
+        self._started = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.seconds[self._stack.pop()] += now - self._started
+            self._started = now
+
+    def iterate(self, name, iterable):
+        """
+        Перебор итерируемого объекта, получение каждого элемента - этап name.
+        Используется для генераторов (потоковое чтение, разбор), которые выполняются по частям.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def reader(self, name, file):
+        """Файловый объект, чтение из которого - этап name (например, ответ сервера при потоковом разборе)"""
+        return TimedReader(self, name, file)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def count_cache(self, matcher):
+        """Учет попаданий в кэш поиска ингредиентов (CachedMatcher)"""
+        self.count(MATCH_CACHE_HITS, matcher.hits)
+        self.count(MATCH_CACHE_MISSES, matcher.misses)
+
+    @contextmanager
+    def track_queries(self):
+        """
+        Подсчет запросов к БД по этапам импорта (запросы вне этапов учитываются в 'other')
+        """
+        def count_query(execute, sql, params, many, context):
+            self.queries[self._stack[-1] if self._stack else 'other'] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            yield
+
+    def merge(self, other):
+        """Добавление времени, запросов и счетчиков другого отчета (например, из процесса разбора фида)"""
+        for name, seconds in other.seconds.items():
+            self.seconds[name] += seconds
+        self.queries.update(other.queries)
+        self.counters.update(other.counters)
+
+    def as_dict(self):
+        stages = [name for name in STAGES if name in self.seconds or name in self.queries]
+        stages += sorted(name for name in set(self.seconds) | set(self.queries) if name not in STAGES)
+        report = {
+            'shop': self.shop,
+            'seconds': round(sum(self.seconds.values()), 3),
+            'stages': {name: {'seconds': round(self.seconds.get(name, 0.0), 3), 'queries': self.queries[name]}
+                       for name in stages},
+            'counters': dict(self.counters),
+        }
+        if self.sync is not None:
+            report['sync'] = self.sync.stats()
+        return report
+
+    def summary(self):
+        """Отчет одной строкой"""
+        report = self.as_dict()
+        parts = [f'{self.shop}: {report["seconds"]} с']
+        parts += [f'{name} {stage["seconds"]} с/{stage["queries"]} запр.' for name, stage in report['stages'].items()]
+        parts += [f'{name} {value}' for name, value in report['counters'].items()]
+        parts += [f'{name} {value}' for name, value in report.get('sync', {}).items()]
+        return ', '.join(parts)
+
+    def save(self, path):
+        save_reports(path, [self])
+
+    def __getstate__(self):         # отчет передается из процесса разбора фида без незавершенных этапов
+        state = self.__dict__.copy()
+        state['_stack'], state['_started'], state['sync'] = [], None, None
+        return state
+
+
+class TimedReader:
+    """Файловый объект, время чтения из которого учитывается в этапе отчета"""
+
+    def __init__(self, report, name, file):
+        self.report = report
+        self.name = name
+        self.file = file
+
+    def read(self, size=-1):
+        with self.report.stage(self.name):
+            return self.file.read(size)
+
+
+def save_reports(path, reports):
+    """Сохранение отчетов об импорте в файл в формате JSON"""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump([report.as_dict() for report in reports], file, ensure_ascii=False, indent=2)
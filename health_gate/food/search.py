@@ -0,0 +1,139 @@
+"""
+Полнотекстовый поиск продуктов по названию с ранжированием по релевантности.
+PostgreSQL: поиск по словам с русской морфологией (to_tsvector('russian', name)) и по сходству триграмм
+(pg_trgm, находит неполные слова и опечатки), оба условия выполняются по GIN-индексам.
+SQLite (локальная разработка): таблица FTS5 product_fts с поиском по префиксам слов, ранжирование bm25.
+На остальных БД - поиск по вхождению строки без ранжирования.
+Индексы создаются после migrate (ensure_search_index). Индексы PostgreSQL создаются средствами ORM из того же
+выражения SearchVector, что и в запросе search_products, иначе выражения индекса и запроса могут не совпасть
+и индекс не будет использоваться. В Meta модели они не объявлены, так как на SQLite индекс GIN не создать.
+Индексы PostgreSQL обновляются самой БД, таблица FTS5 -
+триггерами на таблице product, поэтому импорт каталогов (bulk_create/bulk_update) обновляет поиск в той же
+транзакции. Пересоздать индексы - python manage.py search_index --rebuild
+"""
+
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, Q
+from rest_framework import filters
+
+from .models import Product
+
+SEARCH_CONFIG = 'russian'       # конфигурация полнотекстового поиска PostgreSQL
+TRIGRAM_WEIGHT = 0.5            # вес сходства триграмм в ранге PostgreSQL относительно ранга по словам
+
+POSTGRES_INDEXES = [
+    GinIndex(SearchVector('name', config=SEARCH_CONFIG), name='product_name_fts_idx'),
+    GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'),      # нужен pg_trgm
+]
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "name, content='product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO product_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS product_fts_insert',
+    'DROP TRIGGER IF EXISTS product_fts_delete',
+    'DROP TRIGGER IF EXISTS product_fts_update',
+    'DROP TABLE IF EXISTS product_fts',
+]
+
+
+def has_sqlite_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")
+        return cursor.fetchone() is not None
+
+
+def ensure_postgres_index(connection, rebuild=False):
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        existing = connection.introspection.get_constraints(cursor, Product._meta.db_table)
+    with connection.schema_editor() as editor:
+        for index in POSTGRES_INDEXES:
+            if index.name in existing and rebuild:
+                editor.remove_index(Product, index)
+            if index.name not in existing or rebuild:
+                editor.add_index(Product, index)
+
+
+def ensure_sqlite_index(connection, rebuild=False):
+    with connection.cursor() as cursor:
+        if rebuild:
+            for sql in SQLITE_DROP:
+                cursor.execute(sql)
+        created = not has_sqlite_index(connection)
+        for sql in SQLITE_INDEX:
+            cursor.execute(sql)
+        if created:         # заполнение таблицы FTS5 продуктами, сохраненными до ее создания
+            cursor.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+
+def ensure_search_index(rebuild=False, using=DEFAULT_DB_ALIAS):
+    """
+    Создание индексов поиска, если их нет
+    :param rebuild: пересоздать индексы (например, если таблица FTS5 рассинхронизирована с product)
+    :param using: алиас БД
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        ensure_postgres_index(connection, rebuild)
+    elif connection.vendor == 'sqlite':
+        ensure_sqlite_index(connection, rebuild)
+
+
+def get_fts_query(term):
+    """
+    Запрос FTS5: все слова поисковой строки как префиксы, например 'молоко 3,2' -> '"молоко"* "3"* "2"*'
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', term))
+
+
+def search_products(queryset, term):
+    """
+    Продукты, найденные по названию, от более релевантных к менее релевантным
+    :param queryset: QuerySet продуктов
+    :param term: поисковая строка
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(term, config=SEARCH_CONFIG)
+        return queryset.annotate(search_vector=SearchVector('name', config=SEARCH_CONFIG)).annotate(
+            search_rank=SearchRank(F('search_vector'), query) + TRIGRAM_WEIGHT * TrigramSimilarity('name', term),
+        ).filter(Q(search_vector=query) | Q(name__trigram_similar=term)).order_by('-search_rank', 'pk')
+
+    if connection.vendor == 'sqlite':
+        query = get_fts_query(term)
+        if not query:
+            return queryset.none()
+        return queryset.extra(
+            tables=['product_fts'],
+            where=['product_fts.rowid = product.id', 'product_fts MATCH %s'],
+            params=[query],
+            select={'search_rank': 'product_fts.rank'},
+        ).order_by('search_rank', 'pk')
+
+    return queryset.filter(name__icontains=term).order_by('name', 'pk')
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Поиск продуктов с ранжированием (search_products) вместо поиска по вхождению SearchFilter.
+    Параметр запроса тот же - ?search=
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_products(queryset, ' '.join(terms))
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from .models import Ingredient, Recipe, IngredientRecipe, Comment, Product, CookStep, Category, Kitchen, Tag, Subtype, Filter
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from drf_extra_fields.fields import Base64ImageField
+from api.mixins import SparseFieldsSerializerMixin
 User = get_user_model()
 
 
@@ -39,18 +41,14 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'recipe', 'product', 'qty', 'unit']
 
 
-class IngredientProductSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Product
-        fields = ['id', 'name',  'picture', 'qty_per_item', 'price', 'shop_id']
-
-
 class IngredientRecipeWithProductSerializer(serializers.ModelSerializer):
-    product = IngredientProductSerializer()
+    # у ингредиента рецепта нет поля product, выводится общий ингредиент
+    ingredient = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    unit = serializers.ChoiceField(choices=IngredientRecipe.UNITS)
 
     class Meta:
         model = IngredientRecipe
-        fields = ['id',  'product', 'qty']
+        fields = ['id',  'ingredient', 'qty', 'unit']
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -82,8 +80,8 @@ class UserForRecipeSerializer(serializers.ModelSerializer):
 
 
 # ----------------------------------------------------Recipes Only-------------------------------------------------
-class RecipeListSerializer(serializers.ModelSerializer):
-    """Вывод списка рецептов"""
+class RecipeListSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """Вывод списка рецептов, поддерживает ?fields= и ?expand=owner (api/mixins.py)"""
     owner = UserForRecipeSerializer()
     category = serializers.SlugRelatedField(slug_field='name', queryset=Category.objects.all())
     kitchen = serializers.SlugRelatedField(slug_field='name', queryset=Kitchen.objects.all())
@@ -94,6 +92,23 @@ class RecipeListSerializer(serializers.ModelSerializer):
         model = Recipe
         exclude = ['is_active', 'date_created']
 
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=()):
+        """
+        Загрузка связанных объектов списка рецептов: автор, категория и кухня - в том же запросе, теги - одним
+        отдельным запросом, поэтому кол-во запросов не зависит от кол-ва рецептов
+        :param fields: выводимые поля, None - все; загружаются только выводимые связи
+        :param expand: раскрываемые связи, автор без expand выводится как id и не загружается
+        """
+        if fields is None:
+            return queryset.select_related('owner', 'category', 'kitchen').prefetch_related('tags')
+        related = [name for name in ('category', 'kitchen') if name in fields]
+        if 'owner' in fields and 'owner' in expand:
+            related.append('owner')
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.prefetch_related('tags') if 'tags' in fields else queryset
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Для создания рецепта"""
@@ -124,6 +139,20 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = '__all__'
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Загрузка вложенных объектов рецепта отдельным запросом на каждую связь: ингредиенты вместе с общими
+        ингредиентами, шаги и их продукты, комментарии вместе с авторами, теги.
+        Кол-во запросов не зависит от кол-ва ингредиентов, шагов и комментариев.
+        """
+        return queryset.select_related('owner', 'category', 'kitchen').prefetch_related(
+            'tags',
+            Prefetch('ingredients', queryset=IngredientRecipe.objects.select_related('ingredient')),
+            Prefetch('steps', queryset=CookStep.objects.prefetch_related('ingredients')),
+            Prefetch('comments', queryset=Comment.objects.select_related('author')),
+        )
+
 
 class RecipeSerializer(serializers.ModelSerializer):
     """для обновления рецепта"""
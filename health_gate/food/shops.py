@@ -0,0 +1,296 @@
+"""
+Адаптеры фидов магазинов и одновременный импорт каталогов нескольких магазинов.
+Импорт каждого магазина проходит три этапа:
+    1. загрузка фида в локальный файл (потоки, ввод-вывод);
+    2. разбор фида и поиск ингредиентов в отдельном процессе, результат пишется в промежуточный файл (JSON Lines);
+    3. запись продуктов из промежуточного файла в БД одной транзакцией на магазин (основной процесс).
+Этапы разных магазинов выполняются одновременно.
+Фид, не изменившийся с последнего успешного импорта (ответ 304 или тот же хэш содержимого), не разбирается
+и не записывается в БД, если с тех пор не изменились справочник ингредиентов и разбор фида (ShopFeed.parser_version).
+Для запуска - python manage.py import_catalog
+"""
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import django
+import requests
+from django.db import transaction
+
+from .catalog import ImportContext, MatchCache, ProductSync, get_ingredients_version, load_products
+from .feeds import CHUNK_SIZE, read_xml_catalog
+from .management.commands import bringstone, ecomarket, ecomarket_test
+from .matcher import CachedMatcher, IngredientMatcher
+from .models import FeedState, Ingredient
+from .report import ImportReport
+
+
+class ShopFeed:
+    """
+    Фид магазина. Источником может быть URL или путь к локальному файлу (например, в тестах).
+    Экземпляры передаются в процессы разбора, поэтому должны содержать только простые атрибуты.
+    """
+    name = None         # имя фида в import_catalog --shop
+    shop = None         # название магазина в Product.shop
+    url = None          # адрес фида по умолчанию
+    extension = None    # расширение файла фида
+    parser_version = 1  # версия разбора фида, увеличивается при изменении разбора, чтобы фид разобрался заново
+
+    def __init__(self, source=None):
+        self.source = source or self.url
+
+    @property
+    def is_local(self):
+        return not self.source.startswith(('http://', 'https://'))
+
+    def fetch(self, directory, state=None):
+        """
+        Загрузка фида в локальный файл по частям.
+        Если известно состояние фида после прошлого импорта, запрос к магазину отправляется условным
+        (If-None-Match / If-Modified-Since).
+        :param directory: каталог для загружаемого файла
+        :param state: состояние фида после прошлого импорта (FeedState) или None
+        :return: словарь с путем к файлу фида ('path', None - фид не изменился) и его состоянием
+                 ('etag', 'last_modified', 'content_hash') или None, если фид недоступен
+        """
+        if self.is_local:
+            return {'path': self.source, 'etag': '', 'last_modified': '', 'content_hash': get_file_hash(self.source)}
+
+        headers = {}
+        if state is not None and state.etag:
+            headers['If-None-Match'] = state.etag
+        if state is not None and state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        path = os.path.join(directory, f'{self.name}.{self.extension}')
+        digest = hashlib.sha256()
+        with requests.get(self.source, headers=headers, stream=True) as response:
+            if response.status_code == 304 and state is not None:
+                return {'path': None, 'etag': state.etag, 'last_modified': state.last_modified,
+                        'content_hash': state.content_hash}
+            if response.status_code != 200:
+                return None
+            with open(path, 'wb') as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+                    digest.update(chunk)
+            return {'path': path, 'etag': response.headers.get('ETag', ''),
+                    'last_modified': response.headers.get('Last-Modified', ''), 'content_hash': digest.hexdigest()}
+
+    def parse(self, path, matcher, report=None):
+        """
+        Разбор файла фида без обращения к БД
+        :param report: отчет об импорте (ImportReport)
+        :return: генератор данных продуктов (см. catalog.load_products)
+        """
+        raise NotImplementedError
+
+
+def get_file_hash(path):
+    """Хэш содержимого файла (SHA-256), файл читается по частям"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_current(feed, state, ingredients_version):
+    """
+    Прошлый импорт фида выполнен с тем же справочником ингредиентов и тем же разбором фида
+    :param state: состояние фида после прошлого импорта (FeedState) или None
+    :param ingredients_version: текущая версия справочника ингредиентов (catalog.get_ingredients_version)
+    """
+    return (state is not None and state.ingredients_version == ingredients_version
+            and state.parser_version == feed.parser_version)
+
+
+def is_unchanged(fetched, state):
+    """
+    Фид не изменился с последнего успешного импорта
+    :param fetched: результат ShopFeed.fetch
+    :param state: состояние фида после прошлого импорта (FeedState), если оно актуально (is_current), или None
+    """
+    return state is not None and (fetched['path'] is None or fetched['content_hash'] == state.content_hash)
+
+
+def save_validators(state, fetched):
+    """
+    Сохранение новых ETag и Last-Modified фида, содержимое которого не изменилось,
+    чтобы следующий запрос к магазину был условным с актуальными значениями
+    """
+    if (state.etag, state.last_modified) != (fetched['etag'], fetched['last_modified']):
+        state.etag, state.last_modified = fetched['etag'], fetched['last_modified']
+        state.save(update_fields=['etag', 'last_modified', 'imported'])
+
+
+class EcomarketFeed(ShopFeed):
+    """CSV-фид EcoMarket"""
+    name = 'ecomarket'
+    shop = ecomarket.SHOP
+    url = ecomarket.FEED_URL
+    extension = 'csv'
+
+    def read_rows(self, path, report=None):
+        """Построчное чтение файла фида"""
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = csv.DictReader(file, delimiter=';', fieldnames=ecomarket.FIELDNAMES)
+            if report is not None:
+                rows = report.iterate('decode', rows)
+            yield from rows
+
+    def parse(self, path, matcher, report=None):
+        yield from ecomarket.parse_products(self.read_rows(path, report), matcher, report)
+
+
+class EcomarketXmlFeed(ShopFeed):
+    """Тестовый XML-фид EcoMarket"""
+    name = 'ecomarket_test'
+    shop = ecomarket_test.SHOP
+    url = ecomarket_test.FEED_URL
+    extension = 'xml'
+
+    def parse(self, path, matcher, report=None):
+        with open(path, 'rb') as file:
+            categories, offers = read_xml_catalog(file, report=report)
+            categories = {category['id']: category['name'] for category in categories}
+            yield from ecomarket_test.parse_products(categories, offers, matcher, report)
+
+
+class BringstoneFeed(ShopFeed):
+    """YML-фид Bringstone"""
+    name = 'bringstone'
+    shop = bringstone.SHOP
+    url = bringstone.FEED_URL
+    extension = 'xml'
+
+    def parse(self, path, matcher, report=None):
+        with open(path, 'rb') as file:
+            categories, offers = read_xml_catalog(file, report=report)
+            categories = {category['@id']: category['#text'] for category in categories}
+            yield from bringstone.parse_products(categories, offers, matcher, report)
+
+
+# фиды, доступные для импорта: имя фида -> класс адаптера
+FEEDS = {feed.name: feed for feed in (EcomarketFeed, EcomarketXmlFeed, BringstoneFeed)}
+
+# фиды, импортируемые по умолчанию (ecomarket_test - тестовая выгрузка того же магазина, что и ecomarket)
+DEFAULT_FEEDS = ['ecomarket', 'bringstone']
+
+UNCHANGED = 'unchanged'     # результат импорта фида, не изменившегося с прошлого импорта
+
+
+def fetch_feed(feed, directory, state, report):
+    """Загрузка фида (ShopFeed.fetch) с учетом времени в отчете об импорте"""
+    with report.stage('fetch'):
+        return feed.fetch(directory, state)
+
+
+def stage_feed(feed, path, ingredients, staging_path, known):
+    """
+    Разбор фида в промежуточный файл. Выполняется в отдельном процессе, к БД не обращается.
+    :param ingredients: названия ингредиентов
+    :param known: сохраненные результаты поиска ингредиентов (MatchCache.known)
+    :return: отчет о разборе фида (ImportReport) и новые результаты поиска ингредиентов
+    """
+    report = ImportReport(feed.shop)
+    with report.stage('match'):
+        matcher = CachedMatcher(IngredientMatcher(ingredients, cutoff=0.8), known)
+    with report.stage('parse'), open(staging_path, 'w', encoding='utf-8') as staging:
+        for record in feed.parse(path, matcher, report):
+            staging.write(json.dumps(record, ensure_ascii=False) + '\n')
+    report.count_cache(matcher)
+    return report, matcher.new
+
+
+def read_staging(staging_path):
+    """Построчное чтение промежуточного файла"""
+    with open(staging_path, encoding='utf-8') as staging:
+        for line in staging:
+            yield json.loads(line)
+
+
+def commit_feed(feed, staging_path, fetched, report, cache, matches):
+    """
+    Запись продуктов магазина из промежуточного файла в БД одной транзакцией
+    вместе с новым состоянием фида и новыми результатами поиска ингредиентов
+    :param fetched: результат ShopFeed.fetch
+    :param report: отчет об импорте (ImportReport)
+    :param cache: сохраненные результаты поиска ингредиентов магазина (MatchCache)
+    :param matches: новые результаты поиска ингредиентов (CachedMatcher.new)
+    :return: синхронизатор каталога магазина со статистикой изменений
+    """
+    with report.track_queries(), transaction.atomic():
+        sync = ProductSync(feed.shop)
+        load_products(read_staging(staging_path), ImportContext(feed.shop), sync, report=report)
+        with report.stage('write'):
+            cache.save(matches)
+        FeedState.objects.update_or_create(feed=feed.name, defaults={
+            'etag': fetched['etag'], 'last_modified': fetched['last_modified'],
+            'content_hash': fetched['content_hash'], 'ingredients_version': cache.version,
+            'parser_version': feed.parser_version,
+        })
+    return sync
+
+
+def import_catalog(feeds, workers=None, force=False, reports=None):
+    """
+    Одновременный импорт каталогов магазинов: загрузка фидов в потоках, разбор в процессах,
+    запись в БД - по мере готовности магазинов, отдельной транзакцией на каждый магазин.
+    Ошибка одного магазина не влияет на импорт остальных.
+    :param feeds: экземпляры ShopFeed
+    :param workers: кол-во процессов разбора (по умолчанию - кол-во процессоров)
+    :param force: импортировать фиды, даже если они не изменились
+    :param reports: словарь, в который записываются отчеты об импорте: имя фида -> ImportReport
+    :return: словарь имя фида -> ProductSync, исключение, UNCHANGED или None (фид недоступен)
+    """
+    results = {}
+    reports = {} if reports is None else reports
+    ingredients = dict(Ingredient.objects.order_by().values_list('name', 'pk'))      # название -> id
+    version = get_ingredients_version(ingredients)
+    states = {} if force else FeedState.objects.in_bulk([feed.name for feed in feeds], field_name='feed')
+    # состояние, сохраненное с другим справочником ингредиентов или другим разбором, не используется:
+    # фид загружается без условного запроса и разбирается заново
+    states = {feed.name: states[feed.name] for feed in feeds if is_current(feed, states.get(feed.name), version)}
+
+    with tempfile.TemporaryDirectory() as directory, \
+            ThreadPoolExecutor(max_workers=len(feeds) or 1) as threads, \
+            ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as processes:
+        fetching = {}
+        for feed in feeds:
+            reports[feed.name] = ImportReport(feed.shop)
+            future = threads.submit(fetch_feed, feed, directory, states.get(feed.name), reports[feed.name])
+            fetching[future] = feed
+        parsing = {}
+        for future in as_completed(fetching):
+            feed = fetching[future]
+            try:
+                fetched = future.result()
+            except Exception as error:
+                results[feed.name] = error
+                continue
+            if fetched is None:
+                results[feed.name] = None
+                continue
+            if is_unchanged(fetched, states.get(feed.name)):
+                if fetched['path'] is not None:
+                    save_validators(states[feed.name], fetched)
+                results[feed.name] = UNCHANGED
+                continue
+            staging_path = os.path.join(directory, f'{feed.name}.jsonl')
+            cache = MatchCache(feed.shop, ingredients)
+            future = processes.submit(stage_feed, feed, fetched['path'], list(ingredients), staging_path, cache.known)
+            parsing[future] = (feed, staging_path, fetched, cache)
+
+        for future in as_completed(parsing):
+            feed, staging_path, fetched, cache = parsing[future]
+            try:
+                report, matches = future.result()
+                reports[feed.name].merge(report)
+                results[feed.name] = commit_feed(feed, staging_path, fetched, reports[feed.name], cache, matches)
+            except Exception as error:
+                results[feed.name] = error
+    return results
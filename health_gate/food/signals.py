@@ -0,0 +1,90 @@
+"""
+Обработчики сигналов изменения тегов пользователей и рецептов:
+сброс кэша рекомендаций рецептов (food/recommendations.py) и обновление индекса тегов (food/tag_index.py),
+смена версии кэша справочников (food/taxonomy.py).
+Кэши сбрасываются после фиксации транзакции (transaction.on_commit): при сбросе до фиксации параллельный запрос
+успел бы прочитать старые данные и снова записать их в кэш, где они остались бы до истечения времени хранения.
+Вне транзакции сброс выполняется сразу.
+Обработчики подключаются в FoodConfig.ready.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import taxonomy
+from .models import Category, Filter, Kitchen, Recipe, Subtype, Tag
+from .recommendations import invalidate_all, invalidate_user
+from .tag_index import tag_index
+
+User = get_user_model()
+
+CHANGED = ('post_add', 'post_remove', 'post_clear')     # действия m2m_changed после изменения связей
+
+
+@receiver(m2m_changed, sender=User.tags.through)
+def user_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Теги пользователя изменены: сбрасываются рекомендации пользователя (или всех, если изменены через тег)"""
+    if action not in CHANGED:
+        return
+    if reverse:
+        transaction.on_commit(invalidate_all)
+    else:
+        user_id = instance.pk
+        transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in CHANGED:
+        return
+    transaction.on_commit(invalidate_all)
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set is not None:        # изменены рецепты тега
+        recipe_ids = list(pk_set)
+    else:                           # у тега удалены все рецепты, их id неизвестны
+        transaction.on_commit(tag_index.reset)
+        return
+    transaction.on_commit(lambda: tag_index.refresh_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+def recipe_changed(sender, **kwargs):
+    """Рецепт создан, изменен (например, прошел модерацию) или удален, удален тег (вместе со связями)"""
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: tag_index.set_recipe(recipe_id, None))
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    tag_id, subtype_id = instance.pk, instance.subtype_id
+    transaction.on_commit(lambda: tag_index.set_tag(tag_id, subtype_id))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    tag_id = instance.pk
+    transaction.on_commit(lambda: tag_index.remove_tag(tag_id))
+
+
+@receiver(post_save, sender=Filter)
+@receiver(post_delete, sender=Filter)
+@receiver(post_save, sender=Subtype)
+@receiver(post_delete, sender=Subtype)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Kitchen)
+@receiver(post_delete, sender=Kitchen)
+def taxonomy_changed(sender, **kwargs):
+    transaction.on_commit(taxonomy.invalidate)
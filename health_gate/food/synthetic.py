@@ -0,0 +1,121 @@
+"""
+Генератор синтетических данных для замеров производительности импорта.
+Названия продуктов и ингредиентов похожи на данные фидов магазинов: русские названия, бренды, граммовка.
+"""
+
+import csv
+import io
+import random
+
+# префикс магазинов и телефонов пользователей замеров, не совпадающий с данными импорта и реальными пользователями
+PREFIX = 'bench:'
+
+PRODUCTS = [
+    'молоко', 'кефир', 'йогурт', 'творог', 'сметана', 'сливки', 'масло сливочное', 'масло оливковое',
+    'масло подсолнечное', 'сыр', 'яйцо куриное', 'мука пшеничная', 'мука рисовая', 'рис', 'гречка', 'овсянка',
+    'пшено', 'булгур', 'киноа', 'чечевица', 'нут', 'фасоль', 'горох', 'макароны', 'спагетти', 'хлеб', 'лаваш',
+    'сахар', 'соль', 'мед', 'шоколад', 'какао', 'кофе', 'чай', 'орехи грецкие', 'миндаль', 'фундук', 'кешью',
+    'изюм', 'курага', 'чернослив', 'финики', 'яблоки', 'груши', 'бананы', 'апельсины', 'лимоны', 'томаты',
+    'огурцы', 'картофель', 'морковь', 'лук репчатый', 'чеснок', 'капуста', 'свекла', 'кабачки', 'баклажаны',
+    'перец болгарский', 'шпинат', 'петрушка', 'укроп', 'базилик', 'курица', 'филе куриное', 'говядина',
+    'свинина', 'индейка', 'лосось', 'треска', 'креветки', 'тофу', 'соус соевый', 'уксус яблочный', 'горчица',
+    'кетчуп', 'майонез', 'паста томатная', 'вода минеральная', 'сок яблочный', 'фрикадельки', 'пельмени',
+]
+
+ADJECTIVES = [
+    'органический', 'фермерский', 'домашний', 'отборный', 'натуральный', 'классический', 'высший сорт',
+    'без глютена', 'цельнозерновой', 'обезжиренный', 'копченый', 'свежий', 'замороженный', 'сушеный',
+]
+
+BRANDS = ['Ecomarket.ru', 'Братья Чебурашкины', 'Вкусвилл', 'Alpro', 'Дядя Ваня', 'Organic Life', 'Рустик']
+
+CATEGORIES = [
+    'Молочные продукты', 'Бакалея', 'Крупы и макароны', 'Овощи и фрукты', 'Мясо и птица', 'Рыба и морепродукты',
+    'Хлеб и выпечка', 'Сладости', 'Чай и кофе', 'Соусы и специи', 'Орехи и сухофрукты', 'Напитки',
+    'Замороженные продукты',
+]
+
+UNITS = [('г', (50, 1000)), ('кг', (1, 5)), ('мл', (100, 1000)), ('л', (1, 3)), ('шт', (1, 30))]
+
+
+def ingredient_names(count=None, seed=0):
+    """
+    Названия ингредиентов: базовые продукты и их разновидности (как в справочнике ингредиентов)
+    :param count: кол-во названий, по умолчанию только базовые продукты
+    """
+    rnd = random.Random(seed)
+    names = list(PRODUCTS)
+    while count is not None and len(names) < count:
+        names.append(f'{rnd.choice(PRODUCTS)} {rnd.choice(ADJECTIVES)} {len(names)}')
+    return names[:count] if count is not None else names
+
+
+def product_name(rnd):
+    """Название продукта магазина, например 'Творог домашний Вкусвилл - 200 г'"""
+    unit, (low, high) = rnd.choice(UNITS)
+    qty = rnd.randint(low, high)
+    if unit in ('кг', 'л') and rnd.random() < 0.3:
+        qty = f'{qty},{rnd.randint(1, 9)}'
+    name = rnd.choice(PRODUCTS).capitalize()
+    if rnd.random() < 0.7:
+        name = f'{name} {rnd.choice(ADJECTIVES)}'
+    variant = rnd.random()
+    if variant < 0.05:
+        return f'{name} {rnd.choice(BRANDS)}, вес'
+    if variant < 0.08:
+        return f'{name} {rnd.choice(BRANDS)} 1 десяток'
+    if variant < 0.12:
+        return f'{name} {rnd.choice(BRANDS)}'      # без граммовки
+    return f'{name} {rnd.choice(BRANDS)} - {qty} {unit}'
+
+
+def product_names(count, seed=0):
+    """Список из count названий продуктов"""
+    rnd = random.Random(seed)
+    return [product_name(rnd) for _ in range(count)]
+
+
+def yml_feed(count, seed=0, categories=50):
+    """
+    YML-фид в формате Bringstone с count товарами
+    :return: генератор строк фида (для записи в файл без построения всего фида в памяти)
+    """
+    rnd = random.Random(seed)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<yml_catalog date="2021-11-02 13:02"><shop><name>Bringston</name>\n'
+    yield '<categories>\n'
+    for number in range(1, categories + 1):
+        yield f'<category id="{number}" parentId="">Категория {number}</category>\n'
+    yield '</categories>\n<offers>\n'
+    for number in range(1, count + 1):
+        yield (
+            f'<offer id="{number}" available="true"><url>https://bringston.ru/catalog/{number}/</url>'
+            f'<price>{rnd.randint(50, 3000)}.{rnd.randint(0, 99):02}</price><currencyId>RUB</currencyId>'
+            f'<categoryId>{rnd.randint(1, categories)}</categoryId>'
+            f'<picture>https://bringston.ru/upload/{number}.jpg</picture><name>{product_name(rnd)}</name>'
+            f'<param name="Калорийность">{rnd.randint(10, 900)} ккал</param>'
+            f'<param name="Жиры">{rnd.randint(0, 99)},{rnd.randint(0, 9)} г</param>'
+            f'<param name="Белки">{rnd.randint(0, 99)},{rnd.randint(0, 9)} г</param>'
+            f'<param name="Углеводы">{rnd.randint(0, 99)},{rnd.randint(0, 9)} г</param></offer>\n'
+        )
+    yield '</offers></shop></yml_catalog>\n'
+
+
+def ecomarket_feed(count, seed=0):
+    """
+    CSV-фид в формате EcoMarket (22 колонки без заголовка, разделитель ';') с count товарами
+    :return: генератор строк фида (для записи в файл без построения всего фида в памяти)
+    """
+    rnd = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    for number in range(1, count + 1):
+        row = [''] * 22
+        row[4], row[5], row[7] = number, product_name(rnd), 'Ecomarket'
+        row[8], row[9], row[11] = 'шт', 1, rnd.randint(0, 50)
+        row[12], row[14] = f'{rnd.randint(50, 3000)}.{rnd.randint(0, 99):02}', f'https://ecomarket.ru/{number}.jpg'
+        row[16], row[17], row[18] = [f'{rnd.randint(0, 99)},{rnd.randint(0, 9)} г.' for _ in range(3)]
+        row[19], row[20] = f'{rnd.randint(10, 900)} кКал.', rnd.choice(CATEGORIES)
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,134 @@
+"""
+Индекс тегов рецептов в памяти процесса для фильтрации рецептов по тегам (Filter -> Subtype -> Tag).
+Для каждого тега хранится битовая маска (int) id рецептов с этим тегом: бит N установлен, если у рецепта
+с id N есть тег. Условия И/ИЛИ по тегам вычисляются операциями & и | над масками без обращения к БД,
+из БД затем загружается только страница найденных рецептов.
+Индекс строится при первом обращении двумя запросами и обновляется по сигналам изменения рецептов и их тегов
+(food/signals.py). Сигналы приходят только в процесс, изменивший данные, поэтому индексы других процессов
+перестраиваются не реже одного раза в MAX_AGE секунд.
+"""
+
+import threading
+import time
+
+from .models import Recipe, Tag
+
+MAX_AGE = 5 * 60        # время жизни индекса, с
+
+
+def iter_bits(mask):
+    """Номера установленных битов маски по возрастанию (поиск выполняется по двоичной записи маски)"""
+    bits = bin(mask)[:1:-1]         # младший бит - первый символ
+    position = bits.find('1')
+    while position != -1:
+        yield position
+        position = bits.find('1', position + 1)
+
+
+class TagIndex:
+    """
+    Битовые маски рецептов по тегам.
+        index = TagIndex()
+        ids = index.select(all_tags=[1, 2], any_tags=[[3, 4]])    # рецепты с тегами 1 и 2 и с тегом 3 или 4
+    """
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.masks = {}             # id тега -> маска id рецептов
+        self.recipe_tags = {}       # id рецепта -> id его тегов
+        self.subtypes = {}          # id подтипа -> id его тегов
+        self.built = None           # время построения индекса
+
+    def build(self):
+        """Построение индекса по БД"""
+        masks = {}
+        recipe_tags = {}
+        rows = Recipe.tags.through.objects.values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in rows.iterator():
+            masks[tag_id] = masks.get(tag_id, 0) | 1 << recipe_id
+            recipe_tags.setdefault(recipe_id, set()).add(tag_id)
+        subtypes = {}
+        for tag_id, subtype_id in Tag.objects.order_by().values_list('id', 'subtype_id'):
+            subtypes.setdefault(subtype_id, set()).add(tag_id)
+        with self.lock:
+            self.masks, self.recipe_tags, self.subtypes = masks, recipe_tags, subtypes
+            self.built = time.monotonic()
+
+    def ensure_built(self):
+        if self.built is None or time.monotonic() - self.built > self.max_age:
+            self.build()
+
+    def reset(self):
+        """Индекс будет перестроен при следующем обращении"""
+        with self.lock:
+            self.built = None
+
+    def set_recipe(self, recipe_id, tag_ids):
+        """
+        Замена тегов рецепта в индексе
+        :param tag_ids: id тегов рецепта или None, если рецепт удален
+        """
+        with self.lock:
+            if self.built is None:      # индекс еще не построен, изменение будет учтено при построении
+                return
+            bit = 1 << recipe_id
+            for tag_id in self.recipe_tags.pop(recipe_id, ()):
+                self.masks[tag_id] &= ~bit
+            if tag_ids:
+                self.recipe_tags[recipe_id] = set(tag_ids)
+                for tag_id in tag_ids:
+                    self.masks[tag_id] = self.masks.get(tag_id, 0) | bit
+
+    def refresh_recipes(self, recipe_ids):
+        """Перечитывание тегов рецептов из БД одним запросом"""
+        if self.built is None:
+            return
+        tags = {recipe_id: set() for recipe_id in recipe_ids}
+        rows = Recipe.tags.through.objects.filter(recipe_id__in=tags).values_list('recipe_id', 'tag_id')
+        for recipe_id, tag_id in rows:
+            tags[recipe_id].add(tag_id)
+        for recipe_id, tag_ids in tags.items():
+            self.set_recipe(recipe_id, tag_ids)
+
+    def set_tag(self, tag_id, subtype_id):
+        """Новый тег или смена подтипа тега"""
+        with self.lock:
+            for tags in self.subtypes.values():
+                tags.discard(tag_id)
+            self.subtypes.setdefault(subtype_id, set()).add(tag_id)
+
+    def remove_tag(self, tag_id):
+        with self.lock:
+            mask = self.masks.pop(tag_id, 0)
+            for recipe_id in iter_bits(mask):
+                self.recipe_tags.get(recipe_id, set()).discard(tag_id)
+            for tags in self.subtypes.values():
+                tags.discard(tag_id)
+
+    def get_subtype_tags(self, subtype_id):
+        self.ensure_built()
+        return self.subtypes.get(subtype_id, set())
+
+    def select(self, all_tags=(), any_tags=()):
+        """
+        Поиск рецептов по тегам
+        :param all_tags: id тегов, которые должны быть у рецепта все
+        :param any_tags: группы id тегов, из каждой группы у рецепта должен быть хотя бы один тег
+        :return: id рецептов по возрастанию
+        """
+        self.ensure_built()
+        with self.lock:
+            mask = None
+            for tag_id in all_tags:
+                tag_mask = self.masks.get(tag_id, 0)
+                mask = tag_mask if mask is None else mask & tag_mask
+            for group in any_tags:
+                group_mask = 0
+                for tag_id in group:
+                    group_mask |= self.masks.get(tag_id, 0)
+                mask = group_mask if mask is None else mask & group_mask
+        return list(iter_bits(mask or 0))
+
+
+tag_index = TagIndex()      # индекс процесса
@@ -0,0 +1,96 @@
+"""
+Кэш справочников (фильтры, подтипы и теги, категории рецептов и кухни) для эндпоинтов, которые приложение
+запрашивает при каждом запуске. Ответ эндпоинта хранится в кэше готовым JSON вместе с ETag (хэш содержимого)
+под текущей версией справочников. Версия меняется при любом сохранении или удалении Filter, Subtype, Tag,
+Category или Kitchen (food/signals.py), ответы со старой версией больше не читаются.
+Ответ содержит абсолютные адреса файлов (иконки подтипов строятся по адресу запроса), поэтому ключ ответа
+включает схему и хост запроса.
+Сигналы приходят только в процесс, изменивший данные, поэтому кэш общий для всех процессов (CACHES в settings.py).
+Дополнительно версия хранится не дольше MAX_AGE секунд: если кэш не общий (например, LocMemCache при разработке)
+или изменение прошло мимо сигналов (update(), правка в БД), старые ответы отдаются не дольше MAX_AGE.
+Общий кэш по умолчанию хранится в БД, поэтому процесс держит у себя копию версии и ответов (LocalCopy)
+и перечитывает версию из общего кэша не чаще раза в LOCAL_MAX_AGE секунд. Повторный запрос с совпавшим
+If-None-Match получает 304 без обращения к БД и общему кэшу, изменения из других процессов видны
+через LOCAL_MAX_AGE, в процессе, изменившем данные, - сразу.
+ETag зависит только от содержимого ответа, поэтому после смены версии без изменений клиенты по-прежнему получают 304.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = 'taxonomy:version'
+MAX_AGE = 10 * 60       # время жизни версии справочников и ответов, с
+LOCAL_MAX_AGE = 5       # время, в течение которого процесс не перечитывает версию из общего кэша, с
+
+
+def get_version():
+    """Версия справочников, входит в ключи ответов"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=MAX_AGE)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+class LocalCopy:
+    """Версия справочников и ответы текущей версии в памяти процесса"""
+
+    def __init__(self, max_age=LOCAL_MAX_AGE):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = None         # время чтения версии из общего кэша
+        self.responses = {}         # ключ ответа -> (ETag, тело)
+
+    def get_version(self):
+        with self.lock:
+            if self.checked is not None and time.monotonic() - self.checked <= self.max_age:
+                return self.version
+        version = get_version()
+        with self.lock:
+            if version != self.version:
+                self.version, self.responses = version, {}
+            self.checked = time.monotonic()
+        return version
+
+    def clear(self):
+        with self.lock:
+            self.version, self.checked, self.responses = None, None, {}
+
+
+local = LocalCopy()     # копия процесса
+
+
+def invalidate():
+    cache.set(VERSION_KEY, time.time_ns(), timeout=MAX_AGE)
+    local.clear()
+
+
+def get_cached_response(request, name, build):
+    """
+    Ответ эндпоинта справочника из кэша
+    :param name: имя справочника в ключе кэша
+    :param build: функция без аргументов, возвращающая данные ответа (вызывается, если ответа нет в кэше)
+    """
+    key = f'taxonomy:{local.get_version()}:{request.scheme}://{request.get_host()}:{name}'
+    cached = local.responses.get(key)
+    if cached is None:
+        cached = cache.get(key)
+        if cached is None:
+            body = JSONRenderer().render(build())
+            cached = (f'"{hashlib.sha256(body).hexdigest()}"', body)
+            cache.set(key, cached, timeout=MAX_AGE)
+        local.responses[key] = cached
+    etag, body = cached
+
+    if etag in [value.strip() for value in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
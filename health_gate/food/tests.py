@@ -1,3 +1,1253 @@
-from django.test import TestCase
+import csv
+import difflib
+import hashlib
+from decimal import Decimal
+import io
+import json
+import os
+import pickle
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from requests.models import Response
+from rest_framework.test import APIClient
+import xmltodict
+
+from api.pagination import CursorPagination
+from . import recommendations, taxonomy
+from .analogs import build_analogs, get_analogs, get_product_analogs
+from .catalog import ImportContext, PriceSync, ProductSync, get_ingredients_version
+from .feeds import iter_csv_rows, batched, read_xml_catalog
+from .matcher import CachedMatcher, IngredientMatcher
+from .management.commands import bringstone, ecomarket
+from .management.commands.bench_queries import is_full_scan
+from .management.commands.ingredients import load_ingredients, read_ingredients
+from .management.commands.unit_prices import update_unit_prices
+from .models import (
+    Category, CategoryProduct, Comment, CookStep, FeedState, Filter, Ingredient, IngredientMatch, IngredientRecipe,
+    Kitchen, Product, Recipe, Subtype, Tag
+)
+from .parallel import parse_parallel
+from .parsing import find_quantity, get_base_qty, get_unit_price, parse_quantity, parse_quantities
+from .report import ImportReport
+from .search import ensure_search_index, get_fts_query, search_products
+from .serializers import RecipeListSerializer
+from .shops import UNCHANGED, BringstoneFeed, EcomarketFeed, import_catalog
+from .synthetic import ecomarket_feed as synthetic_ecomarket_feed, ingredient_names, product_names, yml_feed
+from .tag_index import iter_bits, tag_index
+
+
+# кэш в памяти процесса для тестов, где считаются запросы к БД: запросы к кэшу в таблице БД в них не учитываются
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_response(content):
+    """Потоковый ответ requests с заданным телом"""
+    response = Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(content)
+    return response
+
+
+class StreamingFeedTests(SimpleTestCase):
+    """Потоковое чтение фидов"""
+
+    def test_csv_rows_are_decoded_across_chunk_boundaries(self):
+        content = 'id;name\n1;Молоко 1 л\n2;"Сыр; твердый 200 г"\n'.encode('utf-8')
+        # части по 3 байта режут двухбайтовые символы кириллицы пополам
+        rows = list(iter_csv_rows(make_response(content), ['id', 'name'], chunk_size=3))
+        self.assertEqual(
+            [(row['id'], row['name']) for row in rows],
+            [('id', 'name'), ('1', 'Молоко 1 л'), ('2', 'Сыр; твердый 200 г')]
+        )
+
+    def test_xml_catalog_is_read_like_xmltodict(self):
+        content = ''.join(yml_feed(50, categories=5)).encode('utf-8')
+        shop = xmltodict.parse(content)['yml_catalog']['shop']
+        response = make_response(content)
+        categories, offers = read_xml_catalog(response.raw)
+        self.assertEqual(categories, shop['categories']['category'])
+        self.assertEqual(list(offers), shop['offers']['offer'])
+
+    def test_xml_catalog_without_offers(self):
+        content = b'<shop><categories><category id="1">Bakery</category></categories><offers/></shop>'
+        categories, offers = read_xml_catalog(io.BytesIO(content))
+        self.assertEqual(categories, [{'@id': '1', '#text': 'Bakery'}])
+        self.assertEqual(list(offers), [])
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(batched([], 2)), [])
+
+
+class ProductSyncTests(TestCase):
+    """Инкрементальная синхронизация каталога магазина"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredient = Ingredient.objects.create(name='молоко')
+
+    def make_product(self, shop_id, price, name='Молоко 1 л'):
+        return Product(ingredient=self.ingredient, shop_id=shop_id, name=name, price=price, qty_per_item=1.0, unit='л')
+
+    def sync(self, products, shop='Ecomarket'):
+        sync = ProductSync(shop)
+        sync.add(products)
+        sync.finish()
+        return sync
+
+    def test_reimport_writes_only_changes(self):
+        self.sync([self.make_product(1, 99.9), self.make_product(2, 50)])
+        pks = dict(Product.objects.values_list('shop_id', 'pk'))
+
+        sync = self.sync([self.make_product(1, 99.9), self.make_product(2, 55.5), self.make_product(3, 10)])
+
+        self.assertEqual((sync.created, sync.updated, sync.unchanged, sync.disabled), (1, 1, 1, 0))
+        self.assertEqual(Product.objects.get(shop_id=1).pk, pks[1])
+        self.assertEqual(Product.objects.get(shop_id=2).pk, pks[2])
+        self.assertEqual(float(Product.objects.get(shop_id=2).price), 55.5)
+        self.assertEqual(Product.objects.get(shop_id=2).unit_price, Decimal('55.50'))
+
+    def test_missing_products_become_unavailable(self):
+        self.sync([self.make_product(1, 10), self.make_product(2, 20)])
+        self.sync([self.make_product(1, 10)], shop='Bringstone')
+
+        sync = self.sync([self.make_product(2, 20)])
+
+        self.assertEqual(sync.disabled, 1)
+        self.assertFalse(Product.objects.get(shop='Ecomarket', shop_id=1).available)
+        self.assertTrue(Product.objects.get(shop='Bringstone', shop_id=1).available)
+
+        sync = self.sync([self.make_product(1, 10), self.make_product(2, 20)])
+        self.assertEqual(sync.updated, 1)
+        self.assertTrue(Product.objects.get(shop='Ecomarket', shop_id=1).available)
+
+
+class IngredientMatcherTests(SimpleTestCase):
+    """Поиск ингредиентов по индексу биграмм"""
+
+    def test_same_matches_as_difflib(self):
+        ingredients = ingredient_names(300) + ['д', 'ий', 'рисы', 'сырок']
+        matcher = IngredientMatcher(ingredients)
+        words = [' '.join(name.split()[:2]) for name in product_names(200)] + ['д', 'и', 'рисс', 'сыры', 'ы']
+        for cutoff in (0.6, 0.8, 0.9):
+            for word in words:
+                self.assertEqual(
+                    matcher.get_close_matches(word, n=3, cutoff=cutoff),
+                    difflib.get_close_matches(word, ingredients, n=3, cutoff=cutoff),
+                )
+
+    def test_match(self):
+        matcher = IngredientMatcher(['молоко', 'мука пшеничная', 'мука рисовая'])
+        self.assertEqual(matcher.match('Мука пшеничная'), 'мука пшеничная')
+        self.assertEqual(matcher.match('Молоко'), 'молоко')
+        self.assertIsNone(matcher.match('Шоколад'))
+
+
+class QuantityParsingTests(SimpleTestCase):
+    """Разбор кол-ва и меры товара из названия"""
+
+    def test_parse_quantity(self):
+        self.assertEqual(parse_quantity('Фрикадельки фалафель Ecomarket.ru - 200 г'), {'qty': 200.0, 'measure': 'г'})
+        self.assertEqual(parse_quantity('Молоко 3,2% 1,5 л'), {'qty': 1.5, 'measure': 'л'})
+        self.assertEqual(parse_quantity('Чай зеленый 25штук'), {'qty': 25.0, 'measure': 'штук'})
+        self.assertEqual(parse_quantity('Яйцо куриное С0 1 десяток'), {'qty': 10.0, 'measure': 'шт'})
+        self.assertEqual(parse_quantity('Говядина вырезка, вес'), {'qty': 1.0, 'measure': 'кг.'})
+        self.assertIsNone(parse_quantity('Пирог с капустой'))
+        # кол-во указано несколько раз
+        self.assertIsNone(parse_quantity('Вода 0,5 л 12 шт'))
+
+    def test_find_quantity_ignores_fallbacks(self):
+        self.assertIsNone(find_quantity('Говядина вырезка, вес'))
+        self.assertEqual(find_quantity('Сок 0,25л'), {'qty': 0.25, 'measure': 'л'})
+
+    def test_parse_quantities(self):
+        names = ['Сыр 200 г', 'Хлеб']
+        self.assertEqual(parse_quantities(names), [{'qty': 200.0, 'measure': 'г'}, None])
+
+    def test_unit_price(self):
+        self.assertEqual(get_base_qty(200.0, 'г'), 0.2)
+        self.assertEqual(get_base_qty(500.0, 'мл'), 0.5)
+        self.assertEqual(get_base_qty(1.0, 'кг.'), 1.0)
+        self.assertEqual(get_base_qty(10.0, 'шт'), 10.0)
+        self.assertIsNone(get_base_qty(None, 'г'))
+        self.assertIsNone(get_base_qty(1.0, 'упак'))
+        self.assertEqual(get_unit_price(89.9, get_base_qty(200.0, 'г')), Decimal('449.50'))
+        self.assertEqual(get_unit_price(100, 3.0), Decimal('33.33'))
+        self.assertIsNone(get_unit_price(100, None))
+
+
+def ecomarket_row(shop_id, name, category, price='100.0', available_qty='4'):
+    """Строка CSV-фида EcoMarket"""
+    row = [''] * 22
+    row[4], row[5], row[7], row[11], row[12] = str(shop_id), name, 'Ecomarket', available_qty, price
+    row[16], row[17], row[18], row[19], row[20] = '"8,3 г."', '"1,9 г."', '"19,3 г."', '"127 кКал."', category
+    return ';'.join(row)
+
+
+def ecomarket_feed(rows):
+    return make_response('\n'.join(rows).encode('utf-8'))
+
+
+class EcomarketImportTests(TestCase):
+    """Импорт каталога EcoMarket"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='молоко')
+        Ingredient.objects.create(name='творог')
+
+    def run_import(self, rows, workers=None):
+        with mock.patch.object(ecomarket.requests, 'get', return_value=ecomarket_feed(rows)):
+            sync = ProductSync(ecomarket.SHOP)
+            ecomarket.get_products(sync, ImportContext(ecomarket.SHOP), self.report, workers)
+        return sync
+
+    def setUp(self):
+        self.report = ImportReport(ecomarket.SHOP)
+
+    def test_import(self):
+        self.run_import([
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты'),
+            ecomarket_row(3, 'Шампунь 250 мл', 'Уход за волосами'),     # непродуктовая категория
+            ecomarket_row(4, 'Кирпич 1 шт', 'Стройматериалы'),          # нет подходящего ингредиента
+        ])
+
+        products = Product.objects.order_by('shop_id')
+        self.assertEqual(
+            list(products.values_list('shop_id', 'ingredient__name', 'qty_per_item', 'unit')),
+            [(1, 'молоко', 1.0, 'л'), (2, 'творог', 200.0, 'г')]
+        )
+        self.assertEqual(set(CategoryProduct.objects.values_list('name', flat=True)),
+                         {'Молочные продукты', 'Стройматериалы'})
+        self.assertEqual(self.report.counters, {'rows': 4, 'accepted': 2, 'rejected_category': 1, 'unmatched': 1,
+                                                'match_cache_hits': 0, 'match_cache_misses': 6})
+        self.assertEqual(self.report.as_dict()['sync']['created'], 2)
+
+    def test_parallel_import(self):
+        sync = self.run_import([
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты'),
+            ecomarket_row(3, 'Кирпич 1 шт', 'Стройматериалы'),
+        ], workers=2)
+        self.assertEqual(sync.created, 2)
+        self.assertEqual(self.report.counters['unmatched'], 1)
+        self.assertEqual(IngredientMatch.objects.get(name='Творог').ingredient.name, 'творог')
+
+    def test_match_cache(self):
+        rows = [ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+                ecomarket_row(2, 'Кирпич 1 шт', 'Стройматериалы')]
+        self.run_import(rows)
+        # ключ кэша - очищенное название продукта (get_clear_product) и его первое слово
+        self.assertEqual(dict(IngredientMatch.objects.values_list('name', 'ingredient__name')),
+                         {'Молоко ': None, 'Молоко': 'молоко', 'Кирпич ': None, 'Кирпич': None})
+
+        # повторный импорт: все результаты поиска берутся из кэша
+        self.report = ImportReport(ecomarket.SHOP)
+        with mock.patch.object(IngredientMatcher, 'match') as match:
+            self.run_import(rows)
+        match.assert_not_called()
+        self.assertEqual(self.report.counters['match_cache_hits'], 4)
+
+        # справочник ингредиентов изменился: результаты поиска устарели
+        Ingredient.objects.create(name='кирпич')
+        self.report = ImportReport(ecomarket.SHOP)
+        self.run_import(rows)
+        self.assertEqual(self.report.counters['match_cache_misses'], 4)
+        self.assertEqual(IngredientMatch.objects.get(name='Кирпич').ingredient.name, 'кирпич')
+        self.assertEqual(Product.objects.filter(ingredient__name='кирпич').count(), 1)
+
+    def test_query_count_does_not_depend_on_feed_size(self):
+        # справочники, кэш поиска ингредиентов, категории и продукты пачки записываются фиксированным кол-вом запросов
+        rows = [ecomarket_row(i, f'Молоко {i} л', 'Молочные продукты') for i in range(1, 51)]
+        with self.assertNumQueries(9):
+            self.run_import(rows[:5])
+        Product.objects.all().delete()
+        CategoryProduct.objects.all().delete()
+        IngredientMatch.objects.all().delete()
+        with self.assertNumQueries(9):
+            self.run_import(rows)
+
+
+class PriceRefreshTests(TestCase):
+    """Быстрое обновление цен и наличия продуктов EcoMarket"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='молоко')
+        Ingredient.objects.create(name='творог')
+
+    def run_command(self, rows, *args):
+        with mock.patch.object(ecomarket.requests, 'get', return_value=ecomarket_feed(rows)):
+            call_command('ecomarket', *args, stdout=io.StringIO())
+
+    def test_prices_only(self):
+        self.run_command([
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты', available_qty='0'),
+        ])
+        self.assertEqual(list(Product.objects.order_by('shop_id').values_list('available', flat=True)), [True, False])
+
+        rows = [
+            ecomarket_row(1, 'Молоко 2,5% 1 л', 'Молочные продукты', price='89.90', available_qty='0'),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты', available_qty='0'),
+            ecomarket_row(3, 'Творог 5% - 200 г', 'Молочные продукты'),       # новый товар - только полным импортом
+        ]
+        sync = PriceSync(ecomarket.SHOP)
+        with mock.patch.object(ecomarket.requests, 'get', return_value=ecomarket_feed(rows)), \
+                mock.patch.object(ecomarket, 'get_organic') as get_organic, self.assertNumQueries(1):
+            ecomarket.get_prices(sync)
+        get_organic.assert_not_called()
+        self.assertEqual(sync.stats(), {'updated': 1, 'unchanged': 1, 'unknown': 1, 'invalid': 0})
+
+        self.assertEqual(
+            list(Product.objects.order_by('shop_id').values_list('shop_id', 'name', 'price', 'available')),
+            [(1, 'Молоко 3,2% 1 л', Decimal('89.90'), False), (2, 'Творог 9% - 200 г', Decimal('100.00'), False)]
+        )
+        self.assertEqual(list(Product.objects.order_by('shop_id').values_list('unit_price', flat=True)),
+                         [Decimal('89.90'), Decimal('500.00')])
+
+    def test_invalid_rows_are_skipped(self):
+        self.run_command([
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты'),
+        ])
+        rows = [
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты', price=''),
+            ecomarket_row(2, 'Творог 9% - 200 г', 'Молочные продукты', price='89.90'),
+            ecomarket_row(3, 'Мыло хозяйственное', 'Бытовая химия', price='цена по запросу'),
+            ecomarket_row('abc', 'Пакет', 'Упаковка', price='nan'),
+        ]
+        report = ImportReport(ecomarket.SHOP)
+        with mock.patch.object(ecomarket.requests, 'get', return_value=ecomarket_feed(rows)):
+            ecomarket.get_prices(PriceSync(ecomarket.SHOP), report)
+
+        self.assertEqual(report.as_dict()['sync'], {'updated': 1, 'unchanged': 0, 'unknown': 2, 'invalid': 1})
+        self.assertEqual(list(Product.objects.order_by('shop_id').values_list('price', flat=True)),
+                         [Decimal('100.00'), Decimal('89.90')])
+
+    def test_command_option(self):
+        self.run_command([ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты')])
+        self.run_command([ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты', price='120')], '--prices-only')
+        self.assertEqual(Product.objects.get().price, Decimal('120.00'))
+
+
+def bringstone_feed(offers):
+    """YML-фид Bringstone с товарами (id, название, цена)"""
+    items = ''.join(
+        f'<offer id="{shop_id}"><name>{name}</name><price>{price}</price><categoryId>17</categoryId>'
+        f'<param name="Калорийность">120 ккал</param><param name="Жиры">2,5 г</param></offer>'
+        for shop_id, name, price in offers
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><yml_catalog date="2021-11-02 13:02"><shop><name>Bringston</name>'
+        '<categories><category id="16" parentId="">Азиатская кухня</category>'
+        '<category id="17" parentId="">Бакалея</category></categories>'
+        f'<offers>{items}</offers></shop></yml_catalog>'
+    )
+
+
+class BringstoneImportTests(TestCase):
+    """Импорт каталога Bringstone из потокового ответа"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='рис басмати')
+
+    def test_import(self):
+        content = bringstone_feed([(10, 'Рис басмати 900 г', '250.50'), (11, 'Рис басмати', '99')])
+        feed = make_response(content.encode('utf-8'))
+        with mock.patch.object(bringstone.requests, 'get', return_value=feed):
+            sync = ProductSync(bringstone.SHOP)
+            bringstone.get_products(sync, ImportContext(bringstone.SHOP))
+
+        self.assertEqual(sync.created, 1)       # у второго товара нет граммовки
+        product = Product.objects.get()
+        self.assertEqual((product.shop_id, product.category.name, product.calories, product.fats, product.qty_per_item),
+                         (10, 'Бакалея', 120, 2.5, 900))
+        self.assertEqual(CategoryProduct.objects.count(), 2)
+
+
+class ImportCatalogTests(TestCase):
+    """Одновременный импорт каталогов из локальных файлов фидов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='молоко')
+        Ingredient.objects.create(name='рис басмати')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_feed(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_catalog(self):
+        ecomarket_path = self.write_feed('ecomarket.csv', '\n'.join([
+            ecomarket_row(1, 'Молоко 3,2% 1 л', 'Молочные продукты'),
+            ecomarket_row(2, 'Шампунь 250 мл', 'Уход за волосами'),
+        ]))
+        bringstone_path = self.write_feed('bringstone.xml', bringstone_feed([
+            (10, 'Рис басмати 900 г', '250.50'),
+            (11, 'Соус устричный 150 мл', '199'),
+        ]))
+        feeds = [EcomarketFeed(ecomarket_path), BringstoneFeed(bringstone_path),
+                 EcomarketFeed(os.path.join(self.directory, 'missing.csv'))]
+        feeds[2].name = 'broken'
+
+        reports = {}
+        results = import_catalog(feeds, workers=2, reports=reports)
+
+        self.assertEqual(results['ecomarket'].created, 1)
+        self.assertEqual(results['bringstone'].created, 1)
+        self.assertIsInstance(results['broken'], FileNotFoundError)
+        products = Product.objects.order_by('shop')
+        self.assertEqual(
+            list(products.values_list('shop', 'shop_id', 'ingredient__name', 'fats', 'price')),
+            [('Bringstone', 10, 'рис басмати', 2.5, Decimal('250.50')),
+             ('Ecomarket', 1, 'молоко', 1.9, Decimal('100.00'))]
+        )
+        self.assertTrue(CategoryProduct.objects.filter(name='Азиатская кухня').exists())
+        self.assertEqual(reports['bringstone'].counters, {'rows': 2, 'accepted': 1, 'unmatched': 1,
+                                                          'match_cache_hits': 0, 'match_cache_misses': 3})
+        stages = reports['bringstone'].as_dict()['stages']
+        self.assertLessEqual({'fetch', 'decode', 'parse', 'match', 'write'}, set(stages))
+        self.assertGreater(stages['write']['queries'], 0)
+
+    def test_unchanged_feed_is_skipped(self):
+        path = self.write_feed('bringstone.xml', bringstone_feed([(10, 'Рис басмати 900 г', '250.50')]))
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'].created, 1)
+
+        # фид не изменился: в БД только чтение ингредиентов и состояния фида
+        with self.assertNumQueries(2):
+            self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'], UNCHANGED)
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1, force=True)['bringstone'].unchanged, 1)
+
+        self.write_feed('bringstone.xml', bringstone_feed([(10, 'Рис басмати 900 г', '199.00')]))
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'].updated, 1)
+        self.assertEqual(Product.objects.get().price, Decimal('199.00'))
+
+    def test_feed_is_reparsed_after_ingredients_or_parser_change(self):
+        path = self.write_feed('bringstone.xml', bringstone_feed([(10, 'Соус устричный 150 мл', '199')]))
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'].created, 0)
+
+        Ingredient.objects.create(name='соус устричный')
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'].created, 1)
+        self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'], UNCHANGED)
+
+        with mock.patch.object(BringstoneFeed, 'parser_version', BringstoneFeed.parser_version + 1):
+            self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'].unchanged, 1)
+            self.assertEqual(import_catalog([BringstoneFeed(path)], workers=1)['bringstone'], UNCHANGED)
+
+    def test_unchanged_feed_saves_new_validators(self):
+        body = b'<yml_catalog/>'
+        response = make_response(body)
+        response.headers.update({'ETag': '"v2"', 'Last-Modified': 'Wed, 03 Nov 2021 13:02:00 GMT'})
+        FeedState.objects.create(feed='bringstone', etag='"v1"', content_hash=hashlib.sha256(body).hexdigest(),
+                                 ingredients_version=get_ingredients_version(['молоко', 'рис басмати']),
+                                 parser_version=BringstoneFeed.parser_version)
+        with mock.patch('food.shops.requests.get', return_value=response):
+            self.assertEqual(import_catalog([BringstoneFeed()], workers=1)['bringstone'], UNCHANGED)
+        state = FeedState.objects.get()
+        self.assertEqual((state.etag, state.last_modified), ('"v2"', 'Wed, 03 Nov 2021 13:02:00 GMT'))
+
+    def test_conditional_request(self):
+        response = make_response(b'<yml_catalog/>')
+        response.headers.update({'ETag': '"v1"', 'Last-Modified': 'Tue, 02 Nov 2021 13:02:00 GMT'})
+        feed = BringstoneFeed()
+        with mock.patch('food.shops.requests.get', return_value=response) as get:
+            fetched = feed.fetch(self.directory)
+        self.assertEqual(get.call_args.kwargs['headers'], {})
+        self.assertEqual((fetched['etag'], fetched['last_modified']), ('"v1"', 'Tue, 02 Nov 2021 13:02:00 GMT'))
+
+        state = FeedState.objects.create(feed=feed.name, **{key: fetched[key] for key in fetched if key != 'path'})
+        response = make_response(b'')
+        response.status_code = 304
+        with mock.patch('food.shops.requests.get', return_value=response) as get:
+            fetched = feed.fetch(self.directory, state)
+        self.assertEqual(get.call_args.kwargs['headers'],
+                         {'If-None-Match': '"v1"', 'If-Modified-Since': 'Tue, 02 Nov 2021 13:02:00 GMT'})
+        self.assertIsNone(fetched['path'])
+
+
+class ImportReportTests(SimpleTestCase):
+    """Отчет об импорте каталога"""
+
+    def test_nested_stages_are_timed_exclusively(self):
+        report = ImportReport('Ecomarket')
+        clock = iter(range(0, 100, 10))
+        with mock.patch('food.report.time.perf_counter', lambda: next(clock)):
+            with report.stage('write'):             # 0
+                with report.stage('match'):         # 10
+                    pass                            # 20
+                items = list(report.iterate('parse', [1]))    # 30-40 элемент, 50-60 конец перебора
+            # 70
+        self.assertEqual(items, [1])
+        self.assertEqual(dict(report.seconds), {'write': 40, 'match': 10, 'parse': 20})
+
+    def test_report_is_picklable(self):
+        report = ImportReport('Ecomarket')
+        report.count('rows', 3)
+        with report.stage('parse'):
+            copy = pickle.loads(pickle.dumps(report))
+        self.assertEqual(copy.counters, {'rows': 3})
+        report.merge(copy)
+        self.assertEqual(report.as_dict()['counters'], {'rows': 6})
+        self.assertIn('rows 6', report.summary())
+
+
+class IngredientLoaderTests(TestCase):
+    """Загрузка справочника ингредиентов из CSV-файла"""
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.csv', delete=False)
+        with file:
+            file.write('Молоко\n  Молоко \nудалить\n\n"Масло  сливочное"\nРис\nГречка\n')
+        self.addCleanup(os.remove, file.name)
+        self.path = file.name
+
+    def test_read_ingredients(self):
+        self.assertEqual(list(read_ingredients(self.path)), ['Молоко', 'Масло сливочное', 'Рис', 'Гречка'])
+
+    def test_reload_is_idempotent(self):
+        Ingredient.objects.create(name='Рис')
+        out = io.StringIO()
+        call_command('ingredients', self.path, stdout=out)
+        self.assertIn('добавлено 3', out.getvalue())
+
+        with self.assertNumQueries(4):      # 2 пачки + подсчет до и после загрузки
+            self.assertEqual(load_ingredients(read_ingredients(self.path), batch_size=2), 0)
+        self.assertEqual(sorted(Ingredient.objects.values_list('name', flat=True)),
+                         ['Гречка', 'Масло сливочное', 'Молоко', 'Рис'])
+
+    def test_loaded_names_match_products(self):
+        # названия продуктов магазинов начинаются с заглавной буквы, поиск ингредиентов учитывает регистр
+        matcher = IngredientMatcher(read_ingredients(self.path))
+        self.assertEqual(matcher.match('Рис'), 'Рис')
+        self.assertEqual(matcher.match('Молоко'), 'Молоко')
+
+    def test_dedupe_ingredients(self):
+        rice, *duplicates = [Ingredient.objects.create(name=name) for name in ('Рис', 'Рис ', ' Рис', 'Рис  круглый')]
+        product = Product.objects.create(name='Рис 1 кг', ingredient=duplicates[0], price=90)
+        user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        recipe = Recipe.objects.create(owner=user, title='Плов', level='EASY', cooking_time='1 ч', description='')
+        used = IngredientRecipe.objects.create(recipe=recipe, ingredient=duplicates[1], qty=1, unit='шт')
+
+        out = io.StringIO()
+        call_command('dedupe_ingredients', stdout=out)
+
+        self.assertIn('удалено 2', out.getvalue())
+        self.assertEqual(sorted(Ingredient.objects.values_list('pk', 'name')),
+                         [(rice.pk, 'Рис'), (duplicates[2].pk, 'Рис круглый')])
+        self.assertEqual(Product.objects.get(pk=product.pk).ingredient_id, rice.pk)
+        self.assertEqual(IngredientRecipe.objects.get(pk=used.pk).ingredient_id, rice.pk)
+
+
+class DedupeProductsTests(TransactionTestCase):
+    """Удаление повторяющихся продуктов магазинов, записанных до уникального индекса (shop, shop_id)"""
+
+    def setUp(self):
+        # повторы можно записать только без индекса, он добавляется обратно после теста, как при migrate
+        constraint, = Product._meta.constraints
+        # SQLite удаляет ограничение пересозданием таблицы по Meta модели
+        with connection.schema_editor() as editor, mock.patch.object(Product._meta, 'constraints', []):
+            editor.remove_constraint(Product, constraint)
+        self.addCleanup(self.restore_constraint, constraint)
+
+    def restore_constraint(self, constraint):
+        Product.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Product, constraint)
+        ensure_search_index(rebuild=True)
+
+    def test_dedupe_products(self):
+        ingredient = Ingredient.objects.create(name='рис')
+        keep, first, second = [
+            Product.objects.create(name='Рис 1 кг', ingredient=ingredient, price=90, shop='Ecomarket', shop_id=1)
+            for _ in range(3)
+        ]
+        other = Product.objects.create(name='Рис 1 кг', ingredient=ingredient, price=90, shop='Bringstone', shop_id=1)
+        manual = [Product.objects.create(name='Рис', ingredient=ingredient, price=90) for _ in range(2)]
+        other.analogs.add(first)
+        user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        recipe = Recipe.objects.create(owner=user, title='Плов', level='EASY', cooking_time='1 ч', description='')
+        steps = [CookStep.objects.create(recipe=recipe, title=f'Шаг {number}', description='') for number in range(2)]
+        steps[0].ingredients.add(keep, first, second)
+        steps[1].ingredients.add(second)
+
+        out = io.StringIO()
+        call_command('dedupe_products', stdout=out)
+
+        self.assertIn('удалены: 2', out.getvalue())
+        self.assertEqual(sorted(Product.objects.values_list('pk', flat=True)),
+                         sorted([keep.pk, other.pk] + [product.pk for product in manual]))
+        self.assertFalse(other.analogs.exists())
+        self.assertEqual([list(step.ingredients.all()) for step in steps], [[keep], [keep]])
+        out = io.StringIO()
+        call_command('dedupe_products', stdout=out)
+        self.assertIn('удалены: 0', out.getvalue())
+
+
+class ParallelParsingTests(SimpleTestCase):
+    """Разбор строк фида в нескольких процессах"""
+
+    def test_same_records_as_serial_parsing(self):
+        rows = list(csv.DictReader(synthetic_ecomarket_feed(300), delimiter=';', fieldnames=ecomarket.FIELDNAMES))
+        ingredients = ingredient_names(200)
+        known = {'Молоко': None}        # сохраненные результаты поиска используются и в процессах
+
+        serial_report = ImportReport()
+        matcher = CachedMatcher(IngredientMatcher(ingredients), known)
+        expected = list(ecomarket.parse_products(rows, matcher, serial_report))
+
+        report = ImportReport()
+        matches = {}
+        records = list(parse_parallel(ecomarket.parse_products, rows, ingredients, known, workers=2, chunk_size=40,
+                                      report=report, matches=matches))
+
+        self.assertEqual(records, expected)
+        self.assertEqual(matches, matcher.new)
+        for name in ('rows', 'accepted', 'unparsable_quantity', 'unmatched'):
+            self.assertEqual(report.counters[name], serial_report.counters[name])
+
+
+class ImportBenchmarkTests(TestCase):
+    """Замер импорта на синтетических фидах"""
+
+    def test_synthetic_ecomarket_feed(self):
+        rows = list(csv.DictReader(synthetic_ecomarket_feed(20), delimiter=';', fieldnames=ecomarket.FIELDNAMES))
+        self.assertEqual([row['id'] for row in rows], [str(number) for number in range(1, 21)])
+        self.assertTrue(all(row['name'] and row['category'] and float(row['price']) for row in rows))
+
+    def test_bench_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_import', shop='bringstone', offers=[20, 50], ingredients=100, output=output,
+                         stdout=io.StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+
+        self.assertEqual([run['offers'] for run in report['runs']], [20, 50])
+        self.assertTrue(all(run['products'] > 0 and run['queries'] > 0 for run in report['runs']))
+        self.assertFalse(Product.objects.exists())      # транзакция замера откатывается
+
+    def test_bench_import_with_catalog(self):
+        """Продукты замера не совпадают с загруженными продуктами магазина и создаются заново"""
+        ingredient = Ingredient.objects.create(name='рис')
+        for shop_id in range(1, 51):
+            Product.objects.create(name=f'Рис {shop_id}', ingredient=ingredient, price=90, shop='Bringstone',
+                                   shop_id=shop_id)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_import', shop='bringstone', offers=[50], ingredients=100, output=output,
+                         stdout=io.StringIO())
+            with open(output, encoding='utf-8') as file:
+                run, = json.load(file)['runs']
+
+        self.assertEqual(run['products'], run['counters']['accepted'])
+        self.assertEqual(Product.objects.filter(shop='Bringstone').count(), 50)
+
+    def test_bench_queries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'queries.json')
+            call_command('bench_queries', users=20, recipes=100, products=300, orders=100, plans=100, repeat=1,
+                         output=output, fail_on_scan=True, stdout=io.StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+
+        queries = {query['name']: query for query in report['queries']}
+        self.assertIn('product_by_shop_item', queries)
+        self.assertTrue(all(query['plan'] and not query['full_scan'] for query in queries.values()))
+        self.assertFalse(Product.objects.exists())
+
+    def test_bench_queries_with_catalog(self):
+        """Данные замера не пересекаются с загруженным каталогом и пользователями"""
+        ingredient = Ingredient.objects.create(name='рис')
+        for shop in ('Ecomarket', 'Bringstone'):
+            for shop_id in range(3):
+                Product.objects.create(name=f'Рис {shop_id}', ingredient=ingredient, price=90, shop=shop,
+                                       shop_id=shop_id)
+        user = get_user_model().objects.create_user(phone_number='+79000000000', password='pass')
+        Recipe.objects.create(owner=user, title='Рецепт 1', level='EASY', cooking_time='30 мин', description='')
+
+        call_command('bench_queries', users=20, recipes=10, products=30, orders=10, plans=10, repeat=1,
+                     stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 6)
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_full_scan_detected(self):
+        plan = Product.objects.filter(price=1).explain()       # по цене без ингредиента индекса нет
+        self.assertTrue(is_full_scan(plan, Product._meta.db_table))
+
+
+class AnalogTests(TestCase):
+    """Расчет аналогов продуктов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.milk = Ingredient.objects.create(name='молоко')
+        cls.cheese = Ingredient.objects.create(name='сыр')
+
+    def create_product(self, name, ingredient, qty, unit, price, **fields):
+        return Product.objects.create(name=name, ingredient=ingredient, qty_per_item=qty, unit=unit, price=price,
+                                      **fields)
+
+    def test_analogs_are_grouped_by_ingredient_and_base_unit(self):
+        products = [
+            # pk, ингредиент, единица, кол-во, цена, белки, жиры, углеводы, калории
+            (1, 1, 'кг', 1, 500, None, None, None, None),
+            (2, 1, 'г', 500, 260, None, None, None, None),
+            (3, 1, 'мл', 500, 250, None, None, None, None),
+            (4, 2, 'г', 500, 250, None, None, None, None),
+            (5, 1, 'г', 100, 100, None, None, None, None),
+            (6, 1, None, None, 100, None, None, None, None),
+        ]
+        self.assertEqual(get_analogs(products), {1: [2, 5], 2: [1, 5], 5: [2, 1]})
+
+    def test_analogs_are_ranked_by_unit_price_and_nutrition(self):
+        products = [
+            (1, 1, 'г', 100, 100, 3, 3.2, 4.7, 60),
+            (2, 1, 'г', 100, 110, 3, 1.5, 4.7, 45),
+            (3, 1, 'г', 100, 110, 3, 3.2, 4.7, 60),
+            (4, 1, 'г', 100, 400, 3, 3.2, 4.7, 60),
+        ]
+        self.assertEqual(get_analogs(products, top=2), {1: [3, 2], 2: [3, 1], 3: [2, 1], 4: [3, 2]})
+        # сравниваются только соседние по цене за единицу продукты
+        self.assertEqual(get_analogs(products, top=2, window=1)[1], [2])
+
+    def test_build_analogs(self):
+        cheap = self.create_product('Молоко 1 л', self.milk, 1, 'л', 80)
+        middle = self.create_product('Молоко 500 мл', self.milk, 500, 'мл', 50)
+        expensive = self.create_product('Молоко 200 мл', self.milk, 200, 'мл', 40)
+        self.create_product('Молоко 1 л', self.milk, 1, 'л', 70, available=False)
+        self.create_product('Сыр 200 г', self.cheese, 200, 'г', 300)
+
+        for _ in range(2):      # повторный расчет заменяет связи
+            self.assertEqual(build_analogs(), (3, 6))
+            self.assertEqual(get_product_analogs(cheap), [middle, expensive])
+            self.assertEqual(get_product_analogs(expensive), [middle, cheap])
+
+    def test_analogs_action(self):
+        cheap = self.create_product('Молоко 1 л', self.milk, 1, 'л', 80)
+        middle = self.create_product('Молоко 500 мл', self.milk, 500, 'мл', 50)
+        build_analogs()
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(phone_number='+79990000000', password='pass'))
+        response = client.get(f'/api/v1/products/{cheap.pk}/analogs')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.json()], [middle.pk])
+
+
+class UnitPriceTests(TestCase):
+    """Цена продукта за кг, л или шт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cheese = Ingredient.objects.create(name='сыр')
+        cls.milk = Ingredient.objects.create(name='молоко')
+
+    def test_save_updates_unit_price(self):
+        product = Product.objects.create(name='Сыр 200 г', ingredient=self.cheese, qty_per_item=200, unit='г', price=90)
+        self.assertEqual((product.base_qty, product.unit_price), (0.2, Decimal('450.00')))
+        product.price = 100
+        product.save(update_fields=['price'])
+        product.refresh_from_db()
+        self.assertEqual(product.unit_price, Decimal('500.00'))
+
+    def test_backfill_unit_prices(self):
+        """Продукты, сохраненные до появления цены за единицу, заполняются командой unit_prices"""
+        for qty in (200, 500, 1000):
+            Product.objects.create(name=f'Сыр {qty} г', ingredient=self.cheese, qty_per_item=qty, unit='г', price=90)
+        Product.objects.create(name='Сыр', ingredient=self.cheese, price=10)
+        Product.objects.update(base_qty=None, unit_price=None)
+        self.assertIsNone(Product.objects.cheapest(self.cheese).first())
+
+        self.assertEqual(update_unit_prices(batch_size=2), 3)
+        self.assertEqual(Product.objects.cheapest(self.cheese).first().name, 'Сыр 1000 г')
+        self.assertEqual(update_unit_prices(), 0)
+        call_command('unit_prices', all=True, stdout=io.StringIO())
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('unit_price', flat=True)),
+                         [Decimal('450.00'), Decimal('180.00'), Decimal('90.00'), None])
+
+    def test_cheapest(self):
+        Product.objects.create(name='Сыр 200 г', ingredient=self.cheese, qty_per_item=200, unit='г', price=90)
+        cheapest = Product.objects.create(name='Сыр 1 кг', ingredient=self.cheese, qty_per_item=1, unit='кг',
+                                          price=400)
+        Product.objects.create(name='Сыр 1 кг', ingredient=self.cheese, qty_per_item=1, unit='кг', price=300,
+                               available=False)
+        Product.objects.create(name='Сыр', ingredient=self.cheese, price=10)
+        Product.objects.create(name='Молоко 1 л', ingredient=self.milk, qty_per_item=1, unit='л', price=80)
+        self.assertEqual(Product.objects.cheapest(self.cheese).first(), cheapest)
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                sql, params = Product.objects.cheapest(self.cheese)[:1].query.sql_with_params()
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('product_ingredient_price_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)       # без сортировки продуктов ингредиента
+
+
+class RecipeListTests(TestCase):
+    """Кол-во запросов к БД при выводе рецептов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        subtype = Subtype.objects.create(filter=Filter.objects.create(title='Диета'), title='Веган')
+        cls.tags = [Tag.objects.create(subtype=subtype, name=name) for name in ('без мяса', 'без молока', 'острое')]
+        cls.user.tags.set(cls.tags[:2])
+        cls.category = Category.objects.create(name='Супы', slug='soups')
+        cls.kitchen = Kitchen.objects.create(name='Азиатская', slug='asian')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        for number in range(count):
+            owner = get_user_model().objects.create_user(phone_number=f'+7999{count:03}{number:04}', password='pass')
+            recipe = Recipe.objects.create(owner=owner, category=self.category, kitchen=self.kitchen,
+                                           title=f'Рецепт {number}', level='EASY', cooking_time='30 мин',
+                                           description='', is_active=True)
+            recipe.tags.set(self.tags)
+
+    def assert_constant_queries(self, url, queries):
+        for count in (1, 5):
+            self.create_recipes(count)
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results = response.json()['results']
+            self.assertEqual(len(results), Recipe.objects.count())
+            self.assertEqual(results[0]['tags'], ['без мяса', 'без молока', 'острое'])
+            Recipe.objects.all().delete()
+
+    def test_recipe_list(self):
+        self.assert_constant_queries('/api/v1/recipes', 2)
+
+
+    def test_recipe_list_pages(self):
+        self.create_recipes(5)
+        titles = []
+        url = '/api/v1/recipes?page_size=2'
+        while url:
+            response = self.client.get(url).json()
+            self.assertLessEqual(len(response['results']), 2)
+            titles += [recipe['title'] for recipe in response['results']]
+            url = response['next']
+        self.assertEqual(titles, [f'Рецепт {number}' for number in range(5)])
+
+        with mock.patch.object(CursorPagination, 'max_page_size', 3):
+            response = self.client.get('/api/v1/recipes?page_size=1000').json()
+        self.assertEqual(len(response['results']), 3)
+
+    def test_recipe_pages_with_empty_date(self):
+        self.create_recipes(3)
+        Recipe.objects.filter(title='Рецепт 1').update(date_created=None)
+        titles = []
+        url = '/api/v1/recipes?page_size=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [recipe['title'] for recipe in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(titles, ['Рецепт 0', 'Рецепт 1', 'Рецепт 2'])
+
+    def test_recipe_detail(self):
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        ingredients = [Ingredient.objects.create(name=f'ингредиент {number}') for number in range(20)]
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, qty=1, unit='шт') for ingredient in ingredients
+        ])
+        product = Product.objects.create(name='Молоко 1 л', ingredient=ingredients[0], price=80)
+        for number in range(3):
+            CookStep.objects.create(recipe=recipe, title=f'Шаг {number}', description='').ingredients.add(product)
+
+        for count in (1, 500):
+            Comment.objects.all().delete()
+            Comment.objects.bulk_create([Comment(recipe=recipe, author=self.user, text='Вкусно') for _ in range(count)])
+            with self.assertNumQueries(6):
+                response = self.client.get(f'/api/v1/recipes/{recipe.pk}')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(len(data['comments']), count)
+            self.assertEqual(data['comments'][0]['author'], self.user.phone_number)
+            self.assertEqual(data['ingredients'][0]['ingredient'], 'ингредиент 0')
+            self.assertEqual(data['steps'][0]['ingredients'], [product.pk])
+
+    def test_sparse_fields(self):
+        self.create_recipes(5)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/recipes?fields=id,title,kkal,owner')
+        self.assertEqual(response.status_code, 200)
+        recipe = response.json()['results'][0]
+        self.assertEqual(set(recipe), {'id', 'title', 'kkal', 'owner'})
+        self.assertEqual(recipe['owner'], Recipe.objects.get(pk=recipe['id']).owner_id)
+        # автор без expand не загружается, описание не читается из БД
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('description', context.captured_queries[0]['sql'])
+
+        response = self.client.get('/api/v1/recipes?fields=title,owner,tags&expand=owner&page_size=2')
+        recipe = response.json()['results'][0]
+        self.assertEqual(set(recipe), {'title', 'owner', 'tags'})
+        self.assertEqual(recipe['owner']['phone_number'], '+79990050000')
+        self.assertEqual(recipe['tags'], ['без мяса', 'без молока', 'острое'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([recipe['title'] for recipe in response.json()['results']], ['Рецепт 2', 'Рецепт 3'])
+
+        recipe = self.client.get('/api/v1/recipes').json()['results'][0]
+        self.assertEqual(set(recipe), set(RecipeListSerializer().fields))
+        self.assertEqual(self.client.get('/api/v1/recipes?fields=title,secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/recipes?fields=title&expand=title').status_code, 400)
+
+    def test_sparse_fields_of_users(self):
+        self.create_recipes(2)
+        response = self.client.get('/api/v1/users?fields=id,phone_number,recipes')
+        self.assertEqual(response.status_code, 200)
+        users = {user['phone_number']: user for user in response.json()['results']}
+        self.assertEqual(set(users[self.user.phone_number]), {'id', 'phone_number', 'recipes'})
+        self.assertEqual(users['+79990020000']['recipes'], [Recipe.objects.get(title='Рецепт 0').pk])
+
+        response = self.client.get('/api/v1/users?fields=phone_number,recipes&expand=recipes')
+        users = {user['phone_number']: user for user in response.json()['results']}
+        self.assertEqual(users['+79990020000']['recipes'][0]['title'], 'Рецепт 0')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecommendationTests(TestCase):
+    """Рекомендации рецептов по тегам пользователя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        subtype = Subtype.objects.create(filter=Filter.objects.create(title='Диета'), title='Веган')
+        cls.tags = [Tag.objects.create(subtype=subtype, name=name) for name in ('без мяса', 'без молока', 'острое')]
+
+    def setUp(self):
+        cache.clear()
+        self.user.tags.set(self.tags[:2])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title, tags, is_active=True):
+        recipe = Recipe.objects.create(owner=self.user, title=title, level='EASY', cooking_time='30 мин',
+                                       description='', is_active=is_active)
+        recipe.tags.set(tags)
+        return recipe
+
+    def get_titles(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/v1/recipes-recommend')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['title'] for recipe in response.json()['results']]
+
+    def test_recipes_are_ranked_by_matching_tags(self):
+        self.create_recipe('Один тег', self.tags[:1])
+        self.create_recipe('Два тега', self.tags)
+        self.create_recipe('Новый, один тег', self.tags[1:])
+        self.create_recipe('Не прошел модерацию', self.tags, is_active=False)
+        self.create_recipe('Без тегов юзера', self.tags[2:])
+        # ранжирование - 1 запрос, страница рецептов и их теги - 2 запроса
+        self.assertEqual(self.get_titles(3), ['Два тега', 'Новый, один тег', 'Один тег'])
+        self.assertEqual(self.get_titles(2), ['Два тега', 'Новый, один тег', 'Один тег'])     # из кэша
+
+        # без тегов в ?fields= загружается только страница рецептов
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/recipes-recommend?fields=id,title')
+        self.assertEqual(response.json()['results'][0], {'id': Recipe.objects.get(title='Два тега').pk,
+                                                         'title': 'Два тега'})
+
+    def test_cache_is_invalidated(self):
+        recipe = self.create_recipe('Острое', self.tags[2:])
+        self.assertEqual(self.get_titles(1), [])
+
+        # кэш сбрасывается после фиксации транзакции, до нее рекомендации не меняются
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.tags.add(self.tags[2])
+            self.assertEqual(self.get_titles(0), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get_titles(3), ['Острое'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.set(self.tags[:1])
+        self.assertEqual(self.get_titles(3), ['Острое'])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.clear()
+        self.assertEqual(self.get_titles(1), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.set(self.tags)
+            recipe.is_active = False
+            recipe.save()
+        self.assertEqual(self.get_titles(1), [])
+
+
+class SharedCacheTests(TestCase):
+    """Кэш общий для процессов: сброс в одном процессе виден остальным"""
+
+    def test_invalidation_is_shared(self):
+        self.assertNotIsInstance(cache, LocMemCache)        # кэш в памяти процесса не виден другим процессам
+        other = caches.create_connection('default')     # подключение к кэшу другого процесса
+        version = recommendations.get_version()
+        self.assertEqual(other.get(recommendations.VERSION_KEY), version)
+        recommendations.invalidate_all()
+        self.assertNotEqual(other.get(recommendations.VERSION_KEY), version)
+
+    def test_taxonomy_not_modified_without_queries(self):
+        """Процесс отвечает 304 по своей копии версии и ответа, не читая общий кэш в БД"""
+        taxonomy.local.clear()
+        etag = self.client.get('/api/v1/tags')['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/tags', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # другой процесс увидит смену версии после LOCAL_MAX_AGE
+        other = taxonomy.LocalCopy(max_age=0)
+        version = other.get_version()
+        taxonomy.invalidate()
+        self.assertNotEqual(other.get_version(), version)
+
+
+class TagIndexTests(TestCase):
+    """Фильтрация рецептов по индексу тегов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        diet = Filter.objects.create(title='Диета')
+        cls.vegan = Subtype.objects.create(filter=diet, title='Веган')
+        cls.spicy = Subtype.objects.create(filter=diet, title='Острота')
+        cls.no_meat = Tag.objects.create(subtype=cls.vegan, name='без мяса')
+        cls.no_milk = Tag.objects.create(subtype=cls.vegan, name='без молока')
+        cls.hot = Tag.objects.create(subtype=cls.spicy, name='острое')
+
+    def setUp(self):
+        tag_index.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title, tags, is_active=True):
+        recipe = Recipe.objects.create(owner=self.user, title=title, level='EASY', cooking_time='30 мин',
+                                       description='', is_active=is_active)
+        recipe.tags.set(tags)
+        return recipe
+
+    def get_titles(self, query):
+        response = self.client.get(f'/api/v1/recipes?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['title'] for recipe in response.json()['results']]
+
+    def test_iter_bits(self):
+        self.assertEqual(list(iter_bits(0)), [])
+        self.assertEqual(list(iter_bits(0b1010001)), [0, 4, 6])
+        self.assertEqual(list(iter_bits(1 << 1000 | 2)), [1, 1000])
+
+    def test_filter(self):
+        self.create_recipe('Веган', [self.no_meat, self.no_milk])
+        self.create_recipe('Без мяса, острое', [self.no_meat, self.hot])
+        self.create_recipe('Острое', [self.hot])
+        self.create_recipe('Не прошел модерацию', [self.no_meat, self.no_milk], is_active=False)
+
+        # как и список без фильтра, фильтр включает рецепты, не прошедшие модерацию
+        self.assertEqual(self.get_titles(f'tags={self.no_meat.pk}'),
+                         ['Веган', 'Без мяса, острое', 'Не прошел модерацию'])
+        self.assertEqual(self.get_titles(f'tags={self.no_meat.pk},{self.hot.pk}'), ['Без мяса, острое'])
+        self.assertEqual(self.get_titles(f'any_tags={self.no_milk.pk},{self.hot.pk}'),
+                         ['Веган', 'Без мяса, острое', 'Острое', 'Не прошел модерацию'])
+        self.assertEqual(self.get_titles(f'subtypes={self.vegan.pk},{self.spicy.pk}'), ['Без мяса, острое'])
+        self.assertEqual(self.get_titles(f'tags={self.no_milk.pk}&subtypes={self.spicy.pk}'), [])
+        self.assertEqual(self.client.get('/api/v1/recipes?tags=1,a').status_code, 400)
+
+    def test_filtered_list_has_same_pagination(self):
+        """С фильтром и без него ответ одного вида: курсорная пагинация по id в обе стороны"""
+        for number in range(5):
+            self.create_recipe(f'Рецепт {number}', [self.hot], is_active=number != 2)
+        self.create_recipe('Без тегов', [])
+
+        def get_pages(url):
+            pages = []
+            while url:
+                data = self.client.get(url).json()
+                self.assertEqual(set(data), {'next', 'previous', 'results'})
+                pages.append([recipe['title'] for recipe in data['results']])
+                url, previous = data['next'], data['previous']
+            back = []
+            while previous:
+                data = self.client.get(previous).json()
+                back.insert(0, [recipe['title'] for recipe in data['results']])
+                previous = data['previous']
+            self.assertEqual(back, pages[:-1])
+            return pages
+
+        self.assertEqual(get_pages(f'/api/v1/recipes?tags={self.hot.pk}&page_size=2'),
+                         [['Рецепт 0', 'Рецепт 1'], ['Рецепт 2', 'Рецепт 3'], ['Рецепт 4']])
+        self.assertEqual(get_pages('/api/v1/recipes?page_size=2'),
+                         [['Рецепт 0', 'Рецепт 1'], ['Рецепт 2', 'Рецепт 3'], ['Рецепт 4', 'Без тегов']])
+
+    def test_index_is_updated_by_signals(self):
+        recipe = self.create_recipe('Острое', [self.hot])
+        self.assertEqual(tag_index.select([self.hot.pk]), [recipe.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(self.no_meat)
+            self.hot.recipe_set.remove(recipe)
+        with self.assertNumQueries(0):      # индекс не перестраивается
+            self.assertEqual(tag_index.select([self.hot.pk]), [])
+            self.assertEqual(tag_index.select([self.no_meat.pk]), [recipe.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.is_active = False
+            recipe.save()
+        self.assertEqual(tag_index.select([self.no_meat.pk]), [recipe.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(subtype=self.spicy, name='очень острое')
+            recipe.tags.add(tag)
+        self.assertEqual(tag_index.select(any_tags=[tag_index.get_subtype_tags(self.spicy.pk)]), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+            recipe.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(tag_index.select([self.no_meat.pk]), [])
+            self.assertEqual(tag_index.get_subtype_tags(self.spicy.pk), {self.hot.pk})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TaxonomyCacheTests(TestCase):
+    """Справочники из кэша с ETag"""
+
+    @classmethod
+    def setUpTestData(cls):
+        diet = Filter.objects.create(title='Диета')
+        for title in ('Веган', 'Острота'):
+            Tag.objects.create(subtype=Subtype.objects.create(filter=diet, title=title), name=title.lower())
+        Category.objects.create(name='Супы', slug='soups')
+        Kitchen.objects.create(name='Азиатская', slug='asian')
+
+    def setUp(self):
+        cache.clear()
+        taxonomy.local.clear()
+
+    def test_filters(self):
+        with self.assertNumQueries(3):      # фильтры, подтипы и теги - по одному запросу
+            response = self.client.get('/api/v1/filters')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([subtype['title'] for subtype in response.json()[0]['subtypes']], ['Веган', 'Острота'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/filters').content, response.content)
+            response = self.client.get('/api/v1/filters', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(subtype=Subtype.objects.get(title='Веган'), name='без молока')
+        response = self.client.get('/api/v1/filters', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([tag['name'] for tag in response.json()[0]['subtypes'][0]['tags']], ['веган', 'без молока'])
+
+    def test_tags_and_extra_data(self):
+        for url in ('/api/v1/tags', '/api/v1/extra-data'):
+            data = self.client.get(url).json()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).json(), data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Kitchen.objects.get(slug='asian').delete()
+        self.assertEqual(self.client.get('/api/v1/extra-data').json()['Kitchen'], [])
+        self.assertEqual(self.client.get('/api/v1/tags').json(), [{'name': 'веган'}, {'name': 'острота'}])
+
+    def test_version_expires(self):
+        etag = self.client.get('/api/v1/tags')['ETag']
+        self.client.get('/api/v1/extra-data')
+        # изменение без сигналов видно после истечения версии, ETag неизмененного ответа прежний
+        Tag.objects.filter(name='острота').update(name='острое')
+        Kitchen.objects.filter(slug='asian').update(name='Азия')
+        self.assertEqual(self.client.get('/api/v1/extra-data').json()['Kitchen'][0]['name'], 'Азиатская')
+
+        cache.delete(taxonomy.VERSION_KEY)      # истечение MAX_AGE
+        taxonomy.local.clear()                  # и LOCAL_MAX_AGE
+        self.assertEqual(self.client.get('/api/v1/extra-data').json()['Kitchen'][0]['name'], 'Азия')
+        response = self.client.get('/api/v1/tags', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'name': 'веган'}, {'name': 'острое'}])
+
+        Tag.objects.filter(name='острое').update(name='острота')
+        cache.delete(taxonomy.VERSION_KEY)
+        taxonomy.local.clear()
+        self.assertEqual(self.client.get('/api/v1/tags', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'healthgate.club'])
+    def test_absolute_urls_depend_on_host(self):
+        Subtype.objects.filter(title='Веган').update(icon='tags/a.png')
+        self.client.get('/api/v1/filters')
+        response = self.client.get('/api/v1/filters', HTTP_HOST='healthgate.club', secure=True)
+        self.assertEqual(response.json()[0]['subtypes'][0]['icon'], 'https://healthgate.club/media/tags/a.png')
+        response = self.client.get('/api/v1/filters')
+        self.assertEqual(response.json()[0]['subtypes'][0]['icon'], 'http://testserver/media/tags/a.png')
+
+
+class ProductSearchTests(TestCase):
+    """Полнотекстовый поиск продуктов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(phone_number='+79990000000', password='pass')
+        cls.milk = Ingredient.objects.create(name='молоко')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, term):
+        response = self.client.get('/api/v1/products', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_fts_query(self):
+        self.assertEqual(get_fts_query('Молоко 3,2%'), '"Молоко"* "3"* "2"*')
+        self.assertEqual(get_fts_query('" OR *'), '"OR"*')
+        self.assertEqual(get_fts_query('%'), '')
+
+    def test_search(self):
+        sync = ProductSync('Ecomarket')
+        sync.add([
+            Product(ingredient=self.milk, shop_id=1, name='Шоколад молочный', price=100),
+            Product(ingredient=self.milk, shop_id=2, name='Молоко 3,2% 1 л', price=80),
+            Product(ingredient=self.milk, shop_id=3, name='Молоко Молоко 2,5% 1 л', price=70),
+            Product(ingredient=self.milk, shop_id=4, name='Кефир 1%', price=60),
+        ])
+        self.assertEqual(self.search('молоко'), ['Молоко Молоко 2,5% 1 л', 'Молоко 3,2% 1 л'])
+        self.assertCountEqual(self.search('МОЛ'), ['Молоко Молоко 2,5% 1 л', 'Молоко 3,2% 1 л', 'Шоколад молочный'])
+        self.assertEqual(self.search('молоко 3'), ['Молоко 3,2% 1 л'])
+        self.assertEqual(self.search('%'), [])
+
+        # импорт обновляет индекс поиска
+        sync = ProductSync('Ecomarket')
+        sync.add([Product(ingredient=self.milk, shop_id=2, name='Кефир 3,2% 1 л', price=80)])
+        Product.objects.filter(shop_id=3).delete()
+        self.assertEqual(self.search('молоко'), [])
+        self.assertEqual(self.search('кефир'), ['Кефир 1%', 'Кефир 3,2% 1 л'])
+
+    def test_search_index_rebuild(self):
+        Product.objects.create(ingredient=self.milk, name='Молоко 1 л', price=80)
+        call_command('search_index', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(list(search_products(Product.objects.all(), 'молоко').values_list('name', flat=True)),
+                         ['Молоко 1 л'])
@@ -6,10 +6,19 @@ from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from .models import Ingredient, Recipe, Comment, IngredientRecipe, Product, CookStep, Tag, Filter, Category, Kitchen
-from rest_framework import viewsets, generics, status, filters
+from rest_framework import viewsets, generics, status
+from rest_framework.exceptions import ValidationError
+from api.mixins import SparseFieldsViewMixin
 from api.permissions import AuthorComment, RecipeOwner, IsOwnerRecipeIngredients, IsSuperUser
+from api.pagination import CursorPagination, IngredientCursorPagination, IdListPagination
 from drf_multiple_model.views import ObjectMultipleModelAPIView
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
+from .analogs import get_product_analogs
+from .recommendations import get_recommended_ids
+from .search import ProductSearchFilter
+from .taxonomy import get_cached_response
+from .tag_index import tag_index
 
 from .serializers import (
     RecipeListSerializer,
@@ -30,25 +39,61 @@ from .serializers import (
 User = get_user_model()
 
 
-class RecommendRecipesListView(generics.ListAPIView):
+def get_ids(query_params, name):
+    """Список id из параметра запроса вида ?name=1,2,3"""
+    value = query_params.get(name, '')
+    try:
+        return [int(pk) for pk in value.split(',') if pk]
+    except ValueError:
+        raise ValidationError({name: 'Ожидается список id через запятую'})
+
+
+class RecommendRecipesListView(SparseFieldsViewMixin, generics.ListAPIView):
     """
     Вывод списка рекомендованных рецептов в соответствии с тегами Юзера
+    Рецепты ранжируются по кол-ву совпавших тегов (см. food/recommendations.py)
+    Выводимые поля задаются параметрами ?fields= и ?expand= (api/mixins.py)
     Доступен для авторизованных юзеров
     """
+    queryset = Recipe.objects.all()
     serializer_class = RecipeListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdListPagination
 
-    def get_queryset(self):
-        user = self.request.user
-        return Recipe.objects.filter(tags__name__in=list(user.tags.all())).order_by("date_created")
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(get_recommended_ids(request.user))
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer([recipes[pk] for pk in page if pk in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     Дейсвтия над рецептами
     get, post, put, patch, delete
+    Связанные объекты загружаются методом setup_eager_loading сериализатора действия (SparseFieldsViewMixin),
+    в списке выводимые поля задаются параметрами ?fields= и ?expand=
     """
     queryset = Recipe.objects.all()
+    pagination_class = CursorPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов. Фильтр рецептов по тегам выполняется по индексу тегов (food/tag_index.py):
+        ?tags=1,2 - есть все теги, ?any_tags=3,4 - есть хотя бы один тег, ?subtypes=5,6 - есть тег каждого подтипа
+        С фильтром и без него в списке те же рецепты и та же курсорная пагинация по id
+        """
+        all_tags = get_ids(request.query_params, 'tags')
+        any_tags = [tag_index.get_subtype_tags(subtype) for subtype in get_ids(request.query_params, 'subtypes')]
+        if get_ids(request.query_params, 'any_tags'):
+            any_tags.append(get_ids(request.query_params, 'any_tags'))
+        if not all_tags and not any_tags:
+            return super().list(request, *args, **kwargs)
+
+        page = self.paginator.paginate_ids(tag_index.select(all_tags, any_tags), request, view=self)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer([recipes[pk] for pk in page if pk in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
 
     def get_permissions(self):
         """
@@ -168,6 +213,7 @@ class CommentView(viewsets.ModelViewSet):
     """
     queryset = Comment.objects.order_by('recipe')
     serializer_class = CommentSerializer
+    pagination_class = CursorPagination
 
     def get_permissions(self):
         if self.action == 'list':
@@ -198,7 +244,7 @@ class ProductView(viewsets.ModelViewSet):
     """
     queryset = Product.objects.order_by('shop')
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [ProductSearchFilter]     # ранжированный полнотекстовый поиск ?search=
     search_fields = ['name']
     pagination_class = ProductPagePagination
 
@@ -214,8 +260,28 @@ class ProductView(viewsets.ModelViewSet):
             permission_classes = [IsSuperUser]
         return [permission() for permission in permission_classes]
 
+    @action(detail=True)
+    def analogs(self, request, pk=None):
+        """
+        Аналоги продукта в порядке близости по цене за единицу и пищевой ценности (см. food/analogs.py)
+        """
+        serializer = self.get_serializer(get_product_analogs(self.get_object()), many=True)
+        return Response(serializer.data)
+
+
+class TaxonomyCacheMixin:
+    """
+    Список справочника отдается из кэша с ETag (см. food/taxonomy.py)
+    """
+    taxonomy_name = None
+
+    def list(self, request, *args, **kwargs):
+        return get_cached_response(request, self.taxonomy_name, lambda: super(TaxonomyCacheMixin, self).list(
+            request, *args, **kwargs
+        ).data)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(TaxonomyCacheMixin, viewsets.ModelViewSet):
     """
     Просмотр, создание и редактирование Тегов.
     Доступы: редактировать может только Суперпользователь,
@@ -223,6 +289,7 @@ class TagViewSet(viewsets.ModelViewSet):
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    taxonomy_name = 'tags'
 
     def get_permissions(self):
         """
@@ -237,19 +304,21 @@ class TagViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class FilterView(generics.ListAPIView):
+class FilterView(TaxonomyCacheMixin, generics.ListAPIView):
     """
     Просмотр вложенных тегов, подтипов тегов и их фильтров.
     Доступы: просмотр доступен всем.
     """
     serializer_class = FilterSerializer
     permission_classes = [AllowAny]
+    taxonomy_name = 'filters'
 
     def get_queryset(self):
-        return Filter.objects.all()
+        return Filter.objects.prefetch_related('subtypes__tags')
 
 
-class CategoryAndKitchenView(ObjectMultipleModelAPIView):
+class CategoryAndKitchenView(TaxonomyCacheMixin, ObjectMultipleModelAPIView):
+    taxonomy_name = 'categories'
     querylist = [
         {'queryset': Category.objects.all(), 'serializer_class': RecipeCategorySerializer},
         {'queryset': Kitchen.objects.all(), 'serializer_class': KitchenSerializer},
@@ -263,4 +332,5 @@ class IngredientListView(generics.ListAPIView):
     """
     serializer_class = IngredientsListSerializer
     permission_classes = [IsAuthenticated]
-    queryset = Ingredient.objects.all()
\ No newline at end of file
+    queryset = Ingredient.objects.all()
+    pagination_class = IngredientCursorPagination
\ No newline at end of file
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',      # поиск продуктов (food/search.py)
 ]
 
 MIDDLEWARE = [
@@ -91,6 +92,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Кэш общий для всех процессов gunicorn (-w 4): сброс кэша рекомендаций и справочников обработчиком сигнала
+# в одном процессе должен быть виден остальным, поэтому кэш в памяти процесса (LocMemCache) не подходит.
+# По умолчанию - таблица в БД (создается командой createcachetable), можно заменить на memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        'LOCATION': os.environ.get("CACHE_LOCATION", "cache_table"),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,      # рекомендации хранятся для каждого пользователя
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -31,6 +31,7 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         db_table = 'order'
+        indexes = [models.Index(fields=['customer', 'updated_at'], name='order_customer_updated_idx')]
 
     def __str__(self):
         return self.customer.phone_number
@@ -89,6 +90,7 @@ class MealPlanRecipe(models.Model):
         verbose_name = 'Рецепт плана питания'
         verbose_name_plural = 'Рецепты плана питания'
         db_table = 'meal_plan_recipes'
+        indexes = [models.Index(fields=['owner', 'date'], name='meal_plan_owner_date_idx')]
 
     def __str__(self):
         return self.recipe.title
@@ -10,6 +10,7 @@ from .serializers import (OrderListSerializer,
                           # OrderProductSerializer,
                           MealPlanRecipeSerializer)
 
+from api.pagination import CursorPagination
 from api.permissions import CustomerOrderOrReadOnly
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
@@ -25,6 +26,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     Доступ: создание заказа для любого аутентифицированного юзера
             действия над заказами доступны для владельцев заказа или суперпользователю
     """
+    pagination_class = CursorPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -123,6 +125,7 @@ class MealPlanRecipeView(viewsets.ModelViewSet):
     """
     queryset = MealPlanRecipe.objects.all().order_by('owner')
     serializer_class = MealPlanRecipeSerializer
+    pagination_class = CursorPagination
 
     def get_queryset(self):
         if self.request.user.is_superuser:
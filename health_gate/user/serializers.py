@@ -1,10 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group
+from django.db.models import Prefetch
 from rest_framework import serializers
+from api.mixins import SparseFieldsSerializerMixin
 from food.serializers import RecipeListSerializer
 
-from food.models import Tag
+from food.models import Recipe, Tag
 
 User = get_user_model()
 
@@ -17,10 +19,11 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ['name']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """
     При регистрации пользователя запрашивается доп поле с указанием группы: 'bloger' или 'customer'
     Так же в параметрах можно указать имеющиеся в БД теги.
+    При выводе поддерживает ?fields= и ?expand=recipes (api/mixins.py)
     """
 
     recipes = RecipeListSerializer(many=True, required=False)
@@ -41,6 +44,22 @@ class UserSerializer(serializers.ModelSerializer):
             validated_data['is_active'] = False
         return super(UserSerializer, self).create(validated_data)
 
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=()):
+        """
+        Загрузка групп, прав, тегов и рецептов пользователей - по одному запросу на связь для всей страницы
+        :param fields: выводимые поля, None - все; загружаются только выводимые связи
+        :param expand: раскрываемые связи, рецепты без expand выводятся как id
+        """
+        if fields is None or 'recipes' in expand:
+            recipes = RecipeListSerializer.setup_eager_loading(Recipe.objects.all())
+        else:
+            recipes = Recipe.objects.only('id', 'owner')
+        related = ['groups', 'user_permissions', 'tags', Prefetch('recipes', queryset=recipes)]
+        if fields is not None:
+            related = [name for name in related if getattr(name, 'prefetch_to', name) in fields]
+        return queryset.prefetch_related(*related)
+
     class Meta:
         model = User
         fields = '__all__'
@@ -6,6 +6,8 @@ from django.contrib.auth import get_user_model
 from rest_framework import viewsets, decorators, response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .serializers import UserSerializer
+from api.mixins import SparseFieldsViewMixin
+from api.pagination import CursorPagination
 from api.permissions import IsAccountOwner
 
 
@@ -58,10 +60,11 @@ class CurrentUserView(viewsets.ModelViewSet):
         return response.Response({"message": "success"})
 
 
-class UserView(viewsets.ModelViewSet):
+class UserView(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     Просмотр, создание, редактирование, удаление аккаунтов.
     get, post, put, patch, delete
+    Выводимые поля задаются параметрами ?fields= и ?expand= (api/mixins.py)
 
     Доступы: Создать аккаунт могут любые пользовтели
             Получить информацию об аккаунтах могу любые авторизованные юзеры
@@ -69,6 +72,7 @@ class UserView(viewsets.ModelViewSet):
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = CursorPagination
 
     def get_permissions(self):
         """